@@ -32,9 +32,13 @@ QFileDialog = QtWidgets.QFileDialog
 QFrame = QtWidgets.QFrame
 QProgressBar = QtWidgets.QProgressBar
 QLabel = QtWidgets.QLabel
+QPushButton = QtWidgets.QPushButton
+QCheckBox = QtWidgets.QCheckBox
+QGridLayout = QtWidgets.QGridLayout
 QPen = QtGui.QPen
 QFont = QtGui.QFont
 QColor = QtGui.QColor
+QPalette = QtGui.QPalette
 QRect = QtCore.QRect
 QPoint = QtCore.QPoint
 QSize = QtCore.QSize
@@ -141,39 +145,12 @@ except Exception:
     QT_VERSION_STR = "6"
 
 # Old-style SIGNAL/SLOT compatibility
-class _SignalProxy(object):
-    def __init__(self, obj):
-        self._obj = obj
-
-    def __call__(self, signature):
-        # Return a wrapper that emits via dynamic signal map
-        # We create/lookup a QtCore.Signal dynamically on the instance
-        name = signature.split('(')[0]
-        # Maintain a map on the object
-        if not hasattr(self._obj, "__legacy_signals__"):
-            self._obj.__legacy_signals__ = {}
-        signals = self._obj.__legacy_signals__
-        if name not in signals:
-            # Create a Python signal using QObject's meta-object is non-trivial at runtime.
-            # Instead, we emulate emit/connect using a list of python callables.
-            signals[name] = []
-        
-        class _Emitter(object):
-            def __init__(self, obj, name):
-                self._obj = obj
-                self._name = name
-
-            def connect(self, slot):
-                self._obj.__legacy_signals__[self._name].append(slot)
-
-            def emit(self, *args, **kwargs):
-                for cb in list(self._obj.__legacy_signals__.get(self._name, [])):
-                    cb(*args, **kwargs)
-
-        return _Emitter(self._obj, name)
-
-
+# PySide6 handles string signals natively: QObject.connect(sender, SIGNAL(...), slot[, type])
+# registers a dynamic signal, QObject.emit(SIGNAL(...), *args) calls the connected slots with
+# the thread affinity of the receiver, queued connections are delivered by the event loop.
 def SIGNAL(signature):
+    # PyQt4 passes Python objects as PyQt_PyObject, PySide6 as PyObject
+    signature = signature.replace("PyQt_PyObject", "PyObject")
     try:
         return QtCore.SIGNAL(signature)
     except AttributeError:
@@ -187,33 +164,8 @@ def SLOT(signature):
         return signature
 
 
-class QObject(QtCore.QObject):
-    # Provide legacy helpers only if needed; native PySide6 connect/emit usually works
-    def emit(self, signal, *args):
-        # best-effort legacy emit when used with string signatures
-        if not hasattr(self, 'SIGNAL'):
-            self.SIGNAL = _SignalProxy(self)
-        self.SIGNAL(signal).emit(*args)
-
-    def connect(self, obj, signal, slot):  # noqa: A003 - keep legacy name
-        if isinstance(signal, str):
-            if not hasattr(obj, 'SIGNAL'):
-                obj.SIGNAL = _SignalProxy(obj)
-            obj.SIGNAL(signal).connect(slot)
-            return True
-        if hasattr(signal, 'connect'):
-            signal.connect(slot)
-            return True
-        raise AttributeError("Unsupported signal type: %r" % (signal,))
-
-
-# Patch PySide6 QObject with legacy helpers
-QtCore.QObject.emit = QObject.emit
-QtCore.QObject.connect = QObject.connect
-
+QObject = QtCore.QObject
 
-# Inject mixin behavior into key widgets so .connect/.emit is available
-# Avoid altering Qt class hierarchies to prevent instability
 
 # Namespace shortcuts expected by code
 class QStringList(list):
@@ -228,7 +180,7 @@ QDir = QtCore.QDir
 # Re-export submodules for import style from PyQt4 import Qt; then Qt.Qt etc.
 __all__ = [
     'Qt', 'QApplication', 'QWidget', 'QDialog', 'QMainWindow', 'QMessageBox', 'QFileDialog',
-    'QFrame', 'QProgressBar', 'QLabel', 'QPen', 'QFont', 'QColor', 'QRect', 'QPoint', 'QDir',
+    'QFrame', 'QProgressBar', 'QLabel', 'QPushButton', 'QCheckBox', 'QGridLayout', 'QPen', 'QFont', 'QColor', 'QRect', 'QPoint', 'QDir',
     'QTableView', 'QHeaderView', 'QAbstractItemView', 'QStyledItemDelegate', 'QComboBox',
     'QPlainTextEdit', 'QSpinBox', 'QDoubleSpinBox', 'QAbstractTableModel', 'QModelIndex',
     'QObject', 'SIGNAL', 'SLOT', 'QT_VERSION_STR', 'QString', 'QStringList', 'QMetaType', 'QVariant'
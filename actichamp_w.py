@@ -30,11 +30,16 @@ along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
 @version: 1.0
 '''
 
+import os
+import sys
 import ctypes
 import ctypes.wintypes
 import _ctypes
 import numpy as np
 import time
+import threading
+import collections
+from bufpool import pool
 try:
     import ConfigParser as configparser
 except ImportError:
@@ -48,6 +53,11 @@ PYSIGGEN = False
 if platform.system() != 'Windows':
     PYSIGGEN = True
 
+# use the simulated device (champsim.SimulatedChamp) instead of the hardware DLL, the value
+# is the device and fault specification (see champsim.parse_options()), None = hardware.
+# Enabled by the environment variable PYCORDER_SIMULATE or the command line option --simulate
+SIMULATION = os.environ.get("PYCORDER_SIMULATE", None) or None
+
 
 # max integer
 INT32_MAX = 2**31-1
@@ -81,6 +91,48 @@ CHAMP_6_VERSION_DSP =   0x690E0A07    # 105.14.10.07  MSP430
 # compensate constant trigger delay
 CHAMP_COMPTRIGGER = False
 
+# decode the selected channels straight from the transfer buffer (gather, transpose and
+# conversion in one pass per contiguous channel run, followed by the per channel scaling).
+# False: gather into an intermediate int32 array and scale EEG and AUX channels separately
+FUSED_DECODE = True
+# number of samples decoded in one pass, keeps the raw data of large blocks
+# (e.g. the backlog after a USB stall) in the CPU cache for the scaling pass
+DECODE_CHUNK = 8192
+
+# read the device in a dedicated thread (UsbReader) into a raw data ring buffer, ActiChamp.read()
+# takes the data from the ring buffer. Processing spikes of the module chain are absorbed by the
+# ring buffer instead of stalling the USB transfer. False: read the device in ActiChamp.read()
+USB_READER = True
+# size of the reader ring buffer in seconds of device data
+USB_RING_TIME = 5.0
+
+# acquisition latency mode, data amount of a single device read (block interval) in s.
+# Shorter blocks reach the module chain earlier at the cost of more CPU time per second
+# of data (see benchmarks/latency.py). The default is 50ms, the low latency modes are
+# selected with the environment variable PYCORDER_LATENCY or the command line option
+# --latency (block interval in ms, see LATENCY_MODES)
+# selectable block intervals in ms
+LATENCY_MODES = (2, 5, 10, 20, 50)
+# default block interval in ms
+DEFAULT_LATENCY = 50
+
+def latency_interval(value):
+    ''' Get the block interval of an acquisition latency mode
+    @param value: block interval in ms (number or string)
+    @return: block interval in s, the default interval if value is not one of the LATENCY_MODES
+    '''
+    try:
+        ms = int(value)
+    except (TypeError, ValueError):
+        ms = None
+    if ms not in LATENCY_MODES:
+        print("PyCorder: invalid latency mode %r, using %dms (valid modes: %s)"%(
+              value, DEFAULT_LATENCY, ", ".join(str(m) for m in LATENCY_MODES)), file=sys.stderr)
+        ms = DEFAULT_LATENCY
+    return ms / 1000.0
+
+USB_READ_INTERVAL = latency_interval(os.environ.get("PYCORDER_LATENCY", DEFAULT_LATENCY))
+
 # C error numbers
 CHAMP_ERR_OK = 0            # Success (no errors)
 CHAMP_ERR_HANDLE = -1       # Invalid handle (such handle not present now)
@@ -461,13 +513,15 @@ class ActiChamp(object):
     ''' ActiChamp hardware object (Python wrapper for actiCHamp Windows DLL)
     '''
 
-    def __init__(self):
+    def __init__(self, device=0):
         ''' Constructor
+        @param device: device number, for multiple amplifiers connected to the same computer
         '''
         # get OS architecture (32/64-bit)
         self.x64 = ("64" in platform.architecture()[0])
         
         # set default values
+        self.device = device                                #: device number of the DLL device list
         self.devicehandle = 0
         self.ampversion = AmpVersion()                      #: actiCHamp version info structure
         self.deviceinfo = CHAMP_DEVICE_INFO()               #: actiCHamp device info structure
@@ -490,7 +544,12 @@ class ActiChamp(object):
         self.binning_offset = 0                             #: raw data buffer offset in bytes for binning
 
         self.sampleCounterAdjust = 0 #: sample counter wrap around, HW counter is 32bit value but we need 64bit
+        self.lastSampleCounter = 0   #: last 32bit HW counter value of the previous read
+        self._decodePlan = None      #: cached channel runs and scale vector of the channel selection
         self.BlockingMode = True     #: read data in blocking mode
+        self.reader = None           #: USB reader thread of the running acquisition
+        self.readInterval = USB_READ_INTERVAL   #: data amount of a single read in s (latency mode)
+        self.readTime = 0.0          #: monotonic time the data of the last read was received
         self.EmulationMode = False   #: emulate hardware
 
         # set default properties
@@ -544,8 +603,12 @@ class ActiChamp(object):
         
         
     def loadLib(self):
-        ''' Load windows library
+        ''' Load windows library or create the simulated device (SIMULATION)
         '''
+        if SIMULATION != None:
+            from champsim import SimulatedChamp, parse_options
+            self.lib = SimulatedChamp(**parse_options(SIMULATION))
+            return
         # load ActiChamp 32 or 64 bit windows library
         try:
             # unload existing library
@@ -579,16 +642,16 @@ class ActiChamp(object):
 
         # check if device hardware is available
         self._resetDeviceProperties()
-        if self.lib.champGetCount() == 0:
+        if self.lib.champGetCount() <= self.device:
             raise AmpError("hardware not available")
         
         retry = 3
         while retry > 0:
-            # open the first available device
+            # open the device
             if self.x64:
-                self.devicehandle = ctypes.c_uint64(self.lib.champOpen(0))
+                self.devicehandle = ctypes.c_uint64(self.lib.champOpen(self.device))
             else:
-                self.devicehandle = ctypes.c_int32(self.lib.champOpen(0))
+                self.devicehandle = ctypes.c_int32(self.lib.champOpen(self.device))
             if self.devicehandle.value == 0:
                 self.devicehandle = 0
                 raise AmpError("failed to open device")
@@ -738,6 +801,7 @@ class ActiChamp(object):
         self.running = True
         self.readError = False
         self.sampleCounterAdjust = 0
+        self.lastSampleCounter = 0
         self.BlockTimer = time.perf_counter()
         
         # try to set the PLL input
@@ -746,23 +810,31 @@ class ActiChamp(object):
         # reset signal generator
         self.DummySignals = []
         
+        # drain the device in the reader thread, impedance data is read on request only
+        self.reader = None
+        if USB_READER and self.settings.Mode != CHAMP_MODE_IMPEDANCE:
+            self.reader = UsbReader(self)
+        
     def stop(self):
         ''' Stop data acquisition
         '''
         if not self.running:
             return
         self.running = False
+        if self.reader != None:
+            self.reader.stop()
         if self.devicehandle == 0:
             raise AmpError("device not open")
         err = self.lib.champStop(self.devicehandle)
         if err != CHAMP_ERR_OK:
             raise AmpError("failed to stop device", err)
         
-    def read(self, indices, eegcount, auxcount):
+    def read(self, indices, eegcount, auxcount, dtype=np.float64):
         ''' Read data from device
         @param indices: to select the requested channels from raw data stream
         @param eegcount: number of requested EEG channels
         @param auxcount: number of requested AUX channels 
+        @param dtype: data type of the scaled channel data (float64 or float32)
         @return: list of np arrays for channel data, trigger channel and sample counter,
                  indices of disconnected channels
         '''
@@ -770,15 +842,22 @@ class ActiChamp(object):
             return None, None
         
         # calculate data amount for an interval of 
-        interval = 0.05  # interval in [s]
+        interval = self.readInterval  # interval in [s]
         bytes_per_sample = (self.properties.CountEeg + self.properties.CountAux + 1 + 1) *\
                             np.dtype(np.int32).itemsize
-        requestedbytes = int(bytes_per_sample * sample_rate[self.settings.Rate] * interval)
+        requestedbytes = max(int(sample_rate[self.settings.Rate] * interval), 1) * bytes_per_sample
 
         t = time.perf_counter()
+        self.readTime = t
         
         # read data from device
-        if not self.BlockingMode:
+        if self.reader != None:
+            # take the data from the reader thread, wait for one interval in blocking mode
+            bytesread = self.reader.get(self.buffer, self.binning_offset,
+                                        len(self.buffer) - self.binning_offset,
+                                        requestedbytes if self.BlockingMode else 0, interval)
+            self.readTime = self.reader.receiveTime
+        elif not self.BlockingMode:
             bytesread = self.lib.champGetData(self.devicehandle, 
                                               ctypes.byref(self.buffer, self.binning_offset), 
                                               len(self.buffer) - self.binning_offset)
@@ -786,6 +865,7 @@ class ActiChamp(object):
             bytesread = self.lib.champGetDataBlocking(self.devicehandle, 
                                               ctypes.byref(self.buffer, self.binning_offset), 
                                               requestedbytes)
+            self.readTime = time.perf_counter()
             
         blocktime = (time.perf_counter() - self.BlockTimer)
         self.BlockTimer = time.perf_counter()
@@ -811,9 +891,9 @@ class ActiChamp(object):
             # copy remainder from last read back to sample buffer
             ctypes.memmove(self.buffer, self.binning_buffer, self.binning_offset)  
             # new remainder size
-            remainder = ((total_bytes / bytes_per_sample) % self.binning) * bytes_per_sample
+            remainder = ((total_bytes // bytes_per_sample) % self.binning) * bytes_per_sample
             # number of binning aligned samples
-            binning_samples = total_bytes / bytes_per_sample / self.binning * self.binning
+            binning_samples = total_bytes // bytes_per_sample // self.binning * self.binning
             src_offset = binning_samples * bytes_per_sample
             # copy new remainder to binning buffer
             ctypes.memmove(self.binning_buffer, ctypes.byref(self.buffer, src_offset), remainder) 
@@ -822,35 +902,56 @@ class ActiChamp(object):
             # there must be at least one binning sample
             if binning_samples == 0:
                 return None, None
-            items = binning_samples * bytes_per_sample / np.dtype(np.int32).itemsize
+            items = binning_samples * bytes_per_sample // np.dtype(np.int32).itemsize
         else:
-            items = bytesread / np.dtype(np.int32).itemsize
+            items = bytesread // np.dtype(np.int32).itemsize
         
         # channel order in buffer is S1CH1,S1CH2..S1CHn, S2CH1,S2CH2,..S2nCHn, ...
-        x = np.fromstring(self.buffer, np.int32, items)
+        # the transfer buffer is used in place, without copying the raw data
+        x = np.frombuffer(self.buffer, np.int32, items)
         # shape and transpose to 1st axis is channel and 2nd axis is sample
         samplesize = self.properties.CountEeg + self.properties.CountAux + 1 + 1
         x.shape = (-1, samplesize)
         y = x.transpose()
+        samples = y.shape[1]
 
-        # extract the different channel types
-        index = 0
-        eeg = np.array(y[indices], float)
-        
         # get indices of disconnected electrodes (all values == ADC_MAX)
-        # disconnected = np.nonzero(np.all(eeg == ADC_MAX, axis=1))    
+        # disconnected = np.nonzero(np.all(raw == ADC_MAX, axis=1))    
         disconnected = None # not possible yet
-        
-        # extract and scale the different channel types
-        eegscale = self.properties.ResolutionEeg * 1e6      # convert to µV
-        eeg[index:eegcount] = eeg[index:eegcount] * eegscale
-        index += eegcount
-        auxscale = self.properties.ResolutionAux * 1e6      # convert to µV
-        eeg[index:index+auxcount] = eeg[index:index+auxcount] * auxscale
 
-        # extract trigger channel        
+        # extract and scale the different channel types,
+        # the output arrays are taken from the sample array pool
+        if FUSED_DECODE:
+            runs, scale = self._getDecodePlan(indices, eegcount, auxcount, samplesize, dtype)
+            eeg = pool.empty((len(indices), samples), dtype)
+            for first in range(0, samples, DECODE_CHUNK):
+                last = min(first + DECODE_CHUNK, samples)
+                # gather, transpose and convert each run of adjacent raw channels
+                for channel, raw_channel, count in runs:
+                    np.copyto(eeg[channel:channel + count, first:last],
+                              y[raw_channel:raw_channel + count, first:last])
+                # scale to µV, the chunk is still in the CPU cache
+                chunk = eeg[:, first:last]
+                np.multiply(chunk, scale, out=chunk)
+        else:
+            index = 0
+            raw = pool.take(y, indices)
+            eeg = pool.empty(raw.shape, dtype)
+            eegscale = self.properties.ResolutionEeg * 1e6      # convert to µV
+            np.multiply(raw[index:eegcount], eegscale, out=eeg[index:eegcount])
+            index += eegcount
+            auxscale = self.properties.ResolutionAux * 1e6      # convert to µV
+            np.multiply(raw[index:index+auxcount], auxscale, out=eeg[index:index+auxcount])
+            del raw
+
+        # the trigger and sample counter lanes are read in place, the output arrays are
+        # the only copies, because the transfer buffer is overwritten by the next read
         index = self.properties.CountEeg + self.properties.CountAux
-        trg = np.array(y[index:index + 1], np.uint32)
+        lanes = y[index:index + 2].view(np.uint32)
+
+        # extract trigger channel        
+        trg = pool.empty((1, samples), np.uint32)
+        np.copyto(trg[0], lanes[0])
 
         # compensate constant trigger delay
         if CHAMP_COMPTRIGGER:
@@ -859,18 +960,25 @@ class ActiChamp(object):
             trg[0] = temp[:dsize]
             self.trgdelaybuf = temp[dsize:]
 
-        # extract sample counter channel
-        index += 1
-        sctTemp = np.array(y[index:index + 1], np.uint32)
-
-        # search for sample counter wrap around and adjust counter
-        sct = np.array(sctTemp, np.uint64) + self.sampleCounterAdjust
-        wrap = np.nonzero(sctTemp == 0)
-        if (wrap[1].size > 0) and sct[0][0]:
-            wrapIndex = wrap[1][0]
+        # extract sample counter channel and extend it to 64 bit in one pass
+        counter = lanes[1]
+        sct = pool.empty((1, samples), np.uint64)
+        np.add(counter, np.uint64(self.sampleCounterAdjust), out=sct[0])
+
+        # search for sample counter wrap around and adjust counter, the counter
+        # increases monotonically and decreases at the wrap around only
+        # (counter 0 may be missing or start the block)
+        if counter[0] < self.lastSampleCounter:
+            wrapIndex = 0
+        elif counter[-1] < counter[0]:
+            wrapIndex = int(np.argmax(counter < counter[0]))
+        else:
+            wrapIndex = -1
+        if wrapIndex >= 0:
             adjust = np.iinfo(np.uint32).max + 1
             self.sampleCounterAdjust += adjust
-            sct[:,wrapIndex:] += adjust
+            sct[:,wrapIndex:] += np.uint64(adjust)
+        self.lastSampleCounter = int(counter[-1])
 
 
         # Test Signal Generator 
@@ -909,6 +1017,33 @@ class ActiChamp(object):
         d.append(sct)
         return d, disconnected
         
+    def _getDecodePlan(self, indices, eegcount, auxcount, samplesize, dtype):
+        ''' Get the runs of adjacent raw channels and the scale vector of a channel selection
+        @param indices: selected raw channels
+        @param eegcount: number of selected EEG channels
+        @param auxcount: number of selected AUX channels
+        @param samplesize: number of raw channels
+        @param dtype: data type of the scaled channel data
+        @return: list of [output channel, raw channel, number of channels] and 
+        the scale factors to µV as column vector
+        '''
+        indices = np.asarray(indices, np.intp)
+        key = (indices.tobytes(), eegcount, auxcount, samplesize, np.dtype(dtype),
+               self.properties.ResolutionEeg, self.properties.ResolutionAux)
+        if self._decodePlan != None and self._decodePlan[0] == key:
+            return self._decodePlan[1:]
+        runs = []
+        for channel, raw_channel in enumerate(indices):
+            if runs and raw_channel == runs[-1][1] + runs[-1][2]:
+                runs[-1][2] += 1
+            else:
+                runs.append([channel, raw_channel, 1])
+        scale = np.empty((len(indices), 1), dtype)
+        scale[:eegcount] = self.properties.ResolutionEeg * 1e6
+        scale[eegcount:] = self.properties.ResolutionAux * 1e6
+        self._decodePlan = (key, runs, scale)
+        return runs, scale
+
     def readImpedances(self):
         ''' Get the electrode impedance values
         @return: list of impedance values for all EEG channels plus ground electrode in Ohm.
@@ -938,7 +1073,7 @@ class ActiChamp(object):
                 
         # channel order in buffer is CH1,CH2..CHn, GND
         items = self.properties.CountEeg + 1
-        return np.fromstring(self.impbuffer, np.uint32, items), disconnected
+        return np.frombuffer(self.impbuffer, np.uint32, items).copy(), disconnected
         
     def setImpedanceRange(self, good, bad):
         ''' set ActiCap impedance range
@@ -976,6 +1111,10 @@ class ActiChamp(object):
         '''
         emulation = 0
         modules = 0
+        if SIMULATION != None and self.lib != None:
+            # the simulated device generates its own test signals, don't use the signal generator
+            self.EmulationMode = False
+            return self.lib.modules
         try:
             ini = configparser.ConfigParser()
             if self.x64:
@@ -1004,6 +1143,13 @@ class ActiChamp(object):
         if self.devicehandle != 0:
             return
 
+        # change the module count of the simulated device
+        if SIMULATION != None and self.lib != None:
+            if modules > 0:
+                self.lib.modules = min(modules, 5)
+            self.readConfiguration(self.settings.Rate, force=True)
+            return
+
         # write new settings to INI file
         ini = configparser.ConfigParser()
         if self.x64:
@@ -1072,6 +1218,22 @@ class ActiChamp(object):
             raise AmpError("failed to read device status", err)
         return status.Samples, status.Errors, status.Rate, status.Speed
     
+    def getReaderOverflow(self):
+        ''' Get the number of samples lost by reader ring buffer overflows since the last call
+        @return: number of lost samples, 0 if the reader thread is not used
+        '''
+        if self.reader == None:
+            return 0
+        return self.reader.takeOverflow()
+    
+    def getReaderStatus(self):
+        ''' Get the reader ring buffer statistics of the current or last acquisition
+        @return: max. ring buffer fill level in percent and total lost samples as tuple,
+                 None if the reader thread is not used
+        '''
+        if self.reader == None:
+            return None
+        return 100.0 * self.reader.highWater / self.reader.capacity, self.reader.lostSamples
      
     def getSamplingRateBase(self, samplingrate):
         ''' Get base sampling rate ID and divider for the requested sampling rate
@@ -1269,6 +1431,159 @@ class ActiChamp(object):
 
 
 
+'''
+------------------------------------------------------------
+USB reader thread
+------------------------------------------------------------
+'''
+
+class UsbReader(object):
+    ''' Drains the device into a raw data ring buffer.
+    The thread does nothing but reading the device, decoding and processing happens
+    in ActiChamp.read() on the consumer side. The ring buffer is lossless as long as
+    the consumer keeps up on average, if it is full the received data is discarded
+    and counted as lost samples (they show up as sample counter gaps).
+    '''
+    def __init__(self, amp):
+        ''' Constructor, starts the reader thread
+        @param amp: running ActiChamp hardware object
+        '''
+        self.lib = amp.lib
+        self.devicehandle = amp.devicehandle
+        self.blocking = amp.BlockingMode
+        self.interval = amp.readInterval    #: data amount of a single device read in s
+        self.sampleSize = (amp.properties.CountEeg + amp.properties.CountAux + 1 + 1) * \
+                          np.dtype(np.int32).itemsize           #: raw sample size in bytes
+        rate = sample_rate[amp.settings.Rate]
+        self.requestSize = max(int(rate * self.interval), 1) * self.sampleSize
+        self.capacity = max(int(rate * USB_RING_TIME), 2 * self.requestSize // self.sampleSize) * \
+                        self.sampleSize                         #: ring buffer size in bytes, whole samples
+        self.ring = ctypes.create_string_buffer(self.capacity)  #: raw data ring buffer
+        self.transfer = ctypes.create_string_buffer(len(amp.buffer))  #: device transfer buffer
+        self.writePos = 0           #: total bytes written to the ring buffer
+        self.readPos = 0            #: total bytes taken from the ring buffer
+        self.receiveTimes = collections.deque()  #: (end position, receive time) of the ring content
+        self.receiveTime = 0.0      #: receive time of the oldest data of the last get()
+        self.highWater = 0          #: max. ring buffer fill level in bytes
+        self.lostSamples = 0        #: total samples discarded because of ring buffer overflows
+        self.overflow = 0           #: lost samples not yet reported
+        self.monitoring = False     #: the device reported a data rate mismatch
+        self.error = CHAMP_ERR_OK   #: device read error, terminates the reader
+        self.running = True
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="actiCHamp USB reader")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        ''' Terminate the reader thread
+        '''
+        self.running = False
+        self.thread.join(10 * self.interval + 1.0)
+
+    def _setPriority(self):
+        ''' Raise the reader thread priority, if supported by the OS
+        '''
+        try:
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), 15)  # THREAD_PRIORITY_TIME_CRITICAL
+        except:
+            pass
+
+    def _run(self):
+        ''' Reader thread loop
+        '''
+        self._setPriority()
+        while self.running:
+            if self.blocking:
+                bytesread = self.lib.champGetDataBlocking(self.devicehandle, ctypes.byref(self.transfer),
+                                                          self.requestSize)
+            else:
+                bytesread = self.lib.champGetData(self.devicehandle, ctypes.byref(self.transfer),
+                                                  len(self.transfer))
+            t = time.perf_counter()
+            if bytesread < 0:
+                with self.condition:
+                    if bytesread == CHAMP_ERR_MONITORING:
+                        self.monitoring = True
+                    else:
+                        self.error = bytesread
+                        self.running = False
+                    self.condition.notify_all()
+                continue
+            if bytesread == 0:
+                if not self.blocking:
+                    time.sleep(self.interval / 5)
+                continue
+            self._put(bytesread, t)
+
+    def _put(self, size, t):
+        ''' Append the content of the transfer buffer to the ring buffer
+        @param size: number of bytes in the transfer buffer
+        @param t: receive time
+        '''
+        with self.condition:
+            if self.writePos - self.readPos + size > self.capacity:
+                lost = size // self.sampleSize
+                self.lostSamples += lost
+                self.overflow += lost
+                return
+            pos = self.writePos % self.capacity
+        # the consumer does not access the free part of the ring buffer
+        first = min(size, self.capacity - pos)
+        ctypes.memmove(ctypes.byref(self.ring, pos), self.transfer, first)
+        if size > first:
+            ctypes.memmove(self.ring, ctypes.byref(self.transfer, first), size - first)
+        with self.condition:
+            self.writePos += size
+            self.receiveTimes.append((self.writePos, t))
+            self.highWater = max(self.highWater, self.writePos - self.readPos)
+            self.condition.notify_all()
+
+    def get(self, buffer, offset, size, minimum, timeout):
+        ''' Take whole samples from the ring buffer
+        @param buffer: destination ctypes buffer
+        @param offset: destination offset in bytes
+        @param size: max. number of bytes
+        @param minimum: wait until this number of bytes is available
+        @param timeout: max. waiting time in s
+        @return: number of bytes copied or DLL error code
+        '''
+        with self.condition:
+            if minimum > 0:
+                self.condition.wait_for(lambda: self.writePos - self.readPos >= minimum or
+                                        self.monitoring or not self.running, timeout)
+            if self.monitoring:
+                self.monitoring = False
+                return CHAMP_ERR_MONITORING
+            available = self.writePos - self.readPos
+            if available == 0 and self.error != CHAMP_ERR_OK:
+                return self.error
+            count = min(available, size) // self.sampleSize * self.sampleSize
+            pos = self.readPos % self.capacity
+            if self.receiveTimes:
+                self.receiveTime = self.receiveTimes[0][1]
+        # the producer does not access the filled part of the ring buffer
+        first = min(count, self.capacity - pos)
+        ctypes.memmove(ctypes.byref(buffer, offset), ctypes.byref(self.ring, pos), first)
+        if count > first:
+            ctypes.memmove(ctypes.byref(buffer, offset + first), self.ring, count - first)
+        with self.condition:
+            self.readPos += count
+            while self.receiveTimes and self.receiveTimes[0][0] <= self.readPos:
+                self.receiveTimes.popleft()
+        return count
+
+    def takeOverflow(self):
+        ''' Get the number of samples lost since the last call
+        '''
+        with self.condition:
+            lost = self.overflow
+            self.overflow = 0
+        return lost
+
+
+
 '''
 ------------------------------------------------------------
 Signal Generator for simulation mode
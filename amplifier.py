@@ -29,10 +29,11 @@ along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
 @version: 1.0
 '''
 
-from scipy import signal
 from PyQt4 import Qt
 from modbase import *
+from bufpool import pool
 from actichamp_w import *
+from decimator import Decimator, DelayLine
 from res import frmActiChampOnline
 from res import frmActiChampConfig
 from operator import itemgetter
@@ -51,6 +52,14 @@ AMP_HIDE_REF = True
 # no channel selection within amplifier module, for use with an separate montage module.
 AMP_MONTAGE = False
 
+# selectable sampling rates in Hz, rates not supported by the hardware are removed
+AMP_SAMPLE_RATES = [100000.0, 50000.0, 25000.0, 10000.0, 5000.0, 2000.0, 1000.0, 500.0, 200.0]
+
+# block intervals (s) of the low latency acquisition modes (actichamp_w.USB_READ_INTERVAL),
+# the worker thread doesn't sleep between two blocking reads in these modes,
+# a short sleep can take a full OS timer tick (15.6ms on Windows)
+AMP_LOW_LATENCY = 0.02
+
 '''
 ------------------------------------------------------------
 AMPLIFIER MODULE
@@ -83,7 +92,7 @@ class AMP_ActiChamp(ModuleBase):
 
         # create dictionary of possible sampling rates
         self.sample_rates = []
-        for rate in [100000.0, 50000.0, 25000.0, 10000.0, 5000.0, 2000.0, 1000.0, 500.0, 200.0]:
+        for rate in AMP_SAMPLE_RATES:
             base, div = self.amp.getSamplingRateBase(rate)
             if base >= 0:
                 self.sample_rates.append({'rate':str(int(rate)), 'base':base, 'div':div, 'value':rate})
@@ -115,8 +124,8 @@ class AMP_ActiChamp(ModuleBase):
         self.battery_timer = time.perf_counter()
         self.voltage_warning = ""
 
-        # skip the first received data blocks 
-        self.skip_counter = 5
+        # skip the first 250ms of received data
+        self.skip_counter = int(round(0.25 / self.amp.readInterval))
         self.blocking_counter = 0
         
         # reset hardware error counter and acquisition time out
@@ -364,6 +373,8 @@ class AMP_ActiChamp(ModuleBase):
             else:
                 info = "Start %s at %.0fHz"%(CHAMP_Modes[self.recording_mode],\
                                              self.eeg_data.sample_rate)
+        if self.binning > 1 and self.recording_mode != CHAMP_MODE_IMPEDANCE:
+            info += " (decimation: %s)"%(self.decimator.info())
             
         self.send_event(ModuleEvent(self._object_name, EventType.LOGMESSAGE, info))
         # send recording mode
@@ -374,8 +385,8 @@ class AMP_ActiChamp(ModuleBase):
         # update button state
         self.online_cfg.updateUI(self.recording_mode)
         
-        # skip the first received data blocks 
-        self.skip_counter = 5
+        # skip the first 250ms of received data
+        self.skip_counter = int(round(0.25 / self.amp.readInterval))
         self.blocking_counter = 0
         self.initialErrorCount = -1 
         
@@ -394,6 +405,7 @@ class AMP_ActiChamp(ModuleBase):
             self.amp.stop()
         except:
             pass
+        readerstatus = self.amp.getReaderStatus()
         try:
             self.amp.close()
         except:
@@ -403,6 +415,8 @@ class AMP_ActiChamp(ModuleBase):
         info = "Stop %s"%(CHAMP_Modes[self.recording_mode])
         if (errors > 0) and (self.recording_mode != CHAMP_MODE_IMPEDANCE) and (self.recording_mode != CHAMP_MODE_LED_TEST):
             info += " (device errors = %d)"%(errors)
+        if readerstatus != None and self.recording_mode != CHAMP_MODE_IMPEDANCE:
+            info += " (USB reader buffer max. %.0f%%, %d samples lost)"%readerstatus
         self.send_event(ModuleEvent(self._object_name, EventType.LOGMESSAGE, info))
         # send recording mode
         self.send_event(ModuleEvent(self._object_name,
@@ -481,6 +495,7 @@ class AMP_ActiChamp(ModuleBase):
             # remove all disabled reference channels
             ref_dis = np.array([x.isReference and not x.enable for x in self.eeg_data.channel_properties], dtype=bool)
             self.ref_remove_index = np.nonzero(ref_dis)[0]     # indices of disabled reference channels
+            self.ref_keep_index = np.nonzero(~ref_dis)[0]       # indices of the remaining channels
             self.eeg_data.channel_properties = np.delete(self.eeg_data.channel_properties, self.ref_remove_index, 0)
             self.eeg_data.eeg_channels = np.delete(self.eeg_data.eeg_channels, self.ref_remove_index, 0)
         
@@ -515,6 +530,7 @@ class AMP_ActiChamp(ModuleBase):
         self.ref_index = np.array([])           # indices of reference channel(s)
         self.eeg_data.ref_channel_name = ""
         self.ref_remove_index = self.ref_index
+        self.ref_keep_index = np.array([], int)
 
         # prepare recording mode and anti aliasing filters
         self._prepare_mode_and_filters()
@@ -531,25 +547,21 @@ class AMP_ActiChamp(ModuleBase):
         elif self.recording_mode == CHAMP_MODE_TEST:
             self.eeg_data.recording_mode = RecordingMode.TEST
 
+        # block length of the device reads, sizes the input queues of the receivers
+        self.eeg_data.block_interval = self.amp.readInterval
+
         # down sampling
         self.binning = self.sample_rate['div']
         self.binningoffset = 0
 
-        # design anti-aliasing filter for down sampling
-        # it's an Nth order lowpass Butterworth filter from scipy 
-        # signal.filter_design.butter(N, Wn, btype='low')
-        # N = filter order, Wn = cut-off frequency / nyquist frequency
-        # f_nyquist = f_in / 2
-        # f_cutoff = f_in / rate_divider * filter_factor
-        # Wn = f_cutoff / f_nyquist = f_in / rate_divider * filter_factor / f_in * 2
-        # Wn = 1 / rate_divider * 2 * filter_factor
-        filter_order = 4
-        filter_factor = 0.333
-        rate_divider = self.binning
-        Wn = 1.0 / rate_divider * 2.0 * filter_factor
-        self.aliasing_b,self.aliasing_a = signal.filter_design.butter(filter_order, Wn, btype='low') 
-        zi = signal.lfiltic(self.aliasing_b, self.aliasing_a, (0.0,))
-        self.aliasing_zi = np.resize(zi, (len(self.channel_indices),len(zi)))
+        # design the decimating anti-aliasing filter for down sampling,
+        # filter type and specification see decimator.DECIMATION_FILTER
+        self.decimator = Decimator(self.binning, len(self.channel_indices),
+                                   self.sample_rate['value'] * self.binning)
+        # trigger and sample counter are not filtered, delay them by the filter group
+        # delay to keep the markers aligned with the decimated channel data
+        self.trigger_delay = DelayLine(self.decimator.lag)
+        self.counter_delay = DelayLine(self.decimator.lag, extrapolate=True)
 
         # define which channels contains which impedance values
         self.eeg_data.eeg_channels[:,:] = 0
@@ -664,7 +676,7 @@ class AMP_ActiChamp(ModuleBase):
         self.eeg_data.impedances = []
         
         # copy impedance values to data array
-        self.eeg_data.eeg_channels = np.zeros((len(self.channel_indices), 10), 'd')
+        self.eeg_data.eeg_channels = np.zeros((len(self.channel_indices), 10), sample_type())
         self.eeg_data.eeg_channels[self.eeg_indices,ImpedanceIndex.DATA] = eeg_imp
         self.eeg_data.eeg_channels[self.eeg_indices,ImpedanceIndex.GND] = gnd_imp
         
@@ -711,7 +723,7 @@ class AMP_ActiChamp(ModuleBase):
         ''' Get data from amplifier
         and return the eeg data block
         '''
-        t = time.clock()
+        t = time.perf_counter()
         self.eeg_data.performance_timer = 0
         self.eeg_data.performance_timer_max = 0
         self.recordtime = 0.0
@@ -733,18 +745,22 @@ class AMP_ActiChamp(ModuleBase):
             self._thLock.release()
             try:
                 d, disconnected = self.amp.read(self.channel_indices, 
-                                                len(self.eeg_indices), len(self.aux_indices))
+                                                len(self.eeg_indices), len(self.aux_indices),
+                                                sample_type())
             finally:
                 self._thLock.acquire()
             self.output_timer = time.perf_counter()
         else:
             d, disconnected = self.amp.read(self.channel_indices, 
-                                            len(self.eeg_indices), len(self.aux_indices))
+                                            len(self.eeg_indices), len(self.aux_indices),
+                                            sample_type())
+        # monotonic time of the hardware read, reference of the sink latencies
+        read_time = self.amp.readTime
         
         if d == None:
             self.acquisitionTimeoutCounter += 1
-            # about 5s timeout
-            if self.acquisitionTimeoutCounter > 100:
+            # about 5s timeout, each read waits for one block interval
+            if self.acquisitionTimeoutCounter > 5.0 / self.amp.readInterval:
                 self.acquisitionTimeoutCounter = 0
                 raise ModuleError(self._object_name, "connection to hardware is broken!")
             # check data rate mismatch messages
@@ -757,6 +773,13 @@ class AMP_ActiChamp(ModuleBase):
         else:
             self.acquisitionTimeoutCounter = 0
             
+        # the reader thread ring buffer was full, the consumer is permanently too slow
+        lost = self.amp.getReaderOverflow()
+        if lost > 0:
+            self.send_event(ModuleEvent(self._object_name, 
+                                        EventType.ERROR, 
+                                        info = "USB reader buffer overflow, %d samples lost"%(lost),
+                                        severity = ErrorSeverity.NOTIFY))
 
         # skip the first received data blocks 
         if self.skip_counter > 0:
@@ -769,15 +792,13 @@ class AMP_ActiChamp(ModuleBase):
 
         # down sample required?
         if self.binning > 1:
-            # anti-aliasing filter
-            filtered ,self.aliasing_zi = \
-                signal.lfilter(self.aliasing_b, self.aliasing_a, d[0], zi=self.aliasing_zi) 
-            # reduce reslution to avoid limit cycle
-            # self.aliasing_zi = np.asfarray(self.aliasing_zi, np.float32) 
-
-            self.eeg_data.eeg_channels = filtered[:, self.binningoffset::self.binning]
-            self.eeg_data.trigger_channel = np.bitwise_or.reduce(d[1][:].reshape(-1, self.binning), axis=1).reshape(1,-1)
-            self.eeg_data.sample_channel = d[2][:, self.binningoffset::self.binning] / self.binning
+            # anti-aliasing filter and down sampling into a pooled array of the chain
+            # sample type, only the kept output samples are computed
+            self.eeg_data.eeg_channels = self.decimator.process(d[0])
+            trigger = np.bitwise_or.reduce(d[1][:].reshape(-1, self.binning), axis=1).reshape(1,-1)
+            self.eeg_data.trigger_channel = self.trigger_delay.process(trigger)
+            counter = d[2][:, self.binningoffset::self.binning] / self.binning
+            self.eeg_data.sample_channel = self.counter_delay.process(counter)
             self.eeg_data.sample_counter += self.eeg_data.sample_channel.shape[1]
         else:
             self.eeg_data.eeg_channels = d[0]
@@ -800,19 +821,24 @@ class AMP_ActiChamp(ModuleBase):
                 self.eeg_data.eeg_channels = np.delete(self.eeg_data.eeg_channels, self.ref_index, 0)
             '''
             # average reference channels
-            reference = np.mean(self.eeg_data.eeg_channels[self.ref_index], 0)
+            channels = pool.take(self.eeg_data.eeg_channels, self.ref_index)
+            reference = pool.empty(channels.shape[1:], channels.dtype)
+            np.mean(channels, 0, out=reference)
+            del channels
 
             # subtract reference
             self.eeg_data.eeg_channels[:len(self.eeg_indices)] -= reference
+            del reference
 
             # remove all disabled reference channels
             if len(self.ref_remove_index) > 0:
-                self.eeg_data.eeg_channels = np.delete(self.eeg_data.eeg_channels, self.ref_remove_index, 0)
+                self.eeg_data.eeg_channels = pool.take(self.eeg_data.eeg_channels, self.ref_keep_index)
             
                 
         # calculate date and time for the first sample of this block in s
         sampletime = self.eeg_data.sample_channel[0][0] / self.eeg_data.sample_rate
         self.eeg_data.block_time = self.start_time + datetime.timedelta(seconds=sampletime)
+        self.eeg_data.acquisition_time = read_time
 
         # process connected input devices
         if not AMP_MONTAGE:
@@ -829,7 +855,9 @@ class AMP_ActiChamp(ModuleBase):
         ''' Check if record time exceeds 200ms over a period of 10 blocks
         and adjust idle time to record time
         '''
-        if self.recordtime > 0.2:
+        # with the USB reader thread the ring buffer absorbs processing spikes,
+        # blocks are never dropped deliberately
+        if self.recordtime > 0.2 and self.amp.reader == None:
             self.blocking_counter += 1
             # drop blocks if exceeded
             if self.blocking_counter > 10:
@@ -838,13 +866,20 @@ class AMP_ActiChamp(ModuleBase):
         else:
             self.blocking_counter = 0
         
-        # adjust idle time to record time
-        idletime = max(0.06-self.recordtime, 0.02)
+        # adjust idle time to record time and block interval (readInterval + 10ms
+        # minus the last record time, at least 40% of the block interval)
+        interval = self.amp.readInterval
+        idletime = max(interval + 0.01 - self.recordtime, 0.4 * interval)
 
         if self.amp.BlockingMode:
-            time.sleep(0.001)
+            # the blocking read waits for the data, yield for 1ms between the reads,
+            # no sleep at all in the low latency modes (< AMP_LOW_LATENCY)
+            if interval >= AMP_LOW_LATENCY:
+                time.sleep(0.001)
+        elif self._eventdriven:
+            self.wait_for_wakeup(idletime)  # suspend for idletime or until a command arrives
         else:
-            time.sleep(idletime)    # suspend the worker thread for 60ms
+            time.sleep(idletime)    # suspend the worker thread for idletime
         
     def getXML(self):
         ''' Get module properties for XML configuration file
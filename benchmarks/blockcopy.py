@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+'''
+Data Block Copy Benchmark
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Measures the per block copy cost of EEG_DataBlock objects for different
+channel counts:
+    - copy: copy.copy() as done by the amplifier for each block, channel
+      properties and markers are shared copy-on-write
+    - private copy: copy.copy() followed by make_writable() of properties and
+      markers, the cost of the former per block deep copy and of a receiver
+      which modifies properties and markers in place
+    - share: lightweight block for one of several receivers
+    - deepcopy: completely private block including the sample arrays
+
+The copy-on-write contract of copy.copy() is checked first: the source block
+flags stay unchanged, the owner can edit the source in place after replacing
+its properties or markers, and in place edits of the copy after
+make_writable() don't reach the source.
+
+Usage: python -m benchmarks.blockcopy [-c channels ...] [-s samples] [-m markers] [-n repeats]
+'''
+
+import sys, os
+import copy
+import timeit
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modbase import *
+
+
+def create_block(channels, samples, markers):
+    ''' Create a data block like the amplifier module would send it
+    @param channels: number of EEG channels, 8 AUX channels are added
+    @param samples: number of samples
+    @param markers: number of markers
+    '''
+    block = EEG_DataBlock(channels, 8)
+    block.eeg_channels = np.zeros((channels + 8, samples), 'd')
+    block.trigger_channel = np.zeros((1, samples), np.uint32)
+    block.sample_channel = np.arange(samples, dtype=np.uint64).reshape(1, samples)
+    block.markers = [EEG_Marker(position=m, type="Stimulus", description="S%3d"%(m))
+                     for m in range(markers)]
+    block.shared = 0
+    return block
+
+
+def private_copy(block):
+    copy_obj = copy.copy(block)
+    copy_obj.make_writable(BlockPart.PROPERTIES | BlockPart.MARKERS)
+    return copy_obj
+
+
+def check_copy_contract():
+    ''' Check the copy-on-write contract of copy.copy()
+    @return: list of violations
+    '''
+    failures = []
+    source = create_block(4, 10, 2)
+    copy_obj = copy.copy(source)
+    if source.shared != 0:
+        failures.append("copy.copy() changed the source flags")
+    if copy_obj.shared & (BlockPart.PROPERTIES | BlockPart.MARKERS) != BlockPart.PROPERTIES | BlockPart.MARKERS:
+        failures.append("copy doesn't share properties and markers")
+    # the receiver modifies its copy in place
+    copy_obj.make_writable(BlockPart.PROPERTIES | BlockPart.MARKERS)
+    copy_obj.channel_properties[0].name = "changed"
+    copy_obj.markers[0].description = "changed"
+    if source.channel_properties[0].name == "changed" or source.markers[0].description == "changed":
+        failures.append("in place edit of the copy reached the source")
+    # the owner replaces its markers and edits them in place
+    copy_obj = copy.copy(source)
+    source.markers = [EEG_Marker(type="Stimulus", description="S  1")]
+    source.markers[0].description = "S  2"
+    if len(copy_obj.markers) != 2 or copy_obj.markers[0].description == "S  2":
+        failures.append("owner edit of the source reached the copy")
+    return failures
+
+
+def measure(channels, samples, markers, repeats):
+    ''' Measure the copy variants for one channel count
+    @return: list of copy times in us
+    '''
+    block = create_block(channels, samples, markers)
+    results = []
+    for function in (copy.copy, private_copy, EEG_DataBlock.share, copy.deepcopy):
+        t = timeit.repeat(lambda: function(block), number=repeats, repeat=5)
+        results.append(min(t) / repeats * 1e6)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the EEG_DataBlock copy cost")
+    parser.add_argument("-c", "--channels", type=int, nargs="+", default=[32, 64, 160],
+                        help="number of EEG channels")
+    parser.add_argument("-s", "--samples", type=int, default=50, help="samples per block")
+    parser.add_argument("-m", "--markers", type=int, default=2, help="markers per block")
+    parser.add_argument("-n", "--repeats", type=int, default=2000, help="copies per measurement")
+    args = parser.parse_args()
+
+    failures = check_copy_contract()
+    print("copy contract: %s"%("ok" if not failures else "FAIL, " + ", ".join(failures)))
+    print("%d samples, %d markers per block, times in us"%(args.samples, args.markers))
+    print("%-10s %12s %14s %12s %12s"%("channels", "copy", "private copy", "share", "deepcopy"))
+    for channels in args.channels:
+        result = measure(channels, args.samples, args.markers, args.repeats)
+        print("%-10d %12.1f %14.1f %12.1f %12.1f"%tuple([channels] + result))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
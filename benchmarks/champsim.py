@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+'''
+Simulated actiCHamp Device Check
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Reads the simulated actiCHamp device (champsim.SimulatedChamp) through the
+hardware wrapper (actichamp_w.ActiChamp) like the amplifier module does and
+checks the decoded stream:
+    - sweep: all device sampling rates with the smallest and largest module
+      configuration, the delivered data rate has to match the sampling rate,
+      the sample counter has to be continuous. The CPU load of the process
+      (USB reader thread, device simulation and decoding) is reported.
+    - faults: dropped samples, a counter wrap around and USB stalls longer
+      than the device FIFO, all lost samples have to show up as sample
+      counter gaps and the 64 bit counter has to increase monotonically.
+    - spike: the consumer stalls for 2s (longer than the device FIFO), the
+      USB reader thread has to absorb the stall without losing samples.
+
+The raw data decoding of ActiChamp.read() can be switched to the former
+implementation (--legacy-decode) and the device can be read without the
+USB reader thread (--direct-read) to compare the CPU load.
+
+Usage: python -m benchmarks.champsim [-d seconds] [-r rates] [-m modules]
+                                     [--legacy-decode] [--float32] [--direct-read]
+'''
+
+import sys, os
+import time
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import actichamp_w
+from actichamp_w import *
+
+#: allowed deviation of the delivered data rate from the sampling rate
+RATE_TOLERANCE = 0.02
+
+
+def run(spec, rate, duration, blocking=True, dtype=np.float64, spike=None):
+    ''' Read the simulated device
+    @param spec: device simulation specification (champsim.parse_options())
+    @param rate: device sampling rate in Hz
+    @param duration: read time in s
+    @param blocking: use blocking reads
+    @param dtype: data type of the decoded channel data
+    @param spike: (time, duration) in s, the consumer stalls once at time for duration
+    @return: result dictionary
+    '''
+    actichamp_w.SIMULATION = spec
+    amp = ActiChamp()
+    base, div = amp.getSamplingRateBase(rate)
+    amp.BlockingMode = blocking
+    amp.open()
+    amp.setup(CHAMP_MODE_NORMAL, base, div)
+    eeg, aux = amp.properties.CountEeg, amp.properties.CountAux
+    indices = np.arange(eeg + aux)
+    counters = []
+    times = []
+    amp.start()
+    start = time.perf_counter()
+    cpu = time.process_time()
+    while time.perf_counter() - start < duration:
+        d, disconnected = amp.read(indices, eeg, aux, dtype)
+        if d == None:
+            if not blocking:
+                time.sleep(0.01)
+            continue
+        counters.append(d[2][0].copy())
+        times.append(time.perf_counter())
+        if spike != None and times[-1] - start > spike[0]:
+            time.sleep(spike[1])
+            spike = None
+    cpu = time.process_time() - cpu
+    elapsed = time.perf_counter() - start
+    status = amp.getDeviceStatus()
+    device = amp.lib
+    amp.stop()
+    amp.close()
+
+    counter = np.concatenate(counters) if counters else np.zeros(0, np.uint64)
+    step = np.diff(counter.astype(np.int64))
+    # data rate between the first and the last read, without the backlog of the first read
+    data_rate = 0.0
+    if len(times) > 1:
+        data_rate = (len(counter) - len(counters[0])) / (times[-1] - times[0])
+    return {'rate': rate,
+            'eeg': eeg,
+            'aux': aux,
+            'samples': len(counter),
+            'data_rate': data_rate,
+            'cpu_load': 100.0 * cpu / elapsed,
+            'backwards': int(np.count_nonzero(step < 1)),
+            'gaps': int(np.sum(step[step > 1] - 1)),
+            'wrapped': len(counter) > 0 and counter[-1] > np.iinfo(np.uint32).max,
+            'dropped': device.dropped_samples,
+            'lost': device.lost_samples,
+            'stalls': device.stalls,
+            'errors': status[1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream check of the simulated actiCHamp device")
+    parser.add_argument("-d", "--duration", type=float, default=3.0, help="read time per configuration in s")
+    parser.add_argument("-r", "--rates", type=float, nargs="+", default=sorted(sample_rate.values()),
+                        help="sampling rates in Hz")
+    parser.add_argument("-m", "--modules", type=int, nargs="+", default=[1, 5], help="EEG modules")
+    parser.add_argument("--legacy-decode", action="store_true", help="use the former raw data decoding")
+    parser.add_argument("--float32", action="store_true", help="decode the channel data in single precision")
+    parser.add_argument("--direct-read", action="store_true", help="read the device without the USB reader thread")
+    args = parser.parse_args()
+    actichamp_w.FUSED_DECODE = not args.legacy_decode
+    actichamp_w.USB_READER = not args.direct_read
+    dtype = np.float32 if args.float32 else np.float64
+
+    failed = False
+    print("%8s %5s %9s %9s %8s %6s"%("rate", "eeg", "samples", "rate [%]", "CPU [%]", "gaps"))
+    for rate in args.rates:
+        for modules in args.modules:
+            r = run("modules=%d"%(modules), rate, args.duration, dtype=dtype)
+            deviation = r['data_rate'] / rate - 1.0
+            ok = abs(deviation) < RATE_TOLERANCE and r['gaps'] == 0 and r['backwards'] == 0
+            failed |= not ok
+            print("%8.0f %5d %9d %+9.2f %8.1f %6d  %s"%(rate, r['eeg'], r['samples'], 100.0 * deviation,
+                                                        r['cpu_load'], r['gaps'], "ok" if ok else "FAIL"))
+
+    # drop 50 samples every second, wrap after 1.5s, 1.5s stall with 1s FIFO after 2s
+    duration = max(args.duration, 4.0)
+    spec = "modules=2,drop=1:50,wrap=1.5,stall=2:1.5,fifo=1"
+    for blocking in (True, False):
+        r = run(spec, 10000.0, duration, blocking, dtype)
+        ok = r['wrapped'] and r['backwards'] == 0 and r['dropped'] > 0 and r['lost'] > 0 and \
+             r['gaps'] == r['dropped'] + r['lost'] and 0 < r['errors'] <= r['stalls']
+        failed |= not ok
+        print("faults (%s): %d samples, %d dropped + %d lost = %d gap samples, %d stalls, "
+              "%d device errors, wrapped %s  %s"%("blocking" if blocking else "polling",
+              r['samples'], r['dropped'], r['lost'], r['gaps'], r['stalls'], r['errors'],
+              r['wrapped'], "ok" if ok else "FAIL"))
+
+    # consumer stall of 2s with 1s device FIFO
+    r = run("modules=2,fifo=1", 10000.0, duration, dtype=dtype, spike=(1.0, 2.0))
+    ok = r['gaps'] == 0 and r['lost'] == 0 and r['backwards'] == 0
+    if not actichamp_w.USB_READER:
+        ok = not ok         # the device FIFO overruns without the reader thread
+    failed |= not ok
+    print("spike: %d samples, %d lost, %d gap samples  %s"%(r['samples'], r['lost'], r['gaps'],
+                                                            "ok" if ok else "FAIL"))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+'''
+Decimation Filter Benchmark
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Compares the anti-aliasing filter types of the Python side decimation
+(decimator.Decimator) for all decimation factors of an input rate:
+    - CPU time per second of data for 50ms blocks
+    - pass band gain at half the pass band edge and attenuation of a tone
+      which aliases into the pass band
+    - the output has to be independent of the block size
+    - markers have to line up with the decimated channel data: the amplifier
+      module (amplifier.AMP_ActiChamp) acquires the square wave of the
+      simulated device in test mode at decimated rates, the rising edges of
+      the trigger and of the channel data (zero crossing) have to be in the
+      same sample (+-1)
+
+Usage: python -m benchmarks.decimation [-r rate] [-c channels] [-f factors]
+                                       [--no-alignment]
+'''
+
+import sys, os
+import time
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+import decimator
+from decimator import Decimator, DECIMATION_FILTERS
+
+
+def gain(filtertype, factor, rate, frequency):
+    ''' Measure the gain of the decimator for a sine wave
+    @return: gain in dB
+    '''
+    t = np.arange(int(rate * 2.0)) / rate
+    d = Decimator(factor, 1, rate, filtertype)
+    y = d.process(np.sin(2.0 * np.pi * frequency * t).reshape(1, -1))[0]
+    y = y[len(y) // 2:]
+    return 20.0 * np.log10(np.sqrt(2.0) * np.std(y) + 1e-12)
+
+
+def run(filtertype, factor, rate, channels, duration=2.0):
+    ''' Run the decimator on random data in 50ms blocks
+    @return: result dictionary
+    '''
+    block = int(rate * 0.05) // factor * factor
+    x = np.random.randn(channels, block)
+    d = Decimator(factor, channels, rate, filtertype)
+    d.process(x)
+    blocks = int(duration / 0.05)
+    cpu = time.process_time()
+    for i in range(blocks):
+        d.process(x)
+    cpu = time.process_time() - cpu
+
+    # same data in blocks of random size
+    x = np.random.randn(channels, factor * 400)
+    whole = Decimator(factor, channels, rate, filtertype).process(x).copy()
+    d = Decimator(factor, channels, rate, filtertype)
+    parts, start = [], 0
+    while start < x.shape[1]:
+        n = np.random.randint(1, 3 * factor + 1)
+        parts.append(d.process(x[:, start:start + n]).copy())
+        start += n
+    blockwise = np.concatenate(parts, axis=1)
+
+    out_nyquist = rate / factor / 2.0
+    return {'cpu': 1000.0 * cpu / (blocks * 0.05),
+            'info': d.info(),
+            'pass': gain(filtertype, factor, rate, decimator.DECIMATION_PASSBAND * out_nyquist / 2.0),
+            'alias': gain(filtertype, factor, rate, 1.5 * out_nyquist),
+            'invariant': whole.shape == blockwise.shape and np.allclose(whole, blockwise)}
+
+
+def check_alignment(filtertype, rate, duration=2.5):
+    ''' Acquire the test signal of the simulated device through the amplifier module,
+    the trigger input is high for the first 10ms of every second, the square wave
+    rises at the beginning of every second
+    @param filtertype: decimation filter type
+    @param rate: sampling rate in Hz (decimated)
+    @param duration: acquisition time in s
+    @return: offsets of the channel data edges to the trigger edges in samples, decimator info
+    '''
+    from PyQt4 import Qt
+    from modbase import ModuleBase
+    import eventbus
+    import actichamp_w
+    import amplifier
+
+    class Sink(ModuleBase):
+        def __init__(self):
+            ModuleBase.__init__(self, name="Sink")
+            self.eeg = []
+            self.trigger = []
+
+        def process_input(self, datablock):
+            self.eeg.append(datablock.eeg_channels[0].copy())
+            self.trigger.append(datablock.trigger_channel[0].copy())
+
+        def process_output(self):
+            return None
+
+    app = Qt.QApplication.instance() or Qt.QApplication([sys.argv[0]])
+    actichamp_w.SIMULATION = "modules=1"
+    decimator.DECIMATION_FILTER = filtertype
+    # base rates of actichamp_w.PythonDecimation, the amplifier module decimates
+    dll_rates = actichamp_w.sample_rate
+    actichamp_w.sample_rate = {actichamp_w.CHAMP_RATE_10KHZ:10000.0,
+                               actichamp_w.CHAMP_RATE_50KHZ:50000.0,
+                               actichamp_w.CHAMP_RATE_100KHZ:100000.0}
+    try:
+        amp = amplifier.AMP_ActiChamp()
+    finally:
+        actichamp_w.sample_rate = dll_rates
+    sink = Sink()
+    for module in (amp, sink):
+        module.get_online_configuration()
+    amp.add_receiver(sink)
+    amp.sample_rate = [r for r in amp.sample_rates if r['value'] == rate][0]
+    amp.update_receivers()
+    amp._online_mode_changed(actichamp_w.CHAMP_MODE_TEST)
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        eventbus.bus.process_events(0.01)
+    info = amp.decimator.info()
+    amp.stop(force=True)
+    for module in (amp, sink):
+        module.terminate()
+    eventbus.bus.process_events()
+
+    eeg = np.concatenate(sink.eeg)
+    trigger = np.concatenate(sink.trigger) & 1
+    rising = np.flatnonzero((eeg[1:] >= 0.0) & (eeg[:-1] < 0.0)) + 1
+    offsets = []
+    for edge in np.flatnonzero((trigger[1:] != 0) & (trigger[:-1] == 0)) + 1:
+        if len(rising):
+            offsets.append(int(rising[np.argmin(np.abs(rising - edge))] - edge))
+    return offsets, info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the decimation filter types")
+    parser.add_argument("-r", "--rate", type=float, default=100000.0, help="input sampling rate in Hz")
+    parser.add_argument("-c", "--channels", type=int, default=40, help="number of channels")
+    parser.add_argument("-f", "--factors", type=int, nargs="+", default=[2, 4, 10, 20, 50, 100, 500],
+                        help="decimation factors")
+    parser.add_argument("--no-alignment", action="store_true",
+                        help="don't check the marker alignment through the amplifier module")
+    args = parser.parse_args()
+
+    failed = False
+    print("%6s %-8s %9s %8s %9s  %s"%("factor", "filter", "CPU [ms/s]", "pass [dB]", "alias [dB]", "stages"))
+    for factor in args.factors:
+        for filtertype in sorted(DECIMATION_FILTERS):
+            r = run(filtertype, factor, args.rate, args.channels)
+            failed |= not r['invariant']
+            print("%6d %-8s %9.1f %9.2f %9.1f  %s%s"%(factor, filtertype, r['cpu'], r['pass'], r['alias'],
+                                                     r['info'], "" if r['invariant'] else "  FAIL"))
+    if args.no_alignment:
+        return 1 if failed else 0
+
+    print("")
+    print("%6s %-8s %-24s  %s"%("rate", "filter", "edge offsets [samples]", "decimation"))
+    for rate in (1000.0, 200.0):
+        for filtertype in sorted(DECIMATION_FILTERS):
+            offsets, info = check_alignment(filtertype, rate)
+            ok = len(offsets) > 0 and max(abs(o) for o in offsets) <= 1
+            failed |= not ok
+            print("%6.0f %-8s %-24s  %s  %s"%(rate, filtertype, offsets, info, "ok" if ok else "FAIL"))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
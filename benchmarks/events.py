@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+'''
+Module Event Dispatch Benchmark
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Measures the number of module events per second which travel from the last
+module of a chain up to the application, like STATUS and LOG events sent by
+worker threads. Every module forwards the event to its parent by a queued
+connection. Dispatch variants:
+    - event bus delivered by a plain process_events() loop (headless runtime)
+    - event bus delivered by the Qt event loop, batched per loop iteration
+    - coalesced event storm (EVENT_RATE_LIMIT), delivered by the Qt event loop
+
+The coalescing policy is checked first: MESSAGE and LOGMESSAGE events are
+never coalesced, the last STATUS event is delivered when the module stops,
+and stopped modules are not referenced by the coalescer any more.
+
+Usage: python -m benchmarks.events [-m modules] [-e events]
+'''
+
+import sys, os
+import time
+import argparse
+import threading
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from modbase import *
+import modbase
+import eventbus
+
+
+class Sink(object):
+    ''' Counts the events arriving at the top of the chain
+    '''
+    def __init__(self, events, done):
+        self.events = events
+        self.received = 0
+        self.done = done
+        self.done_time = None
+
+    def event(self, event):
+        self.received += 1
+        # the last event is never dropped by the coalescing
+        if event.info == self.events - 1:
+            self.done_time = time.perf_counter()
+            self.done()
+
+
+def build_chain(modules):
+    ''' Create a linear chain of modules, connected like the main window does
+    @return: list of modules
+    '''
+    chain = [ModuleBase(name="Module %d"%(m), instance=m) for m in range(modules)]
+    for m in range(1, modules):
+        chain[m-1].add_receiver(chain[m])
+    return chain
+
+
+def send_events(module, events):
+    ''' Send STATUS events from a worker thread
+    @return: send start time
+    '''
+    start = time.perf_counter()
+    def sender():
+        for n in range(events):
+            module.send_event(ModuleEvent(module._object_name, EventType.STATUS, info=n))
+    thread = threading.Thread(target=sender)
+    thread.start()
+    return start, thread
+
+
+def measure_bus(modules, events):
+    ''' Event bus, delivered by a process_events() loop
+    @return: sent events per second, number of delivered events
+    '''
+    running = [True]
+    sink = Sink(events, lambda: running.__setitem__(0, False))
+    chain = build_chain(modules)
+    eventbus.connect(chain[0], SIGNAL("event(PyQt_PyObject)"), sink.event)
+    start, thread = send_events(chain[-1], events)
+    while running[0]:
+        eventbus.bus.process_events(0.1)
+    thread.join()
+    return events / (sink.done_time - start), sink.received
+
+
+def measure_qt_bus(app, modules, events):
+    ''' Event bus, delivered by the Qt event loop
+    @return: sent events per second, number of delivered events
+    '''
+    attach_event_loop()
+    sink = Sink(events, app.quit)
+    chain = build_chain(modules)
+    eventbus.connect(chain[0], SIGNAL("event(PyQt_PyObject)"), sink.event)
+    start, thread = send_events(chain[-1], events)
+    app.exec()
+    thread.join()
+    return events / (sink.done_time - start), sink.received
+
+
+def check_coalescing(events=100):
+    ''' Check the event coalescing policy
+    @return: list of violations
+    '''
+    failures = []
+    received = []
+    module = ModuleBase(name="Coalesced")
+    eventbus.connect(module, SIGNAL("event(PyQt_PyObject)"), received.append)
+    for n in range(events):
+        module.send_event(ModuleEvent(module._object_name, EventType.MESSAGE, info="message %d"%(n)))
+        module.send_event(ModuleEvent(module._object_name, EventType.LOGMESSAGE, info="log %d"%(n)))
+        module.send_event(ModuleEvent(module._object_name, EventType.STATUS, info=n, status_field="Rate"))
+    module.stop()
+    eventbus.bus.process_events()
+    types = [e.type for e in received]
+    if types.count(EventType.MESSAGE) != events or types.count(EventType.LOGMESSAGE) != events:
+        failures.append("messages coalesced")
+    status = [e.info for e in received if e.type == EventType.STATUS]
+    if len(status) >= events or status[-1] != events - 1:
+        failures.append("status not coalesced or last value lost")
+    if any(key[0] is module for key in modbase._event_coalescer._pending):
+        failures.append("stopped module still referenced")
+    module.terminate()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Module event dispatch throughput")
+    parser.add_argument("-m", "--modules", type=int, default=9, help="number of modules in the chain")
+    parser.add_argument("-e", "--events", type=int, default=20000, help="number of events")
+    args = parser.parse_args()
+
+    failures = check_coalescing()
+    print("coalescing policy: %s"%("ok" if not failures else "FAIL, " + ", ".join(failures)))
+    print("%d modules, %d events"%(args.modules, args.events))
+    print("%-26s %12s %10s"%("dispatch", "events/s", "delivered"))
+    rate_limit = modbase.EVENT_RATE_LIMIT
+    modbase.EVENT_RATE_LIMIT = 0
+    print("%-26s %12.0f %10d"%(("event bus, headless",) + measure_bus(args.modules, args.events)))
+    if modbase.HEADLESS:
+        print("Qt not available, Qt event loop variants skipped")
+        return 1 if failures else 0
+    app = Qt.QApplication(sys.argv)
+    print("%-26s %12.0f %10d"%(("event bus, Qt event loop",) +
+                               measure_qt_bus(app, args.modules, args.events)))
+    modbase.EVENT_RATE_LIMIT = rate_limit
+    print("%-26s %12.0f %10d"%(("coalesced, Qt event loop",) +
+                               measure_qt_bus(app, args.modules, args.events)))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+'''
+Float32 Processing Accuracy Check
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Compares the float32 processing mode (modbase.SAMPLE_TYPE) with the float64
+path for all sampling rates. Raw 24 bit amplifier samples with electrode DC
+offsets are scaled like ActiChamp.read(), decimated like the amplifier module
+(anti-aliasing filter, if the rate needs a divider) and filtered block by
+block by the filter module kernel (highpass, lowpass and notch). Variants:
+    - float64: reference, the former processing path
+    - float32: float32 sample blocks, filter coefficients and states in
+      double precision (the float32 processing mode)
+    - float32 arithmetic: filter coefficients and states in single precision
+      too, shows why the filters are not run in float32
+
+The error is reported in µV and as signal to error ratio. The float32 mode
+passes if the maximum error stays below one EEG LSB of the amplifier.
+
+Usage: python -m benchmarks.float32 [-r rates] [-d seconds] [-c channels]
+                                    [--python-decimation]
+'''
+
+import sys, os
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from scipy import signal
+from modbase import *
+
+#: EEG resolution of the amplifier in µV per bit (ActiChamp emulation properties)
+RESOLUTION = 4.88e-08 * 1e6
+
+#: base rates of the amplifier DLL if the decimation is done by the amplifier module
+PYTHON_DECIMATION_BASES = [10000.0, 50000.0, 100000.0]
+
+#: block interval in s (amplifier read interval)
+INTERVAL = 0.05
+
+
+def raw_samples(rate, duration, channels, seed=0):
+    ''' Create raw amplifier samples: electrode DC offsets, EEG like sine waves,
+    50 Hz line noise and white noise
+    @param rate: amplifier base rate in Hz
+    @param duration: signal duration in s
+    @param channels: number of channels
+    @return: int32 array (channels x samples)
+    '''
+    rng = np.random.RandomState(seed)
+    t = np.arange(int(rate * duration)) / rate
+    offsets = rng.uniform(-300e3, 300e3, (channels, 1))         # µV
+    uv = offsets + 5.0 * rng.standard_normal((channels, len(t)))
+    for f, a in ((0.5, 80.0), (10.0, 40.0), (50.0, 20.0), (120.0, 5.0)):
+        uv += a * np.sin(2.0 * np.pi * f * t + rng.uniform(0, np.pi, (channels, 1)))
+    return np.round(uv / RESOLUTION).astype(np.int32)
+
+
+class Pipeline(object):
+    ''' Amplifier scaling, decimation and filter module processing for one variant
+    '''
+    def __init__(self, rate, divider, channels, dtype, filter_dtype, highpass, lowpass, notch):
+        from filter import FLT_Eeg, FLT_Kernel
+        self.dtype = np.dtype(dtype)
+        self.divider = divider
+        # anti-aliasing filter of the amplifier module
+        Wn = 1.0 / divider * 2.0 * 0.333
+        sos = signal.butter(4, Wn, btype='low', output='sos')
+        self.aliasing = [sos.astype(filter_dtype), np.zeros((len(sos), channels, 2), filter_dtype)]
+        # filter module groups, designed by the filter module itself
+        flt = FLT_Eeg()
+        flt.samplefreq = rate
+        groups = []
+        for frequency, type in ((highpass, "high"), (lowpass, "low"), (notch, "bandstop")):
+            f = flt._design_filter(frequency, type, slice(0, channels))
+            if f != None:
+                for key in ('sos', 'zi'):
+                    f[key] = f[key].astype(filter_dtype)
+            groups.append([f] if f != None else [])
+        self.kernel = FLT_Kernel(*groups)
+
+    def process(self, raw):
+        ''' Process one block of raw samples
+        @param raw: int32 array (channels x samples)
+        @return: filtered block
+        '''
+        eeg = np.empty(raw.shape, self.dtype)
+        np.multiply(raw, RESOLUTION, out=eeg, casting="same_kind")
+        if self.divider > 1:
+            sos, zi = self.aliasing
+            filtered, self.aliasing[1] = signal.sosfilt(sos, eeg, zi=zi)
+            eeg = filtered[:, ::self.divider].astype(self.dtype)
+        return self.kernel.process(eeg)
+
+
+def compare(rate, divider, duration, channels, highpass, lowpass, notch):
+    ''' Run all variants for one sampling rate
+    @return: list of (variant, maximum error in µV, signal to error ratio in dB, finite)
+    '''
+    base = rate * divider
+    raw = raw_samples(base, duration, channels)
+    block = max(int(base * INTERVAL) // divider * divider, divider)
+    variants = [("float64", np.float64, np.float64),
+                ("float32", np.float32, np.float64),
+                ("float32 arithmetic", np.float32, np.float32)]
+    outputs = []
+    for name, dtype, filter_dtype in variants:
+        pipeline = Pipeline(rate, divider, channels, dtype, filter_dtype, highpass, lowpass, notch)
+        blocks = [pipeline.process(raw[:, i:i+block]) for i in range(0, raw.shape[1], block)]
+        outputs.append(np.concatenate(blocks, 1).astype(np.float64))
+    reference = outputs[0]
+    power = np.sqrt(np.mean(reference**2))
+    results = []
+    for (name, dtype, filter_dtype), output in zip(variants[1:], outputs[1:]):
+        finite = bool(np.all(np.isfinite(output)))
+        if finite:
+            error = output - reference
+            maxerror = np.max(np.abs(error))
+            rms = np.sqrt(np.mean(error**2))
+            ratio = 20.0 * np.log10(power / rms) if rms > 0 else np.inf
+        else:
+            maxerror, ratio = np.inf, -np.inf
+        results.append((name, maxerror, ratio, finite))
+    return results
+
+
+def main():
+    from actichamp_w import sample_rate
+    from amplifier import AMP_SAMPLE_RATES
+    parser = argparse.ArgumentParser(description="Accuracy of the float32 processing mode")
+    parser.add_argument("-r", "--rates", type=float, nargs="+", default=AMP_SAMPLE_RATES,
+                        help="sampling rates in Hz")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="signal duration in s")
+    parser.add_argument("-c", "--channels", type=int, default=4, help="number of channels")
+    parser.add_argument("--highpass", type=float, default=0.1, help="highpass frequency in Hz")
+    parser.add_argument("--lowpass", type=float, default=70.0, help="lowpass frequency in Hz")
+    parser.add_argument("--notch", type=float, default=50.0, help="notch frequency in Hz")
+    parser.add_argument("--python-decimation", action="store_true",
+                        help="decimate in the amplifier module (actichamp_w.PythonDecimation)")
+    args = parser.parse_args()
+
+    bases = PYTHON_DECIMATION_BASES if args.python_decimation else list(sample_rate.values())
+    print("%d channels, %.0fs, highpass %.2fHz, lowpass %.0fHz, notch %.0fHz, 1 LSB = %.4fuV"%(
+          args.channels, args.duration, args.highpass, args.lowpass, args.notch, RESOLUTION))
+    print("%8s %4s  %-20s %14s %10s  %s"%("rate", "div", "variant", "max error[uV]", "SER [dB]", ""))
+    failed = False
+    for rate in args.rates:
+        # smallest integer divider of an amplifier base rate, like ActiChamp.getSamplingRateBase()
+        dividers = [int(b / rate) for b in bases if b >= rate and int(b / rate) == b / rate]
+        if not dividers:
+            continue
+        divider = min(dividers)
+        for name, maxerror, ratio, finite in compare(rate, divider, args.duration, args.channels,
+                                                     args.highpass, args.lowpass, args.notch):
+            if name == "float32":
+                ok = finite and maxerror < RESOLUTION
+                failed |= not ok
+                verdict = "ok" if ok else "FAIL"
+            else:
+                verdict = "" if finite else "unstable"
+            print("%8.0f %4d  %-20s %14.5f %10.1f  %s"%(rate, divider, name, maxerror, ratio, verdict))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
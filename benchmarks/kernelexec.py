@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+'''
+Kernel Execution Mode Check
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Filters the same random data blocks with the filter module (filter.FLT_Eeg)
+in both kernel execution modes (class Execution) and checks that:
+    - the PROCESS output is identical to the THREAD output, sample for sample,
+      while the worker process starts up (the kernel runs in the module thread),
+      after the handover of the kernel state to the process and after a filter
+      parameter update
+    - the parameter update doesn't wait for the worker process start up, it is
+      called from the GUI thread
+
+Usage: python -m benchmarks.kernelexec [-r rate] [-c channels] [-b blocks]
+'''
+
+import sys, os
+import copy
+import time
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from modbase import *
+
+#: maximum time in s of the parameter update which starts the worker process
+UPDATE_LIMIT = 0.25
+
+
+def create_params(channels, rate):
+    ''' Create the parameter block of a 50ms block source
+    '''
+    params = EEG_DataBlock(channels, 8)
+    params.sample_rate = rate
+    params.block_interval = 0.05
+    return params
+
+
+def configure(module, params, notch):
+    ''' Set the global filter values and update the module
+    @return: update time in s
+    '''
+    module.lpGlobal = 200.0
+    module.hpGlobal = 0.1
+    module.notchGlobal = notch
+    t = time.perf_counter()
+    module.update_receivers(params)
+    return time.perf_counter() - t
+
+
+def filter_blocks(module, blocks):
+    ''' Filter the blocks, the module gets private copies
+    @return: tuple(list of output channel data, list of block processing times in s)
+    '''
+    output, times = [], []
+    for block in blocks:
+        block = copy.deepcopy(block)
+        t = time.perf_counter()
+        module.process_input(block)
+        output.append(module.process_output().eeg_channels.copy())
+        times.append(time.perf_counter() - t)
+    return output, times
+
+
+def wait_ready(module, timeout=30.0):
+    ''' Wait until the kernel worker process of the module is ready
+    @return: start up time in s
+    '''
+    t = time.perf_counter()
+    while module._kernel_process != None and not module._kernel_process.ready():
+        if time.perf_counter() - t > timeout:
+            break
+        time.sleep(0.01)
+    return time.perf_counter() - t
+
+
+def run(rate, channels, count):
+    ''' Filter the same blocks in THREAD and PROCESS mode
+    @return: result dictionary
+    '''
+    from filter import FLT_Eeg
+    params = create_params(channels, rate)
+    samples = int(rate * 0.05)
+    blocks = []
+    for n in range(3 * count):
+        block = copy.deepcopy(params)
+        block.eeg_channels = np.random.randn(channels + 8, samples) * 100.0
+        block.trigger_channel = np.zeros((1, samples), np.uint32)
+        block.sample_channel = np.arange(n * samples, (n + 1) * samples, dtype=np.uint64).reshape(1, -1)
+        blocks.append(block)
+
+    result = {}
+    for execution in (Execution.THREAD, Execution.PROCESS):
+        module = FLT_Eeg(execution=execution)
+        update = configure(module, params, False)
+        # the kernel runs in the module thread while the worker process starts up
+        first, times = filter_blocks(module, blocks[:count])
+        startup = update + wait_ready(module)
+        # the same kernel and its filter states continue in the worker process
+        second, more = filter_blocks(module, blocks[count:2 * count])
+        # the parameter update sends a new kernel to the running process
+        configure(module, params, True)
+        third, last = filter_blocks(module, blocks[2 * count:])
+        result[execution] = {'update': update, 'startup': startup, 'output': first + second + third,
+                             'times': more + last, 'process': module._kernel_process != None}
+        module.terminate()
+
+    thread, process = result[Execution.THREAD], result[Execution.PROCESS]
+    return {'identical': len(thread['output']) == len(process['output']) and
+                         all(np.array_equal(a, b) for a, b in zip(thread['output'], process['output'])),
+            'process': process['process'],
+            'update': process['update'],
+            'startup': process['startup'],
+            'thread_ms': 1000.0 * np.median(thread['times']),
+            'process_ms': 1000.0 * np.median(process['times'])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the kernel execution modes of the filter module")
+    parser.add_argument("-r", "--rate", type=float, default=10000.0, help="sampling rate in Hz")
+    parser.add_argument("-c", "--channels", type=int, default=64, help="number of EEG channels")
+    parser.add_argument("-b", "--blocks", type=int, default=40, help="50ms blocks per filter setting")
+    args = parser.parse_args()
+
+    r = run(args.rate, args.channels, args.blocks)
+    ok = r['process'] and r['identical'] and r['update'] < UPDATE_LIMIT
+    print("parameter update (starts the worker process): %.1fms"%(1000.0 * r['update']))
+    print("worker process ready after: %.0fms"%(1000.0 * r['startup']))
+    print("median block time: thread %.2fms, process %.2fms"%(r['thread_ms'], r['process_ms']))
+    print("process output identical to thread output: %s"%(r['identical']))
+    print("ok" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
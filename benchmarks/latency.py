@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+'''
+Acquisition Latency Benchmark
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Runs the amplifier module (amplifier.AMP_ActiChamp) with the simulated
+actiCHamp device through the filter module into a sink for all acquisition
+latency modes (actichamp_w.LATENCY_MODES) and reports the latency / CPU
+trade-off:
+    - sample age: time from the generation of the oldest sample of a block in
+      the simulated device until the block arrives at the sink, includes the
+      block interval
+    - chain latency: time from the device read until the block arrives at
+      the sink (ModuleBase.report_latency())
+    - CPU load of the process (device simulation, USB reader thread,
+      amplifier and filter modules) and blocks per second
+    - input queue high water mark and dropped blocks of all modules
+Before the measurement, several threads report latencies of one sink module
+concurrently (like the RDA client transmit threads) while another thread
+takes metrics snapshots, no latency count and deadline miss may be lost.
+
+Usage: python -m benchmarks.latency [-d seconds] [-r rates] [-m modules]
+                                    [-l modes] [--no-filter]
+'''
+
+import sys, os
+import time
+import argparse
+import threading
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from PyQt4 import Qt
+from modbase import *
+import eventbus
+import actichamp_w
+import metrics
+
+#: acquisition start up time in s, not included in the statistics
+WARMUP_TIME = 1.0
+
+
+class BM_Sink(ModuleBase):
+    ''' Measures the age of the received samples at the end of the chain
+    '''
+    def __init__(self, **keys):
+        ModuleBase.__init__(self, name="Sink", **keys)
+        self.device = None          #: simulated device (champsim.SimulatedChamp)
+        self.ages = []
+        self.blocks = 0
+        self.record = False
+
+    def process_input(self, datablock):
+        self.report_latency(datablock.acquisition_time)
+        if not self.record or self.device == None or datablock.sample_channel.shape[1] == 0:
+            return
+        # the device produces sample counter c at start_time + (c + 1) / rate
+        rate = datablock.sample_rate
+        generated = self.device.start_time + (float(datablock.sample_channel[0][0]) + 1.0) / rate
+        self.ages.append(time.perf_counter() - generated)
+        self.blocks += 1
+
+    def process_output(self):
+        return None
+
+
+def check_concurrent_reports(threads=8, reports=5000):
+    ''' Report latencies of one module from several threads, all of them miss the deadline
+    @return: list of violations
+    '''
+    failures = []
+    notified = []
+    module = ModuleBase(name="Sink")
+    module.metrics.deadline = 0.0
+    eventbus.connect(module, SIGNAL("event(PyQt_PyObject)"),
+                     lambda e: notified.append(e.info) if e.type == EventType.ERROR else None)
+
+    def report():
+        for n in range(reports):
+            module.report_latency(time.perf_counter() - 0.001)
+
+    def snapshots():
+        while any(t.is_alive() for t in reporters):
+            metrics.registry.snapshot()
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    reporters = [threading.Thread(target=report) for n in range(threads)]
+    observer = threading.Thread(target=snapshots)
+    try:
+        for t in reporters + [observer]:
+            t.start()
+        for t in reporters + [observer]:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    eventbus.bus.process_events()
+
+    total = threads * reports
+    snapshot = module.get_metrics()
+    if snapshot['latency_ms']['count'] != total or snapshot['deadline_misses'] != total:
+        failures.append("%d latencies, %d deadline misses of %d reports"%(
+                        snapshot['latency_ms']['count'], snapshot['deadline_misses'], total))
+    # every miss is either notified (first miss or summarized as "(n blocks)") or pending
+    counted = sum(int(info.rsplit("(", 1)[1].split()[0]) if info.endswith("blocks)") else 1
+                  for info in notified)
+    if counted + module._deadline_pending != total:
+        failures.append("%d deadline misses notified or pending of %d"%(
+                        counted + module._deadline_pending, total))
+    module.terminate()
+    return failures
+
+
+def run(mode, rate, modules, duration, filtered=True):
+    ''' Acquire from the simulated device in one latency mode
+    @param mode: block interval in ms
+    @param rate: sampling rate in Hz
+    @param modules: number of simulated EEG modules
+    @param duration: measurement time in s
+    @param filtered: insert the filter module into the chain
+    @return: result dictionary
+    '''
+    from amplifier import AMP_ActiChamp
+    from filter import FLT_Eeg
+    actichamp_w.SIMULATION = "modules=%d"%(modules)
+    actichamp_w.USB_READ_INTERVAL = mode / 1000.0
+    amp = AMP_ActiChamp()
+    sink = BM_Sink()
+    modules = [amp, FLT_Eeg(), sink] if filtered else [amp, sink]
+    for module in modules:
+        module.get_online_configuration()
+    for parent, receiver in zip(modules, modules[1:]):
+        parent.add_receiver(receiver)
+    amp.sample_rate = [r for r in amp.sample_rates if r['value'] == rate][0]
+    errors = []
+    amp.connect(amp, SIGNAL("event(PyQt_PyObject)"),
+                lambda e: errors.append(e.info) if e.type == EventType.ERROR else None)
+    amp.update_receivers()
+    eventbus.bus.process_events()
+
+    amp.parent_event(ModuleEvent("Benchmark", EventType.COMMAND, info="StartRecording"))
+    start = time.perf_counter()
+    while time.perf_counter() - start < WARMUP_TIME:
+        eventbus.bus.process_events(0.01)
+    sink.device = amp.amp.lib
+    sink.record = True
+    start = time.perf_counter()
+    cpu = time.process_time()
+    while time.perf_counter() - start < duration:
+        eventbus.bus.process_events(0.01)
+    sink.record = False
+    cpu = time.process_time() - cpu
+    elapsed = time.perf_counter() - start
+    metrics = [m.get_metrics() for m in modules]
+    amp.stop(force=True)
+    for module in modules:
+        module.terminate()
+    eventbus.bus.process_events()
+
+    ages = 1000.0 * np.array(sink.ages) if sink.ages else np.zeros(1)
+    chain = metrics[-1]['latency_ms']
+    return {'blocks': sink.blocks / elapsed,
+            'age_p50': np.percentile(ages, 50),
+            'age_p99': np.percentile(ages, 99),
+            'age_max': np.max(ages),
+            'chain_p50': chain['p50'],
+            'chain_p99': chain['p99'],
+            'cpu_load': 100.0 * cpu / elapsed,
+            'queue': max(m['queue_high_water'] for m in metrics),
+            'dropped': sum(m['dropped_blocks'] for m in metrics),
+            'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency / CPU trade-off of the acquisition latency modes")
+    parser.add_argument("-d", "--duration", type=float, default=5.0, help="measurement time per mode in s")
+    parser.add_argument("-r", "--rates", type=float, nargs="+", default=[10000.0, 100000.0],
+                        help="sampling rates in Hz")
+    parser.add_argument("-m", "--modules", type=int, default=1, help="simulated EEG modules")
+    parser.add_argument("-l", "--modes", type=int, nargs="+", default=list(actichamp_w.LATENCY_MODES),
+                        help="block intervals in ms")
+    parser.add_argument("--no-filter", action="store_true", help="don't insert the filter module")
+    args = parser.parse_args()
+
+    app = Qt.QApplication.instance() or Qt.QApplication([sys.argv[0]])
+    failures = check_concurrent_reports()
+    print("concurrent latency reports: %s"%("ok" if not failures else "FAIL, " + ", ".join(failures)))
+    failed = len(failures) > 0
+    print("%8s %5s %8s %9s %9s %9s %9s %9s %8s %6s %7s"%("rate", "mode", "blocks/s", "age p50", "age p99",
+          "age max", "chain p50", "chain p99", "CPU [%]", "queue", "dropped"))
+    for rate in args.rates:
+        for mode in args.modes:
+            r = run(mode, rate, args.modules, args.duration, not args.no_filter)
+            ok = r['dropped'] == 0 and r['blocks'] > 0
+            failed |= not ok
+            print("%8.0f %3dms %8.1f %7.1fms %7.1fms %7.1fms %7.1fms %7.1fms %8.1f %6d %7d  %s"%(
+                  rate, mode, r['blocks'], r['age_p50'], r['age_p99'], r['age_max'], r['chain_p50'],
+                  r['chain_p99'], r['cpu_load'], r['queue'], r['dropped'], "ok" if ok else "FAIL"))
+            for e in r['errors'][:5]:
+                print("    %s"%(e))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
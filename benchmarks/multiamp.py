@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+'''
+Multi Amplifier Alignment Check
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Runs the multi amplifier module (multiamp.AMP_MultiChamp) with simulated
+devices. All devices sample the same time base, but every device starts at
+a different time and with a different sample counter, one device drops
+samples. The first EEG channel of every device carries the time base sample
+index, so the merged blocks are aligned if all devices show the same value
+in each sample (dropped samples are replaced by zeros). Variants:
+    - sync: a sync pulse on trigger input 8 of all devices (sync_mask 0x80)
+    - counter: alignment by the first sample counter of every device only,
+      the start time differences remain as channel offset
+
+Usage: python -m benchmarks.multiamp [-n devices] [-r rate] [-c channels]
+                                     [-d seconds] [--drop samples]
+'''
+
+import sys, os
+import time
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from modbase import *
+import eventbus
+
+#: sync pulse bit and pulse length in samples
+SYNC_BIT = 0x80
+SYNC_LENGTH = 10
+
+
+class SIM_Properties(object):
+    ''' Channel properties of a simulated device
+    '''
+    def __init__(self, eeg, aux):
+        self.CountEeg = eeg
+        self.CountAux = aux
+
+
+class SIM_Device(object):
+    ''' Simulated amplifier with the ActiChamp interface subset used by AMP_MultiChamp
+    '''
+    def __init__(self, clock, rate, eeg=32, aux=8, delay=0, counter=0, drop=None):
+        ''' Create the device
+        @param clock: common time base (time.perf_counter() value of sample 0)
+        @param rate: sampling rate in Hz
+        @param eeg: number of EEG channels
+        @param aux: number of AUX channels
+        @param delay: start delay in samples of the time base
+        @param counter: hardware sample counter of the first sample
+        @param drop: tuple(device sample, number of samples) samples lost by the device
+        '''
+        self.properties = SIM_Properties(eeg, aux)
+        self.BlockingMode = False
+        self.clock = clock
+        self.rate = rate
+        self.delay = delay
+        self.counter = counter
+        self.drop = drop
+        self.position = 0           #: next sample of the time base
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def setup(self, mode, rate, div):
+        pass
+
+    def start(self):
+        now = int((time.perf_counter() - self.clock) * self.rate)
+        self.first = now + self.delay   #: time base index of the first device sample
+        self.position = self.first
+
+    def stop(self):
+        pass
+
+    def readConfiguration(self, rate, force=False):
+        pass
+
+    def getSamplingRateBase(self, samplingrate):
+        return (0, 1) if samplingrate == self.rate else (-1, 1)
+
+    def getDeviceStatus(self):
+        return 0, 0
+
+    def setTrigger(self, trigger):
+        pass
+
+    def read(self, indices, eegcount, auxcount, dtype=np.float64):
+        ''' Get the samples up to the current time
+        '''
+        end = int((time.perf_counter() - self.clock) * self.rate)
+        if end <= self.position:
+            return None, None
+        index = np.arange(self.position, end)
+        self.position = end
+        sample = index - self.first
+        if self.drop != None:
+            keep = (sample < self.drop[0]) | (sample >= self.drop[0] + self.drop[1])
+            index = index[keep]
+            sample = sample[keep]
+            if len(index) == 0:
+                return None, None
+        eeg = np.zeros((eegcount + auxcount, len(index)), dtype)
+        eeg[0] = index % (1 << 20)
+        trigger = np.where(index % int(self.rate) < SYNC_LENGTH, SYNC_BIT, 0).astype(np.uint32).reshape(1, -1)
+        counter = (sample + self.counter).astype(np.uint64).reshape(1, -1)
+        return [eeg, trigger, counter], None
+
+
+class SIM_Sink(ModuleBase):
+    ''' Keeps the first channel of every device and the sample counter of the merged blocks
+    '''
+    def __init__(self, rows, **keys):
+        ModuleBase.__init__(self, name="Sink", **keys)
+        self.rows = rows
+        self.blocks = []
+        self.samples = 0
+
+    def process_input(self, datablock):
+        self.blocks.append(np.array(datablock.eeg_channels[self.rows]))
+        self.samples += datablock.sample_channel.shape[1]
+
+    def process_output(self):
+        return None
+
+
+def run(devices, rate, channels, duration, drop, sync):
+    ''' Run the multi amplifier module with simulated devices
+    @return: result dictionary
+    '''
+    from multiamp import AMP_MultiChamp
+    clock = time.perf_counter()
+    sim = [SIM_Device(clock, rate, eeg=channels, delay=37 * d, counter=1000 * d + 5,
+                      drop=(int(rate) + 123, drop) if d == devices - 1 and drop > 0 else None)
+           for d in range(devices)]
+    amp = AMP_MultiChamp(devices=sim, sync_mask=SYNC_BIT if sync else 0)
+    amp.sample_rate = amp.sample_rates[0]
+    sink = SIM_Sink([d * channels for d in range(devices)])
+    amp.add_receiver(sink)
+    errors = []
+    amp.connect(amp, SIGNAL("event(PyQt_PyObject)"),
+                lambda e: errors.append(e.info) if e.type == EventType.ERROR else None)
+    amp.update_receivers()
+    eventbus.bus.process_events()
+
+    amp.start()
+    timeout = time.perf_counter() + duration
+    while time.perf_counter() < timeout:
+        eventbus.bus.process_events(0.01)
+    amp.stop(force=True)
+    eventbus.bus.process_events()
+
+    data = np.concatenate(sink.blocks, 1) if sink.blocks else np.zeros((devices, 0))
+    master = data[0]
+    padded = 0
+    misaligned = 0
+    offsets = []
+    for d in range(1, devices):
+        valid = data[d] != 0
+        padded += int(np.count_nonzero(~valid))
+        misaligned += int(np.count_nonzero(data[d][valid] != master[valid]))
+        offsets.append(int(np.median(master[valid] - data[d][valid])) if np.any(valid) else 0)
+    return {'samples': sink.samples,
+            'channels': len(amp.eeg_data.channel_properties),
+            'padded': padded,
+            'misaligned': misaligned,
+            'offsets': offsets,
+            'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alignment of the multi amplifier module")
+    parser.add_argument("-n", "--devices", type=int, default=3, help="number of simulated devices")
+    parser.add_argument("-r", "--rate", type=float, default=10000.0, help="sampling rate in Hz")
+    parser.add_argument("-c", "--channels", type=int, default=32, help="EEG channels per device")
+    parser.add_argument("-d", "--duration", type=float, default=5.0, help="recording time in s")
+    parser.add_argument("--drop", type=int, default=250, help="samples lost by the last device")
+    args = parser.parse_args()
+
+    failed = False
+    print("%d devices, %.0f Hz, %d EEG + 8 AUX channels each, %d samples dropped by device %d"%(
+          args.devices, args.rate, args.channels, args.drop, args.devices))
+    for sync in (True, False):
+        r = run(args.devices, args.rate, args.channels, args.duration, args.drop, sync)
+        print("%-8s %d samples, %d channels, %d padded, %d misaligned, offsets %s"%(
+              "sync" if sync else "counter", r['samples'], r['channels'], r['padded'],
+              r['misaligned'], r['offsets']))
+        for e in r['errors']:
+            print("         %s"%(e))
+        if sync:
+            ok = r['samples'] > 0 and r['misaligned'] == 0 and r['padded'] == args.drop and \
+                 r['channels'] == args.devices * (args.channels + 8)
+            failed |= not ok
+            print("         %s"%("ok" if ok else "FAIL"))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
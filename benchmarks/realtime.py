@@ -0,0 +1,513 @@
+# -*- coding: utf-8 -*-
+'''
+End-to-End Real-Time-Factor Benchmark
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Drives the module chain of InstantiateModules() (or a subset of it) from a
+synthetic source, which replaces the AMP_ActiChamp module and sends blocks
+like the amplifier does. Sample rates (AMP_SAMPLE_RATES) and channel counts
+are swept, for each configuration the benchmark reports:
+    - real time factor: seconds of signal processed by the whole chain
+      per second of wall time
+    - per module CPU time of the worker thread and busy time
+    - input queue high-water marks and dropped blocks
+    - minor page faults per block and sample array pool misses (bufpool)
+    - acquisition to sink latency percentiles and deadline misses of the
+      storage, RDA server and display modules
+
+Two source modes are available:
+    - free running (default): the source sends blocks as fast as the chain
+      accepts them (all queues use Backpressure.BLOCK), the real time factor
+      is the processing capacity of the chain
+    - paced (--paced): the source sends blocks in real time like the hardware,
+      queues use the module defaults and overruns are counted
+
+Storage writes into a temporary folder, the RDA server gets a local client
+which receives and discards the data. Results are written as JSON and can
+be compared with the results of a previous release (--compare).
+
+Usage: python -m benchmarks.realtime [-r rates] [-c channels] [-m modules]
+                                     [-d seconds] [--paced] [-o results.json]
+                                     [--compare baseline.json]
+'''
+
+import sys, os
+import re
+import time
+import json
+import shutil
+import socket
+import platform
+import datetime
+import tempfile
+import argparse
+import importlib
+import threading
+try:
+    import resource
+except ImportError:
+    resource = None     # page faults are not available on Windows
+
+# the benchmark has no main window, module events are delivered by the event bus
+os.environ.setdefault("PYCORDER_HEADLESS", "1")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modbase import *
+import modbase
+import eventbus
+import bufpool
+from bufpool import pool
+
+
+#: modules of the actiCHamp recorder chain (InstantiateModules), without the amplifier
+#: key, python module, class name
+CHAIN = [("montage",   "montage",                  "MNT_Recording"),
+         ("trigger",   "trigger",                  "TRG_Eeg"),
+         ("storage",   "storage",                  "StorageVision"),
+         ("filter",    "filter",                   "FLT_Eeg"),
+         ("dcoffset",  "custom_modules.dc_offset", "dc_offset"),
+         ("rda",       "rda_server",               "RDA_Server"),
+         ("impedance", "impedance",                "IMP_Display"),
+         ("display",   "display",                  "DISP_Scope")]
+
+#: default channel counts (EEG channels, 8 AUX channels are added)
+CHANNELS = [32, 64, 128, 160]
+
+#: maximum drain time in s after the last block, paced mode only
+LAG_LIMIT = 0.5
+
+#: abort a configuration if the chain makes no progress for this time in s
+STALL_TIMEOUT = 10.0
+
+
+def max_eeg_channels(rate):
+    ''' Get the number of EEG channels supported by the hardware at a sampling rate
+    (see ActiChamp.setup(), 32 channels per EEG module)
+    @param rate: sampling rate in Hz
+    '''
+    if rate >= 100000.0:
+        return 32
+    if rate >= 50000.0:
+        return 64
+    if rate >= 25000.0:
+        return 128
+    return 160
+
+
+class BM_Source(ModuleBase):
+    ''' Synthetic amplifier, sends blocks like AMP_ActiChamp in normal recording mode
+    '''
+    def __init__(self, eeg, aux, rate, duration, interval=0.05, paced=False, **keys):
+        ''' Create the source
+        @param eeg: number of EEG channels
+        @param aux: number of AUX channels
+        @param rate: sampling rate in Hz
+        @param duration: total signal duration in s
+        @param interval: block interval in s (amplifier read interval)
+        @param paced: send blocks in real time, else as fast as possible
+        '''
+        ModuleBase.__init__(self, name="Amplifier", **keys)
+        self.rate = rate
+        self.paced = paced
+        self.interval = interval
+        self.block_samples = max(int(rate * interval), 1)
+        self.total_samples = int(rate * duration) // self.block_samples * self.block_samples
+
+        self.eeg_data = EEG_DataBlock(eeg, aux)
+        self.eeg_data.sample_rate = rate
+        self.eeg_data.recording_mode = RecordingMode.NORMAL
+
+        # channel signals: sine waves from 1Hz on, µV range
+        t = np.arange(self.block_samples) / rate
+        freq = np.arange(1, eeg + aux + 1).reshape(-1, 1)
+        self._template = (100.0 * np.sin(2.0 * np.pi * freq * t)).astype(sample_type())
+        self._counter = np.arange(self.block_samples, dtype=np.uint64)
+
+        self.first_time = None      #: time of the first block
+        self.done_time = None       #: time of the last block
+
+    def process_update(self, params):
+        return copy.copy(self.eeg_data)
+
+    def process_start(self):
+        self.eeg_data.sample_counter = 0
+        self.start_time = datetime.datetime.now()
+        self.first_time = None
+        self.done_time = None
+
+    def process_output(self):
+        counter = self.eeg_data.sample_counter
+        if counter >= self.total_samples:
+            return None
+        if self.paced and self.first_time != None and \
+           time.perf_counter() < self.first_time + counter / self.rate:
+            return None
+        if self.first_time == None:
+            self.first_time = time.perf_counter()
+
+        # sample arrays from the pool like ActiChamp.read()
+        n = self.block_samples
+        self.eeg_data.eeg_channels = pool.empty(self._template.shape, self._template.dtype)
+        self.eeg_data.eeg_channels[:] = self._template
+        self.eeg_data.trigger_channel = pool.empty((1, n), np.uint32)
+        self.eeg_data.trigger_channel.fill(0)
+        # the amplifier skips the first blocks after start, counters never start at 0
+        first = counter + 5 * n
+        self.eeg_data.sample_channel = pool.empty((1, n), np.uint64)
+        self.eeg_data.sample_channel[0] = self._counter
+        self.eeg_data.sample_channel += np.uint64(first)
+        # one trigger per second
+        second = (first + n - 1) // int(self.rate) * int(self.rate)
+        if second >= first:
+            self.eeg_data.trigger_channel[0, second - first] = 1
+        self.eeg_data.sample_counter += n
+        self.eeg_data.block_time = self.start_time + datetime.timedelta(seconds=counter / self.rate)
+        self.eeg_data.acquisition_time = time.perf_counter()
+        if self.eeg_data.sample_counter >= self.total_samples:
+            self.done_time = time.perf_counter()
+        return copy.copy(self.eeg_data)
+
+    def process_idle(self):
+        if self.eeg_data.sample_counter >= self.total_samples:
+            self.wait_for_wakeup(0.1)
+        elif self.paced and self.first_time != None:
+            delay = self.first_time + self.eeg_data.sample_counter / self.rate - time.perf_counter()
+            if delay > 0:
+                self.wait_for_wakeup(delay)
+
+
+class RDA_Sink(object):
+    ''' RDA client which receives and discards the data
+    '''
+    def __init__(self, port):
+        self.received = 0
+        self._sock = socket.create_connection(("localhost", port), 5.0)
+        self._running = True
+        self._thread = threading.Thread(target=self._receive)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _receive(self):
+        self._sock.settimeout(0.2)
+        # receive into a fixed buffer, the client doesn't count into the page faults
+        buffer = bytearray(1 << 20)
+        while self._running:
+            try:
+                received = self._sock.recv_into(buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not received:
+                break
+            self.received += received
+
+    def close(self):
+        self._running = False
+        self._thread.join(2.0)
+        self._sock.close()
+
+
+def page_faults():
+    ''' Get the number of minor page faults of the process, None if not available
+    '''
+    if resource == None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+
+
+def pycorder_version():
+    ''' Get the application version without importing the main window module
+    '''
+    try:
+        main = open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")).read()
+        return re.search(r'__version__\s*=\s*"([^"]*)"', main).group(1)
+    except Exception:
+        return "unknown"
+
+
+class Benchmark(object):
+    ''' Build, run and measure module chains
+    '''
+    def __init__(self, modules, duration, interval, paced, rda_clients):
+        ''' Benchmark settings
+        @param modules: list of CHAIN keys
+        @param duration: signal duration per configuration in s
+        @param interval: source block interval in s
+        @param paced: send blocks in real time
+        @param rda_clients: number of connected RDA clients
+        '''
+        self.modules = modules
+        self.duration = duration
+        self.interval = interval
+        self.paced = paced
+        self.rda_clients = rda_clients
+        self.errors = []
+
+    def _event(self, event):
+        if event.type == EventType.ERROR:
+            self.errors.append("%s: %s"%(event.module, event.info))
+
+    def _build(self, folder):
+        ''' Instantiate the selected chain modules
+        @param folder: storage folder
+        @return: list of (key, module object), list of (key, error message)
+        '''
+        chain = []
+        skipped = []
+        for key, modulename, classname in CHAIN:
+            if key not in self.modules:
+                continue
+            try:
+                module_class = getattr(importlib.import_module(modulename), classname)
+                module = module_class()
+                # some modules keep their state in the online configuration pane,
+                # create the panes like the main window does, they are never shown
+                module.get_online_configuration()
+                if key == "storage":
+                    module.default_path = folder
+                chain.append((key, module))
+            except Exception as e:
+                skipped.append((key, "%s: %s"%(type(e).__name__, e)))
+        return chain, skipped
+
+    def run(self, rate, eeg, aux=8):
+        ''' Measure one configuration
+        @param rate: sampling rate in Hz
+        @param eeg: number of EEG channels
+        @param aux: number of AUX channels
+        @return: result dictionary
+        '''
+        modbase.DEFAULT_BACKPRESSURE = Backpressure.DROP_NEWEST if self.paced else Backpressure.BLOCK
+        folder = tempfile.mkdtemp(prefix="pycorder_bm_")
+        self.errors = []
+        source = BM_Source(eeg, aux, rate, self.duration, self.interval, self.paced)
+        chain, skipped = self._build(folder)
+        modules = [source] + [module for key, module in chain]
+        for parent, receiver in zip(modules, modules[1:]):
+            parent.add_receiver(receiver)
+        source.connect(source, SIGNAL("event(PyQt_PyObject)"), self._event)
+        source.update_receivers()
+        eventbus.bus.process_events()
+
+        sinks = []
+        pool_start = pool.get_statistics()
+        faults = page_faults()
+        cpu = time.process_time()
+        try:
+            source.start()
+            if "storage" in self.modules:
+                source.parent_event(ModuleEvent("Benchmark", EventType.COMMAND,
+                                                info="StartSaving", cmd_value="benchmark"))
+            if "rda" in self.modules:
+                port = [m for k, m in chain if k == "rda"][0].PORT
+                sinks = [RDA_Sink(port) for c in range(self.rda_clients)]
+            finished = self._wait(source, modules[1:])
+            snapshots = [m.get_metrics() for m in modules]
+            cpu = time.process_time() - cpu
+            if faults != None:
+                faults = page_faults() - faults
+            pool_end = pool.get_statistics()
+        finally:
+            source.stop()
+            for sink in sinks:
+                sink.close()
+            for module in modules:
+                module.terminate()
+            eventbus.bus.process_events()
+            shutil.rmtree(folder, ignore_errors=True)
+
+        signal_time = source.total_samples / rate
+        start = source.first_time if source.first_time != None else time.perf_counter()
+        elapsed = max(finished - start, 1e-9)
+        dropped = sum(s['dropped_blocks'] for s in snapshots)
+        blocks = max(source.total_samples // source.block_samples, 1)
+        rtf = signal_time / elapsed
+        if self.paced:
+            lag = finished - (source.done_time or finished)
+            realtime = dropped == 0 and lag <= LAG_LIMIT
+        else:
+            lag = None
+            realtime = dropped == 0 and rtf >= 1.0
+        return {'rate': rate,
+                'eeg': eeg,
+                'aux': aux,
+                'block_samples': source.block_samples,
+                'signal_time': signal_time,
+                'elapsed': elapsed,
+                'rtf': rtf,
+                'lag': lag,
+                'realtime': realtime,
+                'completed': source.done_time != None and all(
+                    s['samples_in'] + s['dropped_samples'] >= source.total_samples
+                    for s in snapshots[1:]),
+                'process_cpu_load': 100.0 * cpu / elapsed,
+                'dropped_blocks': dropped,
+                'page_faults_per_block': None if faults == None else faults / blocks,
+                'pool_enabled': bufpool.ENABLED,
+                'pool_misses': (pool_end['allocations'] - pool_start['allocations'] +
+                                pool_end['overflows'] - pool_start['overflows']),
+                'pool_bytes': pool_end['bytes'],
+                'modules': [dict(s, key=key) for key, s in
+                            zip(["source"] + [k for k, m in chain], snapshots)],
+                'skipped': [{'key': k, 'error': e} for k, e in skipped],
+                'errors': self.errors[:20]}
+
+    def _wait(self, source, modules):
+        ''' Deliver module events until all modules got all samples or the chain stalls
+        @return: time when the last module got the last sample
+        '''
+        progress = -1
+        progress_time = time.perf_counter()
+        while True:
+            eventbus.bus.process_events(0.002)
+            now = time.perf_counter()
+            counts = [m.metrics.samples_in + m.metrics.dropped_samples for m in modules]
+            if source.done_time != None and all(c >= source.total_samples for c in counts):
+                return now
+            total = sum(counts) + source.eeg_data.sample_counter
+            if total != progress:
+                progress = total
+                progress_time = now
+            elif now - progress_time > STALL_TIMEOUT:
+                return now
+
+
+def compare(results, baseline):
+    ''' Print the real time factors of matching configurations of two result sets
+    @param results: current result dictionary
+    @param baseline: previous result dictionary
+    '''
+    previous = dict(((r['rate'], r['eeg']), r) for r in baseline['results'])
+    print("\ncompared with %s (%s)"%(baseline.get('version'), baseline.get('time')))
+    if baseline.get('mode') != results['mode'] or baseline.get('chain') != results['chain'] or \
+       baseline.get('sample_type', "float64") != results['sample_type']:
+        print("warning: different mode or chain (%s, %s: %s)"%(baseline.get('mode'),
+                                                              baseline.get('sample_type', "float64"),
+                                                              ",".join(baseline.get('chain', []))))
+    print("%8s %5s %10s %10s %8s"%("rate", "eeg", "RTF old", "RTF new", "change"))
+    for r in results['results']:
+        p = previous.get((r['rate'], r['eeg']))
+        if p == None:
+            continue
+        change = 100.0 * (r['rtf'] / p['rtf'] - 1.0) if p['rtf'] > 0 else 0.0
+        print("%8.0f %5d %10.2f %10.2f %+7.1f%%"%(r['rate'], r['eeg'], p['rtf'], r['rtf'], change))
+
+
+def main():
+    from amplifier import AMP_SAMPLE_RATES
+    keys = [key for key, m, c in CHAIN]
+    parser = argparse.ArgumentParser(description="Real time factor of the acquisition chain")
+    parser.add_argument("-r", "--rates", type=float, nargs="+", default=AMP_SAMPLE_RATES,
+                        help="sampling rates in Hz")
+    parser.add_argument("-c", "--channels", type=int, nargs="+", default=CHANNELS,
+                        help="EEG channel counts")
+    parser.add_argument("-m", "--modules", default=",".join(keys),
+                        help="comma separated chain modules (%s)"%(",".join(keys)))
+    parser.add_argument("-d", "--duration", type=float, default=10.0,
+                        help="signal duration per configuration in s")
+    parser.add_argument("-i", "--interval", type=float, default=0.05, help="block interval in s")
+    parser.add_argument("--paced", action="store_true", help="send blocks in real time")
+    parser.add_argument("--rda-clients", type=int, default=1, help="number of RDA clients")
+    parser.add_argument("--float32", action="store_true",
+                        help="process the channel data in single precision")
+    parser.add_argument("--no-pool", action="store_true",
+                        help="allocate the sample arrays without the array pool")
+    parser.add_argument("--all", action="store_true",
+                        help="include channel counts not supported by the hardware at a rate")
+    parser.add_argument("-o", "--output", help="write results to a JSON file")
+    parser.add_argument("--compare", help="compare with the JSON results of a previous run")
+    args = parser.parse_args()
+
+    modules = [m.strip() for m in args.modules.split(",") if m.strip()]
+    unknown = [m for m in modules if m not in keys]
+    if unknown:
+        parser.error("unknown modules: %s"%(",".join(unknown)))
+
+    bufpool.ENABLED = not args.no_pool
+    if args.float32:
+        modbase.set_sample_type(np.float32)
+
+    from PyQt4 import Qt
+    app = Qt.QApplication.instance() or Qt.QApplication([sys.argv[0]])
+
+    benchmark = Benchmark(modules, args.duration, args.interval, args.paced, args.rda_clients)
+    results = {'benchmark': "realtime",
+               'version': pycorder_version(),
+               'time': datetime.datetime.now().isoformat(),
+               'python': platform.python_version(),
+               'numpy': np.__version__,
+               'platform': platform.platform(),
+               'processor': platform.processor(),
+               'cpus': os.cpu_count(),
+               'mode': "paced" if args.paced else "free",
+               'duration': args.duration,
+               'interval': args.interval,
+               'pool': bufpool.ENABLED,
+               'sample_type': sample_type().name,
+               'chain': modules,
+               'results': []}
+
+    print("%s mode, %s, %.0fs per configuration, chain: %s"%(results['mode'], results['sample_type'],
+                                                             args.duration, " > ".join(["source"] + modules)))
+    print("%8s %5s %8s %8s %8s %8s %8s %6s  %s"%("rate", "eeg", "RTF", "CPU [%]", "dropped",
+                                                 "maxqueue", "PF/block", "misses", "busiest module (CPU %)"))
+    reported = set()
+    for rate in args.rates:
+        for eeg in args.channels:
+            if eeg > max_eeg_channels(rate) and not args.all:
+                continue
+            r = benchmark.run(rate, eeg)
+            results['results'].append(r)
+            busiest = max(r['modules'], key=lambda m: m['cpu_load'])
+            faults = r['page_faults_per_block']
+            print("%8.0f %5d %8.2f %8.1f %8d %8d %8s %6s  %s (%.1f)%s"%(
+                  rate, eeg, r['rtf'], r['process_cpu_load'], r['dropped_blocks'],
+                  max(m['queue_high_water'] for m in r['modules']),
+                  "-" if faults == None else "%.1f"%(faults),
+                  "%d"%(r['pool_misses']) if r['pool_enabled'] else "off",
+                  busiest['key'], busiest['cpu_load'],
+                  "" if r['completed'] else "  INCOMPLETE"))
+            for m in r['modules']:
+                latency = m['latency_ms']
+                if latency['count'] > 0:
+                    print("         latency %s: p50 %.1fms, p99 %.1fms, max %.1fms, %d deadline misses"%(
+                          m['key'], latency['p50'], latency['p99'], latency['max'], m['deadline_misses']))
+            for s in r['skipped']:
+                if s['key'] not in reported:
+                    reported.add(s['key'])
+                    print("         skipped %s: %s"%(s['key'], s['error']))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
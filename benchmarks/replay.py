@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+'''
+BrainVision Replay Benchmark
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Replays a BrainVision data set (replay.REP_Vision) through the trigger,
+storage and filter modules and measures the replay speed. Without a data set
+(-f) a synthetic recording with one stimulus marker per second is created.
+
+The storage module records the replayed data again, the new recording has
+to be identical to the replayed one (channel data and markers), which checks
+that the replay is lossless.
+
+Usage: python -m benchmarks.replay [-f file.vhdr] [-r rate] [-c channels]
+                                   [-d seconds] [--realtime]
+'''
+
+import sys, os
+import time
+import shutil
+import argparse
+import datetime
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from PyQt4 import Qt
+from modbase import *
+import eventbus
+
+#: abort if the chain makes no progress for this time in s
+STALL_TIMEOUT = 10.0
+
+
+def write_vision(folder, rate, channels, duration):
+    ''' Create a synthetic BrainVision data set like the storage module writes it
+    @return: header file name
+    '''
+    samples = int(rate * duration)
+    t = np.arange(samples) / rate
+    freq = np.arange(1, channels + 1).reshape(-1, 1)
+    data = (100.0 * np.sin(2.0 * np.pi * freq * t)).astype(np.float32)
+    data[:, ::97] += 0.25               # not only smooth values
+    name = os.path.join(folder, "replay_source")
+    data.T.tofile(name + ".eeg")
+    with open(name + ".vhdr", "w", encoding="utf-8") as f:
+        f.write("Brain Vision Data Exchange Header File Version 1.0\n\n[Common Infos]\n"
+                "Codepage=UTF-8\nDataFile=replay_source.eeg\nMarkerFile=replay_source.vmrk\n"
+                "DataFormat=BINARY\nDataOrientation=MULTIPLEXED\nNumberOfChannels=%d\n"
+                "SamplingInterval=%g\n\n[Binary Infos]\nBinaryFormat=IEEE_FLOAT_32\n\n"
+                "[Channel Infos]\n"%(channels, 1e6 / rate))
+        for c in range(channels):
+            f.write("Ch%d=Ch%d,,1.0,µV\n"%(c + 1, c + 1))
+    with open(name + ".vmrk", "w", encoding="utf-8") as f:
+        f.write("Brain Vision Data Exchange Marker File, Version 1.0\n\n[Common Infos]\n"
+                "Codepage=UTF-8\nDataFile=replay_source.eeg\n\n[Marker Infos]\n")
+        f.write("Mk1=New Segment,,1,1,0,%s\n"%(datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")))
+        for m, position in enumerate(range(int(rate) // 2, samples, int(rate))):
+            f.write("Mk%d=Stimulus,S%3d,%d,1,0\n"%(m + 2, m % 16 + 1, position + 1))
+    return name + ".vhdr"
+
+
+class BM_Sink(ModuleBase):
+    ''' Counts the samples and markers at the end of the chain
+    '''
+    def __init__(self, **keys):
+        ModuleBase.__init__(self, name="Sink", **keys)
+        self.samples = 0
+        self.markers = 0
+
+    def process_input(self, datablock):
+        self.samples += datablock.sample_channel.shape[1]
+        self.markers += len(datablock.markers)
+
+    def process_output(self):
+        return None
+
+
+def compare_recordings(source, copy):
+    ''' Compare channel data and markers of two data sets
+    @return: list of differences
+    '''
+    from replay import read_vision_header, read_vision_markers
+    differences = []
+    a = read_vision_header(source)
+    b = read_vision_header(copy)
+    da = np.fromfile(a['data_file'], a['dtype'])
+    db = np.fromfile(b['data_file'], b['dtype'])
+    if da.shape != db.shape:
+        differences.append("data size %d != %d"%(db.size, da.size))
+    elif not np.array_equal(da, db):
+        differences.append("%d samples differ"%(np.count_nonzero(da != db)))
+    ma = [(m.type, m.description, m.position) for m in read_vision_markers(a['marker_file'])[1:]]
+    mb = [(m.type, m.description, m.position) for m in read_vision_markers(b['marker_file'])[1:]]
+    if ma != mb:
+        differences.append("markers differ (%d / %d)"%(len(mb), len(ma)))
+    return differences
+
+
+def run(filename, realtime, folder):
+    ''' Replay a data set through trigger, storage and filter
+    @return: result dictionary
+    '''
+    from replay import REP_Vision
+    from trigger import TRG_Eeg
+    from storage import StorageVision
+    from filter import FLT_Eeg
+    source = REP_Vision(filename, realtime=realtime)
+    modules = [source, TRG_Eeg(), StorageVision(), FLT_Eeg(), BM_Sink()]
+    for module in modules:
+        module.get_online_configuration()
+    modules[2].default_path = folder
+    for parent, receiver in zip(modules, modules[1:]):
+        parent.add_receiver(receiver)
+    errors = []
+    source.connect(source, SIGNAL("event(PyQt_PyObject)"),
+                   lambda e: errors.append(e.info) if e.type == EventType.ERROR else None)
+    source.update_receivers()
+    eventbus.bus.process_events()
+
+    sink = modules[-1]
+    total = source.samples.shape[0]
+    # open the new recording before the first block is sent
+    source.parent_event(ModuleEvent("Benchmark", EventType.COMMAND, info="StartSaving", cmd_value="replay_copy"))
+    eventbus.bus.process_events()
+    start = time.perf_counter()
+    source.start()
+    progress, progress_time = -1, start
+    while sink.samples < total:
+        eventbus.bus.process_events(0.01)
+        now = time.perf_counter()
+        if sink.samples != progress:
+            progress, progress_time = sink.samples, now
+        elif now - progress_time > STALL_TIMEOUT:
+            break
+    elapsed = time.perf_counter() - start
+    source.stop(force=True)
+    for module in modules:
+        module.terminate()
+    eventbus.bus.process_events()
+    return {'samples': sink.samples,
+            'total': total,
+            'markers': sink.markers,
+            'rtf': total / source.data.sample_rate / elapsed,
+            'dropped': sum(m.get_metrics()['dropped_blocks'] for m in modules),
+            'differences': compare_recordings(filename, os.path.join(folder, "replay_copy.vhdr")),
+            'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a BrainVision data set through the module chain")
+    parser.add_argument("-f", "--file", default=None, help="BrainVision header file (.vhdr)")
+    parser.add_argument("-r", "--rate", type=float, default=10000.0, help="synthetic data set sampling rate in Hz")
+    parser.add_argument("-c", "--channels", type=int, default=64, help="synthetic data set channels")
+    parser.add_argument("-d", "--duration", type=float, default=30.0, help="synthetic data set length in s")
+    parser.add_argument("--realtime", action="store_true", help="replay in real time")
+    args = parser.parse_args()
+
+    app = Qt.QApplication.instance() or Qt.QApplication([sys.argv[0]])
+    folder = tempfile.mkdtemp(prefix="pycorder_replay_")
+    try:
+        filename = args.file or write_vision(folder, args.rate, args.channels, args.duration)
+        r = run(filename, args.realtime, folder)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    print("%s: %d of %d samples, %d markers, %.1f x real time, %d dropped blocks"%(
+          os.path.split(filename)[1], r['samples'], r['total'], r['markers'], r['rtf'], r['dropped']))
+    for e in r['errors'][:10]:
+        print("    %s"%(e))
+    for d in r['differences']:
+        print("    re-recorded data set: %s"%(d))
+    ok = r['samples'] == r['total'] and r['dropped'] == 0 and not r['differences']
+    print("ok" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+'''
+Ring Buffer Transport Check
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Sends numbered data blocks through the shared memory ring buffer transport
+(Transport.RING) to two receivers and checks the received sample data:
+    - fast: takes each block right after it was sent and keeps all blocks
+      until the producer has lapped the ring several times, the kept
+      blocks must still hold the sent samples
+    - slow: takes its blocks only at the end, it falls behind by more than
+      a full lap, the overwritten blocks must be reported as lost and the
+      remaining blocks must be intact
+    - the block returned by the producer's process_output() must not be
+      modified by the transport
+
+Usage: python -m benchmarks.ringtransport [-l laps] [-s samples] [-c channels]
+'''
+
+import sys, os
+import argparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import modbase
+from modbase import *
+
+#: sampling rate of the test blocks in Hz, the ring holds RING_BUFFER_SECONDS of data
+RATE = 1000.0
+
+
+def create_block(number, channels, samples):
+    ''' Create a data block with sample values derived from the block number
+    '''
+    block = EEG_DataBlock(channels, 0)
+    counter = np.arange(number * samples, (number + 1) * samples, dtype=np.uint64)
+    block.eeg_channels = counter.reshape(1, -1) + np.arange(channels).reshape(-1, 1) * 0.5
+    block.trigger_channel = (counter % 7).astype(np.uint32).reshape(1, -1)
+    block.sample_channel = counter.reshape(1, -1)
+    block.sample_rate = RATE
+    return block
+
+
+def intact(block, number, channels, samples):
+    ''' Check the sample data of a received block against the sent values
+    @param number: number of the sent block
+    '''
+    sent = create_block(number, channels, samples)
+    return np.array_equal(block.eeg_channels, sent.eeg_channels) and \
+           np.array_equal(block.trigger_channel, sent.trigger_channel) and \
+           np.array_equal(block.sample_channel, sent.sample_channel)
+
+
+def take(receiver):
+    ''' Take all blocks from the receiver input queue
+    @return: list of resolved blocks, None for lost blocks
+    '''
+    blocks = []
+    while not receiver._input_queue.empty():
+        blocks.append(receiver._receive_block(receiver._input_queue.get_nowait())[0])
+    return blocks
+
+
+def run(laps, samples, channels):
+    ''' Send blocks for the given number of ring laps
+    @return: result dictionary
+    '''
+    modbase.RING_BUFFER_SECONDS = 1.0
+    producer = ModuleBase(name="Producer", transport=Transport.RING)
+    total = int(laps * RATE) // samples
+    fast = ModuleBase(name="Fast", queuesize=total + 1)
+    slow = ModuleBase(name="Slow", queuesize=total + 1)
+    producer.add_receiver(fast)
+    producer.add_receiver(slow)
+
+    kept = []
+    unchanged = True
+    for number in range(total):
+        block = create_block(number, channels, samples)
+        arrays = (block.eeg_channels, block.trigger_channel, block.sample_channel)
+        if not producer._transmit_ring(block):
+            raise Exception("block not transported by ring buffer")
+        unchanged &= all(a is b for a, b in zip(arrays, (block.eeg_channels, block.trigger_channel,
+                                                         block.sample_channel)))
+        kept.extend(take(fast))
+    late = take(slow)
+
+    overruns = dict((name, (lost, blocks)) for name, lost, blocks in producer.get_ring_overruns())
+    received = [b for b in late if b != None]
+    result = {'blocks': total,
+              'capacity': producer._ring.capacity,
+              'unchanged': unchanged,
+              'fast': len([b for b in kept if b != None]),
+              'fast_intact': all(b != None and intact(b, n, channels, samples) for n, b in enumerate(kept)),
+              'slow': len(received),
+              'slow_lost': overruns["Slow"][1],
+              'slow_intact': all(intact(b, total - len(received) + n, channels, samples)
+                                 for n, b in enumerate(received))}
+    del kept, late, received
+    producer._close_rings()
+    for module in (producer, fast, slow):
+        module.terminate()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the ring buffer transport")
+    parser.add_argument("-l", "--laps", type=float, default=3.5, help="ring buffer laps")
+    parser.add_argument("-s", "--samples", type=int, default=50, help="samples per block")
+    parser.add_argument("-c", "--channels", type=int, default=8, help="number of channels")
+    args = parser.parse_args()
+
+    r = run(args.laps, args.samples, args.channels)
+    # the slow receiver can only get the blocks of the last lap
+    expected = r['capacity'] // args.samples
+    ok = r['unchanged'] and r['fast'] == r['blocks'] and r['fast_intact'] and r['slow_intact'] and \
+         r['slow'] <= expected and r['slow'] + r['slow_lost'] == r['blocks']
+    print("%d blocks, ring capacity %d samples"%(r['blocks'], r['capacity']))
+    print("producer block unchanged: %s"%(r['unchanged']))
+    print("fast receiver: %d blocks kept, intact %s"%(r['fast'], r['fast_intact']))
+    print("slow receiver: %d blocks, %d lost, intact %s"%(r['slow'], r['slow_lost'], r['slow_intact']))
+    print("ok" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+'''
+Worker Thread Scheduling Benchmark
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Compares the polling worker thread loop (1ms sleep) with the event driven
+scheduling of ModuleBase and with inline execution of all modules in the
+worker thread of the first module. A chain of pass through modules is
+measured for:
+    - process CPU time while the chain is idle
+    - per hop latency of blocks travelling through the chain
+    - number of running threads
+
+Usage: python -m benchmarks.scheduling [-m modules] [-d idle seconds] [-b blocks]
+'''
+
+import sys, os
+import time
+import copy
+import argparse
+import threading
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modbase import *
+
+
+#: send time of the test blocks, indexed by block sample counter
+send_times = {}
+
+
+class BM_PassThrough(ModuleBase):
+    ''' Pass through module, optionally stamps the arrival time of each block
+    '''
+    def __init__(self, eventdriven, sink=False, **keys):
+        ModuleBase.__init__(self, name="Pass Through", eventdriven=eventdriven, **keys)
+        self.data = None
+        self.dataavailable = False
+        self.sink = sink
+        self.arrivals = []
+
+    def process_input(self, datablock):
+        if self.sink:
+            self.arrivals.append(time.perf_counter() - send_times[datablock.sample_counter])
+        self.dataavailable = True
+        self.data = datablock
+
+    def process_output(self):
+        if not self.dataavailable:
+            return None
+        self.dataavailable = False
+        return self.data
+
+
+def build_chain(modules, eventdriven, inline=False):
+    ''' Create a linear chain of pass through modules
+    @param modules: number of modules
+    @param eventdriven: worker thread scheduling mode
+    @param inline: execute all modules except the first one inline
+    @return: list of modules, last module is the sink
+    '''
+    chain = [BM_PassThrough(eventdriven, sink=(m == modules-1), instance=m, inline=(inline and m > 0))
+             for m in range(modules)]
+    for m in range(1, modules):
+        chain[m-1].add_receiver(chain[m])
+    return chain
+
+
+def measure(modules, eventdriven, inline, idletime, blocks, interval):
+    ''' Measure idle CPU load and per hop latency for one scheduling mode
+    @return: tuple(idle cpu load in %, median hop latency in us, max hop latency in us,
+    number of threads)
+    '''
+    chain = build_chain(modules, eventdriven, inline)
+    threads = threading.active_count()
+    chain[0].start()
+    time.sleep(0.2)             # let the threads settle
+    threads = threading.active_count() - threads
+
+    # idle CPU load
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    time.sleep(idletime)
+    cpu_load = 100.0 * (time.process_time() - cpu) / (time.perf_counter() - wall)
+
+    # feed blocks into the first module like a hardware source would do
+    block = EEG_DataBlock(32, 8)
+    for b in range(blocks):
+        eeg = copy.copy(block)
+        eeg.sample_counter = b
+        send_times[b] = time.perf_counter()
+        chain[0]._transmit_data(eeg)
+        time.sleep(interval)
+    time.sleep(0.5)
+    chain[0].stop()
+
+    hops = np.array(chain[-1].arrivals) / modules * 1e6
+    if len(hops) == 0:
+        return cpu_load, np.nan, np.nan, threads
+    return cpu_load, np.median(hops), np.max(hops), threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare polling and event driven module scheduling")
+    parser.add_argument("-m", "--modules", type=int, default=9, help="number of modules in the chain")
+    parser.add_argument("-d", "--idle", type=float, default=3.0, help="idle measurement time in s")
+    parser.add_argument("-b", "--blocks", type=int, default=100, help="number of latency test blocks")
+    parser.add_argument("-i", "--interval", type=float, default=0.05, help="block interval in s")
+    args = parser.parse_args()
+
+    print("%d modules, %.1fs idle, %d blocks every %.0fms"%(args.modules, args.idle,
+                                                         args.blocks, args.interval*1000))
+    print("%-14s %12s %16s %16s %8s"%("scheduling", "idle CPU [%]", "hop median [us]",
+                                       "hop max [us]", "threads"))
+    for name, eventdriven, inline in (("polling", False, False),
+                                      ("event driven", True, False),
+                                      ("inline", True, True)):
+        cpu, median, maximum, threads = measure(args.modules, eventdriven, inline, args.idle,
+                                                args.blocks, args.interval)
+        print("%-14s %12.1f %16.0f %16.0f %8d"%(name, cpu, median, maximum, threads))
+
+
+if __name__ == '__main__':
+    main()
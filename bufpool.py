@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+'''
+Sample Array Pool
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Reusable sample arrays for the data blocks of the acquisition hot path.
+
+Every block carries freshly allocated sample arrays, which are released
+again after the last module of the chain is done with the block. Large
+arrays are mapped and unmapped by the C library for each block, the page
+faults and the allocator load add up during long recordings.
+
+The pool keeps the buffers it handed out. Each array is handed out through
+a lease object which exports the buffer memory, the array and all views of
+it (block slices, rechunked blocks, shared copies of the block) reference
+the lease. A finalizer of the lease returns the buffer to the pool when the
+last consumer drops the block. Modules don't have to release anything
+explicitly, an array which is kept by a consumer (e.g. the last impedance
+block of the storage module) is simply not reused.
+
+Buffers are grouped by dtype and size class, the returned arrays are
+C-contiguous views of the requested shape, so blocks with a varying number
+of samples share the same buffers.
+'''
+
+import ctypes
+import threading
+import weakref
+import numpy as np
+
+
+# use the pool, False = plain numpy allocation (e.g. for comparison)
+ENABLED = True
+
+# maximum number of buffers per dtype and size class
+MAX_BUFFERS = 32
+
+
+def size_class(size):
+    ''' Get the buffer size for a number of items, sizes are rounded up
+    to 1/8 of the next power of two (at most 12.5% unused items)
+    @param size: number of items
+    @return: buffer size in items
+    '''
+    if size <= 64:
+        return 64
+    step = (1 << (size - 1).bit_length()) >> 3
+    return (size + step - 1) // step * step
+
+
+class ArrayPool(object):
+    ''' Allocator for sample arrays, buffers are reused when all users have released them
+    '''
+    def __init__(self):
+        # buffers are released by finalizers, which may run in any thread
+        self._lock = threading.RLock()
+        self._free = {}         #: (dtype, size class) -> list of released 1D buffers
+        self._count = {}        #: (dtype, size class) -> number of buffers owned by the pool
+        self._generation = 0    #: buffers of a previous generation are dropped on release, see clear()
+        self._leases = {}       #: id of the lease reference -> (reference, key, generation, buffer)
+        self.hits = 0           #: number of arrays served by a released buffer
+        self.allocations = 0    #: number of new pool buffers
+        self.overflows = 0      #: number of unpooled allocations, all buffers of the size class in use
+
+    def empty(self, shape, dtype=np.float64):
+        ''' Get an uninitialized array, replacement for np.empty()
+        @param shape: array shape
+        @param dtype: array data type
+        @return: C-contiguous array
+        '''
+        if not ENABLED:
+            return np.empty(shape, dtype)
+        dtype = np.dtype(dtype)
+        if isinstance(shape, int):
+            shape = (shape,)
+        size = 1
+        for n in shape:
+            size *= n
+        key = (dtype, size_class(size))
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            if len(free) > 0:
+                buf = free.pop()
+                self.hits += 1
+            elif self._count.get(key, 0) >= MAX_BUFFERS:
+                self.overflows += 1
+                return np.empty(shape, dtype)
+            else:
+                buf = np.empty(key[1], dtype)
+                self._count[key] = self._count.get(key, 0) + 1
+                self.allocations += 1
+            generation = self._generation
+        return self._lease(buf, key, generation, size).reshape(shape)
+
+    def _lease(self, buf, key, generation, size):
+        ''' Hand out a buffer through a lease object, the buffer returns to the pool
+        when the lease and with it the last view of the returned array is released
+        @return: 1D array of size items
+        '''
+        # numpy views reference a non-ndarray memory exporter (the lease), not the buffer
+        lease = (ctypes.c_char * buf.nbytes).from_buffer(buf)
+        with self._lock:
+            # ctypes arrays are unhashable, the reference is kept alive in the entry
+            ref = weakref.ref(lease, self._release)
+            self._leases[id(ref)] = (ref, key, generation, buf)
+        return np.frombuffer(lease, buf.dtype, size)
+
+    def _release(self, ref):
+        ''' Return a buffer to the pool, called when its lease is released
+        @param ref: weak reference of the lease
+        '''
+        with self._lock:
+            ref, key, generation, buf = self._leases.pop(id(ref))
+            if generation == self._generation:
+                self._free.setdefault(key, []).append(buf)
+
+    def take(self, array, indices, axis=0):
+        ''' Select rows (or items along an axis) into a pooled array,
+        replacement for the fancy index copy array[indices]
+        @param array: source array
+        @param indices: index array
+        @param axis: selection axis
+        @return: pooled array
+        '''
+        shape = list(array.shape)
+        shape[axis] = len(indices)
+        out = self.empty(shape, array.dtype)
+        return np.take(array, indices, axis=axis, out=out)
+
+    def clear(self):
+        ''' Drop all buffers, buffers still in use are released by their users
+        '''
+        with self._lock:
+            self._generation += 1
+            self._free = {}
+            self._count = {}
+
+    def get_statistics(self):
+        ''' Get the pool counters
+        @return: dictionary
+        '''
+        with self._lock:
+            buffers = sum(self._count.values())
+            free = sum(len(b) for b in self._free.values())
+            nbytes = sum(count * key[1] * key[0].itemsize for key, count in self._count.items())
+        return {'hits': self.hits,
+                'allocations': self.allocations,
+                'overflows': self.overflows,
+                'buffers': buffers,
+                'free': free,
+                'bytes': nbytes}
+
+
+pool = ArrayPool()      #: global sample array pool
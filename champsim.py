@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+'''
+Simulated actiCHamp Device
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Pure Python replacement of the actiCHamp DLL (ActiChamp_x64.dll). The
+SimulatedChamp object provides the DLL functions used by the ActiChamp
+wrapper (actichamp_w.py) with the same arguments and return values, so
+open(), setup(), start(), read(), readImpedances(), getBatteryVoltage() and
+getDeviceStatus() of ActiChamp work unchanged, including the raw data
+decoding, on any operating system and without hardware.
+
+The device produces the interleaved int32 raw stream of the amplifier
+(EEG, AUX, trigger and sample counter channel of one sample after the
+other) paced by the wall clock, from 200Hz to 100kHz with 1 to 5 EEG
+modules (32 - 160 EEG channels). Injected faults:
+    - dropped samples: the device loses samples periodically, the sample
+      counter continues and has a gap
+    - counter wrap: the 32 bit hardware sample counter wraps around a given
+      time after start
+    - USB stalls: periodically no data is transferred, the device FIFO keeps
+      the samples and delivers them after the stall, samples exceeding the
+      FIFO size are lost and counted as device errors
+
+The simulation is enabled by actichamp_w.SIMULATION (environment variable
+PYCORDER_SIMULATE or command line option --simulate), the value is the
+device and fault specification, see parse_options().
+
+@author: Norbert Hauser
+@version: 1.0
+'''
+
+import ctypes
+import time
+import numpy as np
+from actichamp_w import *
+
+# default number of simulated EEG modules with 32 channels each
+SIM_MODULES = 2
+# device FIFO size in seconds, samples exceeding this size are lost during USB stalls
+SIM_FIFO = 1.0
+# maximum time in seconds champGetDataBlocking() waits for the requested data
+SIM_READ_TIMEOUT = 0.2
+
+# physical device sampling rates of the extended settings (CHAMP_SETTINGS_EX.Rate)
+_PHYSICAL_RATES = {0:10000.0, 1:50000.0, 2:100000.0}
+
+
+def parse_options(spec):
+    ''' Get the SimulatedChamp constructor arguments from a specification string,
+    comma separated key=value pairs, intervals and durations in seconds:
+        - modules=N: number of EEG modules (1-5)
+        - devices=N: number of devices reported by champGetCount()
+        - drop=interval:samples: lose samples periodically
+        - wrap=seconds: sample counter wrap around after start
+        - stall=interval:duration: periodic USB stalls
+        - fifo=seconds: device FIFO size
+    Other values (e.g. "1") enable the simulation without faults.
+    @param spec: specification string, e.g. "modules=5,drop=10:100,stall=20:0.5"
+    @return: dictionary of keyword arguments
+    '''
+    options = {}
+    for item in spec.split(","):
+        key, sep, value = item.strip().partition("=")
+        if not sep:
+            continue
+        values = [float(v) for v in value.split(":")]
+        if key in ("modules", "devices"):
+            options[key] = int(values[0])
+        elif key == "drop" and len(values) == 2:
+            options['drop'] = (values[0], int(values[1]))
+        elif key == "wrap":
+            options['wrap'] = values[0]
+        elif key == "stall" and len(values) == 2:
+            options['stall'] = (values[0], values[1])
+        elif key == "fifo":
+            options['fifo'] = values[0]
+        else:
+            raise ValueError("invalid device simulation option: %s"%(item))
+    return options
+
+
+def _array(pointer, dtype, count):
+    ''' Get a numpy view of the memory a DLL pointer argument refers to
+    @param pointer: ctypes.byref() of a ctypes array, with optional offset
+    @param dtype: numpy data type
+    @param count: number of items
+    '''
+    obj = pointer._obj
+    offset = ctypes.cast(pointer, ctypes.c_void_p).value - ctypes.addressof(obj)
+    return np.frombuffer(obj, dtype, count, offset)
+
+
+class SimulatedChamp(object):
+    ''' Simulated actiCHamp device with the DLL function interface
+    '''
+    def __init__(self, modules=SIM_MODULES, devices=1, drop=None, wrap=None, stall=None, fifo=SIM_FIFO):
+        ''' Create the device
+        @param modules: number of EEG modules (1-5)
+        @param devices: number of devices reported by champGetCount()
+        @param drop: tuple(interval in s, number of samples) samples lost by the device
+        @param wrap: time in s after start when the sample counter wraps around
+        @param stall: tuple(interval in s, duration in s) USB stalls
+        @param fifo: device FIFO size in s
+        '''
+        self.modules = max(1, min(int(modules), 5))     #: number of EEG modules
+        self.devices = devices
+        self.drop = drop
+        self.wrap = wrap
+        self.stall = stall
+        self.fifo = fifo
+        self.handle = 0                 #: device handle of the open device, 0 = closed
+        self.mode = CHAMP_MODE_NORMAL
+        self.rate = 10000.0             #: output sampling rate
+        self.enabled = self._present()  #: enabled modules
+        self.trigger_out = 0            #: trigger output bits
+        self.running = False
+        self._reset_stream()
+
+    def _present(self):
+        ''' Module bits of the simulated hardware, bit 0 = AUX, 1-5 = EEG modules
+        '''
+        return (1 << (self.modules + 1)) - 1
+
+    def _reset_stream(self):
+        self.start_time = 0.0
+        self.position = 0               #: index of the next sample to transfer
+        self.transferred = 0            #: number of transferred samples
+        self.transferred_bytes = 0
+        self.errors = 0                 #: FIFO overruns
+        self.dropped_samples = 0        #: samples lost by injected drops
+        self.lost_samples = 0           #: samples lost by FIFO overruns
+        self.stalls = 0                 #: number of USB stalls
+        self._stall_end = 0.0
+        self._next_stall = None
+        self._next_drop = None
+
+    def _channels(self):
+        ''' Get the number of EEG and AUX channels of the enabled modules
+        '''
+        eeg = 32 * bin((self.enabled >> 1) & 0x1F).count("1")
+        aux = 8 if self.enabled & 0x01 else 0
+        return eeg, aux
+
+    def _create_template(self):
+        ''' Create one second of raw EEG, AUX and trigger data,
+        all signals have integer frequencies and repeat every second
+        '''
+        eeg, aux = self._channels()
+        length = max(int(self.rate), 1)
+        t = np.arange(length) / float(length)
+        template = np.zeros((length, eeg + aux + 1), np.int32)
+        resolution_eeg = 4.88e-08 * 1e6     # µV per bit
+        resolution_aux = 2.98e-07 * 1e6
+        for c in range(eeg):
+            if self.mode == CHAMP_MODE_TEST:
+                # square wave 200µV, 1Hz
+                signal = np.where(t < 0.5, 100.0, -100.0)
+            else:
+                signal = 50.0 * np.sin(2.0 * np.pi * (c % 40 + 1) * t) + 10.0 * (c % 8)
+            template[:, c] = np.round(signal / resolution_eeg)
+        for c in range(aux):
+            template[:, eeg + c] = np.round(1000.0 * np.sin(2.0 * np.pi * (c + 1) * t) / resolution_aux)
+        # trigger input 1, high for 10ms at the beginning of every second
+        template[:max(length // 100, 1), -1] = 1
+        return template
+
+    def _available(self, now):
+        ''' Update the stream state and get the number of samples ready for transfer
+        '''
+        produced = int((now - self.start_time) * self.rate)
+        # USB stall, the device keeps on sampling
+        if self._next_stall != None and now >= self._next_stall:
+            self._stall_end = self._next_stall + self.stall[1]
+            self._next_stall += self.stall[0]
+            self.stalls += 1
+        if now < self._stall_end:
+            return 0
+        # FIFO overrun, the oldest samples are lost
+        overrun = produced - self.position - int(self.fifo * self.rate)
+        if overrun > 0:
+            self.position += overrun
+            self.lost_samples += overrun
+            self.errors += 1
+        # samples lost by the device
+        while self._next_drop != None and self.position >= self._next_drop:
+            lost = max(self._next_drop + self.drop[1] - self.position, 0)
+            self.position += lost
+            self.dropped_samples += lost
+            self._next_drop += int(self.drop[0] * self.rate)
+        return max(produced - self.position, 0)
+
+    def _transfer(self, pointer, size, samples):
+        ''' Copy raw samples to the transfer buffer
+        @param pointer: transfer buffer
+        @param size: buffer size in bytes
+        @param samples: number of available samples
+        @return: number of bytes written
+        '''
+        eeg, aux = self._channels()
+        samplesize = eeg + aux + 2
+        samples = min(samples, size // (samplesize * 4))
+        # stop in front of the next dropped samples
+        if self._next_drop != None:
+            samples = min(samples, self._next_drop - self.position)
+        if samples <= 0:
+            return 0
+
+        out = _array(pointer, np.int32, samples * samplesize)
+        out.shape = (samples, samplesize)
+        # EEG, AUX and trigger, the template repeats every second
+        length = len(self._template)
+        first = self.position % length
+        done = 0
+        while done < samples:
+            n = min(samples - done, length - first)
+            out[done:done + n, :-1] = self._template[first:first + n]
+            done += n
+            first = 0
+        if self.trigger_out:
+            out[:, -2] |= self.trigger_out
+        # 32 bit sample counter
+        counter = np.arange(self.position, self.position + samples, dtype=np.int64)
+        counter += self._counter_start
+        out[:, -1] = (counter & 0xFFFFFFFF).astype(np.uint32).view(np.int32)
+
+        self.position += samples
+        self.transferred += samples
+        self.transferred_bytes += out.nbytes
+        return out.nbytes
+
+    # DLL functions used by actichamp_w.ActiChamp
+    def champGetCount(self):
+        return self.devices
+
+    def champOpen(self, device):
+        if device >= self.devices:
+            return 0
+        self.handle = device + 1
+        self.enabled = self._present()
+        return self.handle
+
+    def champClose(self, handle):
+        self.running = False
+        self.handle = 0
+        return CHAMP_ERR_OK
+
+    def champGetVersion(self, handle, version):
+        version._obj.DLL = CHAMP_VERSION
+        return CHAMP_ERR_OK
+
+    def champGetVersionExt(self, handle, version):
+        version._obj.DLL = CHAMP_VERSION
+        return CHAMP_ERR_OK
+
+    def champGetModules(self, handle, modules):
+        modules._obj.Present = self._present()
+        modules._obj.Enabled = self.enabled
+        return CHAMP_ERR_OK
+
+    def champSetModules(self, handle, modules):
+        self.enabled = modules._obj.Enabled & self._present()
+        return CHAMP_ERR_OK
+
+    def champGetProperty(self, handle, properties):
+        p = properties._obj
+        p.CountEeg, p.CountAux = self._channels()
+        p.TriggersIn = 8
+        p.TriggersOut = 8
+        p.Rate = self.rate
+        p.ResolutionEeg = 4.88e-08
+        p.ResolutionAux = 2.98e-07
+        p.RangeEeg = 0.819
+        p.RangeAux = 5.0
+        return CHAMP_ERR_OK
+
+    def champSetSettingsEx(self, handle, settings):
+        s = settings._obj
+        if s.Rate not in _PHYSICAL_RATES:
+            return CHAMP_ERR_PARAM
+        self.mode = s.Mode
+        self.rate = _PHYSICAL_RATES[s.Rate] / max(s.Decimation, 1)
+        return CHAMP_ERR_OK
+
+    def champSetActiveShieldGain(self, handle, gain):
+        return CHAMP_ERR_OK
+
+    def champStart(self, handle):
+        if self.handle == 0:
+            return CHAMP_ERR_HANDLE
+        self._reset_stream()
+        self._template = self._create_template()
+        self._counter_start = 0
+        if self.wrap != None:
+            self._counter_start = (1 << 32) - int(self.wrap * self.rate)
+        self.start_time = time.perf_counter()
+        if self.stall != None:
+            self._next_stall = self.start_time + self.stall[0]
+        if self.drop != None:
+            self._next_drop = int(self.drop[0] * self.rate)
+        self.running = True
+        return CHAMP_ERR_OK
+
+    def champStop(self, handle):
+        self.running = False
+        return CHAMP_ERR_OK
+
+    def champGetData(self, handle, buffer, size):
+        ''' Non blocking read, get all available samples
+        '''
+        if not self.running:
+            return CHAMP_ERR_FAIL
+        return self._transfer(buffer, size, self._available(time.perf_counter()))
+
+    def champGetDataBlocking(self, handle, buffer, size):
+        ''' Wait until the requested number of bytes is available or the read times out
+        '''
+        if not self.running:
+            return CHAMP_ERR_FAIL
+        eeg, aux = self._channels()
+        requested = max(size // ((eeg + aux + 2) * 4), 1)
+        timeout = time.perf_counter() + SIM_READ_TIMEOUT
+        while True:
+            now = time.perf_counter()
+            available = self._available(now)
+            if available >= requested or now >= timeout:
+                break
+            # sleep until the requested samples are sampled or the stall ends
+            ready = self.start_time + (self.position + requested) / self.rate
+            time.sleep(min(max(ready - now, self._stall_end - now, 0.0005), timeout - now))
+        return self._transfer(buffer, size, available)
+
+    def champGetDataStatus(self, handle, status):
+        s = status._obj
+        elapsed = max(time.perf_counter() - self.start_time, 1e-6) if self.running else 1.0
+        s.Samples = self.transferred & 0xFFFFFFFF
+        s.Errors = self.errors
+        s.Rate = self.rate
+        s.Speed = self.transferred_bytes / elapsed / 1e6 if self.running else 0.0
+        return CHAMP_ERR_OK
+
+    def champImpedanceSetSetup(self, handle, setup):
+        return CHAMP_ERR_OK
+
+    def champImpedanceGetData(self, handle, buffer, size):
+        ''' Impedance values of all EEG electrodes and the ground electrode in Ohm
+        '''
+        if not self.running:
+            return CHAMP_ERR_FAIL
+        eeg, aux = self._channels()
+        values = _array(buffer, np.uint32, eeg + 1)
+        values[:-1] = 2000 + (np.arange(eeg) * 3700) % 60000
+        values[-1] = 1500
+        return CHAMP_ERR_OK
+
+    def champGetVoltages(self, handle, voltages):
+        v = voltages._obj
+        v.VDC = 6.2
+        v.V3 = 3.3
+        v.TEMP = 35.0
+        v.DVDD3 = 3.3
+        v.AVDD3 = 3.3
+        v.AVDD5 = 5.0
+        v.REF = 2.048
+        return CHAMP_ERR_OK
+
+    def champFactoryDeviceProductionGet(self, handle, info):
+        info._obj.Model = 1
+        info._obj.SerialNumber = 10000000 + self.handle
+        return CHAMP_ERR_OK
+
+    def champFactoryModuleProductionGet(self, handle, module, info):
+        if module >= self.modules:
+            return CHAMP_ERR_PARAM
+        info._obj.Model = 2
+        info._obj.SerialNumber = 20000000 + 10 * self.handle + module
+        return CHAMP_ERR_OK
+
+    def champSetTriggers(self, handle, trigger):
+        self.trigger_out = trigger.value & 0xFF00
+        return CHAMP_ERR_OK
+
+    def champSetMyButtonLed(self, handle, period, duty_cycle):
+        return CHAMP_ERR_OK
+
+    def champSetElectrodes(self, handle, leds, size):
+        return CHAMP_ERR_OK
+
+    def champSetPll(self, handle, pll):
+        return CHAMP_ERR_OK
@@ -56,7 +56,9 @@ class dc_offset(ModuleBase):
         ''' Constructor. 
         Initialize instance variables and instantiate GUI objects 
         '''
-        # initialize the base class, give a descriptive name
+        # initialize the base class, give a descriptive name,
+        # lightweight module, runs in the worker thread of the parent module
+        keys.setdefault("inline", True)
         ModuleBase.__init__(self, name="DC_Offset", **keys)    
 
         
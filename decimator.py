@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+'''
+Decimating Anti-Aliasing Filter
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Down sampling of the channel data by an integer factor for the Python side
+decimation of the amplifier module (actichamp_w.PythonDecimation).
+
+The decimation factor is split into stages, each stage is a polyphase FIR
+filter and only the output samples which are kept are computed. The early
+stages run at the high input rates, but only have to suppress the frequencies
+which alias into the final band, so their filters are short:
+    - the first stage is a cascade of boxcar filters (the non recursive form
+      of a CIC decimator) with the largest factor that meets the attenuation
+      and pass band droop specification, its zeros are at the alias bands.
+    - the remaining factor is split into Kaiser window FIR stages of at most
+      DECIMATION_MAX_STAGE, the last stage has the steep transition band at
+      the low output rate.
+
+Output sample k is aligned to input sample k * factor, like the former
+"filter all samples and take every Nth" implementation. The filter states
+(input history and phase of each stage) are kept per channel across blocks,
+the block size does not have to be a multiple of the factor.
+
+The filtered channels are delayed by the group delay of the stages
+(Decimator.delay, at DC for the minimum phase and IIR filters). Lanes which
+are taken without filtering (trigger and sample counter) have to be delayed
+by the same number of output samples (Decimator.lag) with a DelayLine,
+otherwise markers are early relative to the channel data.
+'''
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy import signal
+from bufpool import pool
+
+# anti-aliasing filter type:
+#   "linear" = linear phase FIR stages (constant group delay)
+#   "minimum" = minimum phase FIR stages (lower delay, phase distortion)
+#   "iir" = 4th order Butterworth over all input samples (former implementation)
+DECIMATION_FILTER = "linear"
+# pass band edge relative to the output Nyquist frequency
+DECIMATION_PASSBAND = 0.666
+# stop band edge of the last FIR stage relative to the output Nyquist frequency,
+# 1.0 = no aliasing below the output Nyquist frequency, 2.0 - DECIMATION_PASSBAND = alias free
+# pass band only (aliases in the transition band, shorter filters)
+DECIMATION_STOPBAND = 1.0
+# stop band attenuation of the FIR stages in dB
+DECIMATION_ATTENUATION = 80.0
+# max. decimation factor of a single FIR stage
+DECIMATION_MAX_STAGE = 8
+# max. order of the boxcar cascade of the first stage, 0 = Kaiser window FIR stages only
+DECIMATION_BOXCAR_ORDER = 4
+# max. pass band droop of the boxcar cascade in dB
+DECIMATION_DROOP = 0.1
+
+#: selectable filter types and descriptions
+DECIMATION_FILTERS = {"linear": "linear phase FIR",
+                      "minimum": "minimum phase FIR",
+                      "iir": "Butterworth IIR"}
+
+
+def dc_delay(b, a=(1.0,)):
+    ''' Get the group delay of a filter at DC
+    @param b: numerator coefficients (FIR coefficients)
+    @param a: denominator coefficients
+    @return: group delay in samples
+    '''
+    return np.dot(np.arange(len(b)), b) / np.sum(b) - np.dot(np.arange(len(a)), a) / np.sum(a)
+
+
+def split_factor(factor, maxstage=None):
+    ''' Split the decimation factor into stage factors
+    @param factor: total decimation factor
+    @param maxstage: max. stage factor, None = DECIMATION_MAX_STAGE
+    @return: list of stage factors, largest first
+    '''
+    if maxstage == None:
+        maxstage = DECIMATION_MAX_STAGE
+    primes = []
+    n, p = factor, 2
+    while n > 1:
+        while n % p == 0:
+            primes.append(p)
+            n //= p
+        p += 1
+    stages = []
+    for p in sorted(primes, reverse=True):
+        if stages and stages[-1] * p <= maxstage:
+            stages[-1] *= p
+        else:
+            stages.append(p)
+    return stages
+
+
+def boxcar_taps(factor, rate, f_pass, f_protect, attenuation, droop, maxorder=None):
+    ''' Design the boxcar cascade of a decimation stage, boxcar filters of length factor
+    have their zeros at the multiples of the stage output rate.
+    @param factor: stage decimation factor
+    @param rate: stage input sampling rate in Hz
+    @param f_pass: pass band edge in Hz
+    @param f_protect: the bands of this width around the multiples of the output rate alias
+                      into the final band and have to be attenuated
+    @param attenuation: min. attenuation of the alias bands in dB
+    @param droop: max. pass band droop in dB
+    @param maxorder: max. number of cascaded boxcar filters, None = DECIMATION_BOXCAR_ORDER
+    @return: FIR coefficients, None if the specification can't be met
+    '''
+    if maxorder == None:
+        maxorder = DECIMATION_BOXCAR_ORDER
+    stage_out = rate / factor
+    if stage_out / 2.0 <= f_protect:
+        return None
+    bands = [np.linspace(k * stage_out - f_protect, min(k * stage_out + f_protect, rate / 2.0), 32)
+             for k in range(1, factor // 2 + 1)]
+    frequencies = np.concatenate([[f_pass]] + bands)
+    taps = np.ones(1)
+    for order in range(maxorder):
+        taps = np.convolve(taps, np.ones(factor) / factor)
+        response = np.abs(signal.freqz(taps, worN=frequencies, fs=rate)[1])
+        if -20.0 * np.log10(response[0]) > droop:
+            return None
+        if 20.0 * np.log10(np.max(response[1:])) <= -attenuation:
+            return taps
+    return None
+
+
+class FirStage(object):
+    ''' Polyphase FIR decimation stage with per channel state.
+    Short filters: the input is split into rows of factor samples, the polyphase
+    components of all rows are computed with a single matrix product and summed
+    along the diagonals, one output sample per row.
+    Long filters: dot product of the coefficients with a sliding window view of
+    the input, one window per output sample.
+    '''
+    #: max. number of polyphase components for the matrix product
+    MAX_COMPONENTS = 16
+
+    def __init__(self, taps, factor, channels):
+        ''' Create the stage
+        @param taps: FIR coefficients
+        @param factor: decimation factor of this stage
+        @param channels: number of channels
+        '''
+        self.taps = np.asarray(taps, np.float64)
+        self.factor = factor
+        self.phases = -(-len(taps) // factor)       #: number of polyphase components
+        # reversed coefficients, zero padded in front to phases x factor,
+        # column q holds the coefficients applied to the q-th row of the window
+        padded = np.zeros(self.phases * factor)
+        padded[len(padded) - len(taps):] = self.taps[::-1]
+        self.polyphase = np.ascontiguousarray(padded.reshape(self.phases, factor).T)
+        self.reversed = np.ascontiguousarray(self.taps[::-1])
+        self.delay = dc_delay(self.taps)            #: group delay at DC in input samples
+        self.historysize = self.phases * factor - 1 #: input samples kept for the next block
+        self.history = np.zeros((channels, self.historysize))  #: last input samples of each channel
+        self.phase = 0          #: input samples to skip until the next output sample
+
+    def process(self, x, out=None):
+        ''' Filter and decimate one block
+        @param x: input data (channels x samples)
+        @param out: optional float64 output array, must have the output size
+        @return: decimated data (channels x samples)
+        '''
+        channels, n = x.shape
+        count = max(0, (n - self.phase + self.factor - 1) // self.factor)
+        if out is None:
+            out = np.empty((channels, count))
+        # positions are counted from the start of the history, followed by the block
+        if count > 0 and self.phases > self.MAX_COMPONENTS:
+            ext = np.concatenate((self.history, x), axis=1)
+            start = self.phase + self.historysize - (len(self.taps) - 1)
+            windows = as_strided(ext[:, start:],
+                                 shape=(channels, count, len(self.taps)),
+                                 strides=(ext.strides[0], self.factor * ext.strides[1], ext.strides[1]))
+            for channel in range(channels):
+                np.dot(windows[channel], self.reversed, out=out[channel])
+        elif count > 0:
+            rows = count + self.phases - 1
+            components = np.empty((channels, rows, self.phases))
+            # rows starting within the history are taken from a small extended copy,
+            # all other rows straight from the block
+            head = min(rows, -(-(self.historysize - self.phase) // self.factor))
+            tail = self.phase + head * self.factor - self.historysize
+            ext = np.concatenate((self.history[:, self.phase:], x[:, :tail]), axis=1)
+            np.matmul(ext.reshape(channels, head, self.factor), self.polyphase, out=components[:, :head])
+            if rows > head:
+                block = x[:, tail:tail + (rows - head) * self.factor]
+                np.matmul(block.reshape(channels, rows - head, self.factor), self.polyphase,
+                          out=components[:, head:])
+            # output k = sum over q of component q of row k + q
+            diagonals = as_strided(components, shape=(channels, count, self.phases),
+                                   strides=(components.strides[0], components.strides[1],
+                                            components.strides[1] + components.strides[2]))
+            np.sum(diagonals, axis=2, out=out)
+        self.phase += count * self.factor - n
+        if n >= self.historysize:
+            self.history[:] = x[:, n - self.historysize:]
+        else:
+            self.history = np.concatenate((self.history[:, n:], x), axis=1)
+        return out
+
+
+class IirStage(object):
+    ''' Butterworth low pass over all input samples, followed by taking every Nth sample
+    '''
+    def __init__(self, factor, channels):
+        ''' Create the stage
+        @param factor: decimation factor
+        @param channels: number of channels
+        '''
+        # Wn = f_cutoff / f_nyquist with f_cutoff = f_in / factor * 0.333
+        self.sos = signal.butter(4, 1.0 / factor * 2.0 * 0.333, btype='low', output='sos')
+        self.delay = sum(dc_delay(s[:3], s[3:]) for s in self.sos)  #: group delay at DC in input samples
+        self.zi = np.zeros((len(self.sos), channels, 2))
+        self.factor = factor
+        self.phase = 0
+
+    def process(self, x, out=None):
+        ''' Filter and decimate one block
+        @param x: input data (channels x samples)
+        @param out: optional float64 output array, must have the output size
+        @return: decimated data (channels x samples)
+        '''
+        filtered, self.zi = signal.sosfilt(self.sos, x, zi=self.zi)
+        decimated = filtered[:, self.phase::self.factor]
+        self.phase = (self.phase - x.shape[1]) % self.factor
+        if out is None:
+            return decimated
+        out[:] = decimated
+        return out
+
+
+class Decimator(object):
+    ''' Multistage decimating anti-aliasing filter
+    '''
+    def __init__(self, factor, channels, rate, filtertype=None, passband=None, stopband=None,
+                 attenuation=None):
+        ''' Design the filter stages
+        @param factor: total decimation factor
+        @param channels: number of channels
+        @param rate: input sampling rate in Hz
+        @param filtertype: "linear", "minimum" or "iir", None = DECIMATION_FILTER
+        @param passband: pass band edge relative to the output Nyquist frequency
+        @param stopband: stop band edge relative to the output Nyquist frequency
+        @param attenuation: stop band attenuation in dB
+        '''
+        self.factor = factor
+        self.filtertype = filtertype or DECIMATION_FILTER
+        if self.filtertype not in DECIMATION_FILTERS:
+            raise ValueError("unknown decimation filter type: %s"%(self.filtertype))
+        passband = passband or DECIMATION_PASSBAND
+        stopband = stopband or DECIMATION_STOPBAND
+        attenuation = attenuation or DECIMATION_ATTENUATION
+        self.delay = 0.0        #: group delay in s (at DC for minimum phase and IIR)
+        self.lag = 0            #: group delay in output samples, see DelayLine
+        self.stages = []
+        if factor <= 1:
+            return
+        if self.filtertype == "iir":
+            self.stages.append(IirStage(factor, channels))
+            self.delay = self.stages[0].delay / rate
+            self.lag = int(round(self.stages[0].delay / factor))
+            return
+        out_rate = rate / factor
+
+        out_nyquist = rate / factor / 2.0
+        f_pass = passband * out_nyquist
+        f_final = stopband * out_nyquist
+
+        # boxcar cascade with the largest possible factor, linear phase with a short delay
+        stagefactors = split_factor(factor)
+        for first in range(factor // 2, 1, -1):
+            if factor % first:
+                continue
+            taps = boxcar_taps(first, rate, f_pass, f_final, attenuation, DECIMATION_DROOP)
+            if taps is not None:
+                self.stages.append(FirStage(taps, first, channels))
+                self.delay += self.stages[-1].delay / rate
+                rate /= first
+                stagefactors = split_factor(factor // first)
+                break
+
+        if self.filtertype == "minimum":
+            # the homomorphic minimum phase conversion halves the attenuation in dB
+            attenuation *= 2.0
+        for stagefactor in stagefactors:
+            stage_out = rate / stagefactor
+            # intermediate stages only protect the final band from aliasing,
+            # the last stage has the final stop band edge
+            if stage_out / 2.0 > out_nyquist:
+                f_stop = stage_out - f_final
+            else:
+                f_stop = f_final
+            numtaps, beta = signal.kaiserord(attenuation, (f_stop - f_pass) / (rate / 2.0))
+            numtaps |= 1        # odd length, integer group delay
+            taps = signal.firwin(numtaps, (f_pass + f_stop) / 2.0, window=('kaiser', beta), fs=rate)
+            if self.filtertype == "minimum":
+                taps = signal.minimum_phase(taps, method='homomorphic')
+                taps /= np.sum(taps)
+            self.stages.append(FirStage(taps, stagefactor, channels))
+            self.delay += self.stages[-1].delay / rate
+            rate = stage_out
+        self.lag = int(round(self.delay * out_rate))
+
+    def process(self, x):
+        ''' Filter and decimate one block, states are kept for the next block.
+        The filters are computed in double precision, the output is a pooled array
+        of the input data type.
+        @param x: input data (channels x samples)
+        @return: decimated data (channels x samples)
+        '''
+        if not self.stages:
+            return x
+        y = x
+        for stage in self.stages[:-1]:
+            y = stage.process(y)
+        last = self.stages[-1]
+        if x.dtype == np.float64 and isinstance(last, FirStage):
+            count = max(0, (y.shape[1] - last.phase + last.factor - 1) // last.factor)
+            return last.process(y, pool.empty((x.shape[0], count), np.float64))
+        y = last.process(y)
+        out = pool.empty(y.shape, x.dtype)
+        np.copyto(out, y, casting="same_kind")
+        return out
+
+    def info(self):
+        ''' Get a description of the filter stages
+        @return: description string
+        '''
+        if self.filtertype == "iir":
+            info = "%s, 1:%d"%(DECIMATION_FILTERS[self.filtertype], self.factor)
+        else:
+            info = "%s, 1:%s, %s taps"%(DECIMATION_FILTERS[self.filtertype],
+                                       "x".join(str(s.factor) for s in self.stages),
+                                       "+".join(str(len(s.taps)) for s in self.stages))
+        return info + ", delay %.2fms"%(self.delay * 1000.0)
+
+
+class DelayLine(object):
+    ''' Delay unfiltered lanes (trigger, sample counter) by the group delay of the
+    decimator, the last samples are kept for the next block
+    '''
+    def __init__(self, delay, extrapolate=False):
+        ''' Create the delay line
+        @param delay: delay in samples (Decimator.lag)
+        @param extrapolate: the samples in front of the first block continue the first
+                            sample with a slope of -1 per sample (sample counter), otherwise 0
+        '''
+        self.delay = delay
+        self.extrapolate = extrapolate
+        self.history = None     #: last delay samples of each lane
+
+    def process(self, x):
+        ''' Delay one block
+        @param x: lane data (lanes x samples)
+        @return: delayed data (lanes x samples)
+        '''
+        if self.delay == 0 or x.shape[1] == 0:
+            return x
+        if self.history is None:
+            if self.extrapolate:
+                self.history = x[:, :1] - np.arange(self.delay, 0, -1)
+            else:
+                self.history = np.zeros((x.shape[0], self.delay), x.dtype)
+        ext = np.concatenate((self.history, x), axis=1)
+        self.history = ext[:, x.shape[1]:]
+        return ext[:, :x.shape[1]]
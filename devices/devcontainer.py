@@ -149,7 +149,7 @@ class DeviceContainer(Qt.QObject):
         '''
         new_properties = np.array([])
         new_output = np.array([[]])
-        processed_indices = np.array([])
+        processed_indices = np.array([], dtype=int)
         
         # let all connected devices select their channels
         for device in self.instantiatedDevices:
@@ -39,6 +39,10 @@ from res import frmScopeOnline
 from operator import itemgetter
 from collections import defaultdict
 
+# acquisition to screen latency deadline in seconds (see ModuleBase.report_latency()),
+# None = no deadline
+DISP_DEADLINE = 0.25
+
 '''
 ------------------------------------------------------------
 DISPLAY MODULE
@@ -49,6 +53,9 @@ class DISP_Scope(Qwt.QwtPlot, ModuleBase):
     """ EEG signal display widget.
     """
     def __init__(self, *args, **keys):
+        # the display may lose blocks, but should always show the most recent data
+        keys.setdefault("backpressure", Backpressure.DROP_OLDEST)
+        keys.setdefault("deadline", DISP_DEADLINE)
         ModuleBase.__init__(self, usethread=True, name="Display", **keys)  # use transmit / receive thread
         Qwt.QwtPlot.__init__(self, *args)
 
@@ -150,6 +157,7 @@ class DISP_Scope(Qwt.QwtPlot, ModuleBase):
         # start self.timerEvent() to update display asynchronously
         self.startTimer(30)
         self.update_display = False
+        self.display_acquisition_time = 0   #: acquisition time of the oldest block not yet shown
         self.dataavailable = False
 
 
@@ -461,6 +469,10 @@ class DISP_Scope(Qwt.QwtPlot, ModuleBase):
         # add EEG marker to marker transfer list
         self.input_markers.extend(self.eeg.markers)
         
+        # the latency of the next screen update is determined by the oldest block
+        if not self.display_acquisition_time:
+            self.display_acquisition_time = self.eeg.acquisition_time
+        
         # redisplay everything
         if self.receive_data_available() < 3:
             self.update_display = True
@@ -507,12 +519,16 @@ class DISP_Scope(Qwt.QwtPlot, ModuleBase):
                     marker.detach()
                     self.plot_markers.remove(marker)
 
+            acquisition_time = self.display_acquisition_time
+            self.display_acquisition_time = 0
+
             # release thread lock 
             self._thLock.release()
 
             t = time.perf_counter()
             self.replot()
             displayTime = time.perf_counter() - t
+            self.report_latency(acquisition_time)
     
        
     def setTimebase(self, timebase):
@@ -529,10 +545,10 @@ class DISP_Scope(Qwt.QwtPlot, ModuleBase):
         # calculate new ring buffer size
         self.dtX = self.binning / self.eeg.sample_rate 
         self.xValues = np.arange(0.0, self.timebase, self.dtX)
-        self.buffer = np.zeros((len(self.traces), len(self.xValues)), 'd' ) # channel buffer
+        self.buffer = np.zeros((len(self.traces), len(self.xValues)), sample_type() ) # channel buffer
         self.sc_buffer = np.zeros((1, len(self.xValues)), np.uint64 )        # sample counter buffer
-        self.displaybuffer = np.zeros((len(self.traces), len(self.xValues)), 'd' ) # channel display transfer buffer
-        self.baselines = np.zeros((len(self.traces), 1), 'd')                    # baseline correction buffer
+        self.displaybuffer = np.zeros((len(self.traces), len(self.xValues)), sample_type() ) # channel display transfer buffer
+        self.baselines = np.zeros((len(self.traces), 1), sample_type())                    # baseline correction buffer
         
         # reset buffer pointer
         self.writePointer = 0 
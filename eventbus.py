@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+'''
+Qt Independent Event Bus
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Replacement for the Qt signal / slot mechanism used by the module chain,
+so the modules can run without a Qt event loop (headless runtime).
+
+EventObject provides the old style connect() / emit() interface of QObject.
+Queued connections are delivered by the EventBus in the thread which runs
+EventBus.process_events(), like queued Qt connections are delivered by the
+event loop of the main thread. With a GUI the Qt event loop drives the bus,
+see EventBus.set_wakeup() and modbase.attach_event_loop().
+'''
+
+import threading
+import time
+import collections
+
+
+class Connection:
+    ''' Signal connection types, values are compatible with Qt.ConnectionType
+    @ivar AUTO: direct call if emitted in the event bus thread, queued otherwise
+    @ivar DIRECT: slot is called in the emitting thread
+    @ivar QUEUED: slot is called by the event bus thread
+    '''
+    (AUTO, DIRECT, QUEUED) = range(3)
+
+
+_signal_keys = {}   #: signal signature -> signal key cache
+
+def SIGNAL(signature):
+    ''' Get the signal key for an old style signal signature
+    @param signature: signal signature, e.g. "event(PyQt_PyObject)", may
+    also be a Qt.SIGNAL() string with leading signal code
+    '''
+    try:
+        return _signal_keys[signature]
+    except KeyError:
+        key = str(signature).split("(")[0].strip().lstrip("0123456789")
+        _signal_keys[signature] = key
+        return key
+
+
+class EventBus(object):
+    ''' Delivers queued signals in the thread that processes the bus events
+    '''
+    def __init__(self):
+        self._queue = collections.deque()      #: pending (slot, args), thread safe append / popleft
+        self._ready = threading.Event()         #: set by post() while process_events() waits
+        self._waiting = False
+        self._thread = threading.get_ident()    #: thread which delivers queued signals
+        self._wakeup = None                     #: called once per batch of queued signals
+        self._wakeup_pending = False
+
+    def set_wakeup(self, wakeup):
+        ''' Install a notification for an external event loop, e.g. the Qt GUI
+        event loop. The calling thread becomes the event bus thread.
+        @param wakeup: thread safe callable, schedules a process_events() call
+        in the event bus thread. Called for the first signal posted after the
+        last process_events() call only, so all signals which are pending
+        until the event loop gets control are delivered as one batch.
+        None = remove the notification
+        '''
+        self._thread = threading.get_ident()
+        self._wakeup = wakeup
+        self._wakeup_pending = False
+
+    def post(self, slot, args):
+        ''' Queue a slot call for the event bus thread
+        @param slot: callable
+        @param args: argument tuple
+        '''
+        self._queue.append((slot, args))
+        if self._waiting:
+            self._ready.set()
+        wakeup = self._wakeup
+        if wakeup != None and not self._wakeup_pending:
+            self._wakeup_pending = True
+            wakeup()
+
+    def is_bus_thread(self):
+        ''' Check if the current thread delivers the queued signals
+        '''
+        return threading.get_ident() == self._thread
+
+    def process_events(self, timeout=0.0):
+        ''' Deliver all pending signals, wait for the first one up to timeout seconds.
+        The calling thread becomes the event bus thread.
+        @param timeout: maximum waiting time in seconds
+        @return: number of delivered signals
+        '''
+        self._thread = threading.get_ident()
+        # signals posted from now on need a new wakeup notification
+        self._wakeup_pending = False
+        delivered = 0
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                slot, args = self._queue.popleft()
+            except IndexError:
+                wait = deadline - time.perf_counter()
+                if delivered > 0 or wait <= 0:
+                    return delivered
+                # announce the wait before checking the queue again,
+                # post() sets the ready flag for signals queued after the check
+                self._ready.clear()
+                self._waiting = True
+                if not self._queue:
+                    self._ready.wait(wait)
+                self._waiting = False
+                continue
+            slot(*args)
+            delivered += 1
+
+
+#: default event bus of the application
+bus = EventBus()
+
+
+def connect(sender, signal, slot, conntype=Connection.AUTO):
+    ''' Connect a signal of the sender object to a slot
+    @param sender: EventObject object (or QObject if Qt is available)
+    @param signal: signal signature or key, see SIGNAL()
+    @param slot: callable
+    @param conntype: Connection type
+    @return: True if connected
+    '''
+    if not isinstance(sender, EventObject):
+        # Qt objects (e.g. widgets of a module pane) keep their native signals,
+        # queued slots are delivered by the event bus
+        if conntype == Connection.QUEUED:
+            target = slot
+            slot = lambda *args: bus.post(target, args)
+        return sender.connect(sender, signal, slot)
+    if conntype not in (Connection.DIRECT, Connection.QUEUED):
+        conntype = Connection.AUTO
+    key = SIGNAL(signal)
+    with sender._connections_lock:
+        # slot lists are replaced, never modified, emit() reads them without locking
+        slots = sender._connections.get(key, ())
+        sender._connections[key] = slots + ((slot, conntype),)
+    return True
+
+
+def disconnect(sender, signal, slot):
+    ''' Remove a signal connection
+    @param sender: EventObject object
+    @param signal: signal signature or key
+    @param slot: connected callable
+    '''
+    key = SIGNAL(signal)
+    with sender._connections_lock:
+        slots = sender._connections.get(key, ())
+        sender._connections[key] = tuple(s for s in slots if s[0] != slot)
+    return True
+
+
+def emit(sender, signal, *args):
+    ''' Call all slots connected to a signal of the sender object
+    @param sender: EventObject object
+    @param signal: signal signature or key
+    @param args: signal arguments
+    '''
+    slots = sender._connections.get(SIGNAL(signal))
+    if not slots:
+        return
+    in_bus_thread = bus.is_bus_thread()
+    for slot, conntype in slots:
+        if conntype == Connection.DIRECT or \
+           (conntype == Connection.AUTO and in_bus_thread):
+            slot(*args)
+        else:
+            bus.post(slot, args)
+
+
+class EventObject(object):
+    ''' Qt free base class with old style QObject.connect() and emit() methods.
+    Objects which are also QObjects (e.g. plot widget modules) get the native
+    QObject.connect() method, use the module functions connect() and emit() for them.
+    '''
+    def __init__(self, *args, **keys):
+        self._connections = {}          #: signal key -> tuple of (slot, connection type)
+        self._connections_lock = threading.Lock()
+
+    def connect(self, sender, signal, slot, conntype=Connection.AUTO):
+        ''' Connect a signal of the sender object to a slot, see connect()
+        '''
+        return connect(sender, signal, slot, conntype)
+
+    def disconnect(self, sender, signal, slot):
+        ''' Remove a signal connection, see disconnect()
+        '''
+        return disconnect(sender, signal, slot)
+
+    def emit(self, signal, *args):
+        ''' Call all slots connected to a signal of this object, see emit()
+        '''
+        emit(self, signal, *args)
@@ -36,6 +36,32 @@ from modbase import *
 from res import frmFilterConfig
 from operator import itemgetter
 
+
+class FLT_Kernel(ProcessKernel):
+    ''' Filter kernel, runs the high, low pass and notch filter groups over the channel data
+    '''
+    def __init__(self, hpFilter, lpFilter, notchFilter):
+        ''' Create the kernel
+        @param hpFilter: list of highpass filter dictionaries (slice, sos, zi)
+        @param lpFilter: list of lowpass filter dictionaries
+        @param notchFilter: list of notch filter dictionaries
+        '''
+        self.hpFilter = hpFilter
+        self.lpFilter = lpFilter
+        self.notchFilter = notchFilter
+
+    def process(self, eeg):
+        ''' Filter all channel groups in place, filter states are kept for the next block.
+        The filters are computed in double precision, also for float32 sample blocks.
+        @param eeg: channel data array (channels x samples)
+        '''
+        for group in (self.hpFilter, self.lpFilter, self.notchFilter):
+            for flt in group:
+                eeg[flt['slice']],flt['zi'] = \
+                    signal.sosfilt(flt['sos'], eeg[flt['slice']], zi=flt['zi'])
+        return eeg
+
+
 class FLT_Eeg(ModuleBase):
     ''' Low, high pass and notch filter
     '''
@@ -95,17 +121,18 @@ class FLT_Eeg(ModuleBase):
         '''
         if (frequency == 0.0) or (frequency > self.samplefreq/2.0):
             return None
+        # second order sections, the transfer function coefficients (b, a) of
+        # narrow filters are ill-conditioned at high sampling rates
         if type == "bandstop":
             cut1 = (frequency-1.0) / self.samplefreq * 2.0
             cut2 = (frequency+1.0) / self.samplefreq * 2.0
-            b,a = signal.filter_design.iirfilter(2, [cut1, cut2], btype=type, ftype='butter') 
-            #b,a = signal.filter_design.iirfilter(2, [cut1, cut2], rs=40.0, rp=0.5, btype=type, ftype='elliptic') 
+            sos = signal.filter_design.iirfilter(2, [cut1, cut2], btype=type, ftype='butter', output='sos') 
+            #sos = signal.filter_design.iirfilter(2, [cut1, cut2], rs=40.0, rp=0.5, btype=type, ftype='elliptic', output='sos') 
         else:
             cut = frequency / self.samplefreq * 2.0
-            b,a = signal.filter_design.butter(self.filterorder, cut, btype=type) 
-        zi = signal.lfiltic(b, a, (0.0,))
-        czi = np.resize(zi, (slice.stop - slice.start, len(zi)))
-        return {'slice':slice, 'a':a, 'b':b, 'zi':czi, 'frequency':frequency}
+            sos = signal.filter_design.butter(self.filterorder, cut, btype=type, output='sos') 
+        czi = np.zeros((len(sos), slice.stop - slice.start, 2))
+        return {'slice':slice, 'sos':sos, 'zi':czi, 'frequency':frequency}
 
     def process_update(self, params):
         ''' Calculate filter parameters for updated channels
@@ -139,6 +166,8 @@ class FLT_Eeg(ModuleBase):
         self.lpFilter = []
         self.hpFilter = []
         self.notchFilter = []
+        # the kernel starts with the new filter groups and states
+        self.set_kernel(FLT_Kernel(self.hpFilter, self.lpFilter, self.notchFilter))
 
         # nothing to filter
         if len(params.channel_properties) == 0:
@@ -212,29 +241,12 @@ class FLT_Eeg(ModuleBase):
         if self.data.recording_mode == RecordingMode.IMPEDANCE:
             return
 
-        # replace channel filter configuration within the data block with our modified configuration
-        for channel in range(len(self.data.channel_properties)):
-            self.data.channel_properties[channel].lowpass = self.params.channel_properties[channel].lowpass
-            self.data.channel_properties[channel].highpass = self.params.channel_properties[channel].highpass
-            self.data.channel_properties[channel].notchfilter = self.params.channel_properties[channel].notchfilter
+        # the filter configuration of the channels is published by process_update(),
+        # output blocks reference it through the configuration epoch
         
-        # highpass filter
-        for flt in self.hpFilter:
-            self.data.eeg_channels[flt['slice']],flt['zi'] = \
-                signal.lfilter(flt['b'], flt['a'], 
-                               self.data.eeg_channels[flt['slice']], zi=flt['zi'])
-            
-        # lowpass filter
-        for flt in self.lpFilter:
-            self.data.eeg_channels[flt['slice']],flt['zi'] = \
-                signal.lfilter(flt['b'], flt['a'], 
-                               self.data.eeg_channels[flt['slice']], zi=flt['zi'])
-       
-        # notch filter
-        for flt in self.notchFilter:
-            self.data.eeg_channels[flt['slice']],flt['zi'] = \
-                signal.lfilter(flt['b'], flt['a'], 
-                               self.data.eeg_channels[flt['slice']], zi=flt['zi'])
+        # highpass, lowpass and notch filter, depending on the execution mode
+        # in the worker thread or in the kernel worker process
+        self.execute_kernel(self.data)
             
             
     
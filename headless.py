@@ -1,13 +1,31 @@
-"""Minimal headless fallback when GUI dependencies are absent.
+"""Headless runtime and minimal fallback when GUI dependencies are absent.
 
-This prints a helpful diagnostics summary instead of crashing so that
+``run()`` prints a helpful diagnostics summary instead of crashing so that
 `python main.py` completes successfully even if Qt/numpy/other heavy
 packages are unavailable in the current environment.
+
+``HeadlessRuntime`` runs the module chain of a PyCorder XML configuration
+without a Qt event loop, e.g. on recording rigs and benchmark machines::
+
+    python headless.py -c jim32_50k.xml --remote
+    python headless.py -c jim32_50k.xml --start --duration 60
+
+Module events are delivered by the Qt independent ``eventbus``. Modules which
+create widgets in their constructor still need the Qt libraries; they get an
+offscreen ``QApplication`` that is never executed. Pure display modules are
+skipped (see ``--skip``).
 """
 from __future__ import annotations
 
+import argparse
+import importlib
+import inspect
+import os
+import signal
+import sys
 import textwrap
-from typing import Iterable, Sequence
+import time
+from typing import Iterable, List, Optional, Sequence
 
 
 def _format_list(items: Sequence[str]) -> str:
@@ -59,5 +77,249 @@ def run(reason: str | None = None) -> None:
     )
 
 
+#: python modules of the configuration that only display data
+DEFAULT_SKIP = ("display", "impedance")
+
+
+def prepare_environment() -> None:
+    """Select the Qt independent event bus for the module chain.
+
+    Has to run before ``modbase`` is imported, it is called when this module
+    is imported.
+    """
+    os.environ["PYCORDER_HEADLESS"] = "1"
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    directory = os.path.dirname(os.path.abspath(__file__))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+
+prepare_environment()
+try:
+    import numpy as np
+    import eventbus
+    import modbase
+    import actichamp_w
+    from eventbus import EventObject
+    from modbase import ModuleEvent, EventType, ErrorSeverity, SIGNAL
+    from remote import RemoteControlServer, RemoteCommandHandler
+    _import_error: Optional[ImportError] = None
+except ImportError as exc:  # pragma: no cover - only the diagnostics run() is available
+    EventObject = RemoteCommandHandler = object  # type: ignore[misc,assignment]
+    _import_error = exc
+
+
+class HeadlessRuntime(EventObject, RemoteCommandHandler):
+    """Build and run a module chain from a PyCorder XML configuration.
+
+    Parameters
+    ----------
+    config_file:
+        PyCorder XML configuration, defines module order and settings.
+    skip:
+        Python module names (``module`` attribute of the XML elements)
+        which are not instantiated.
+    remote:
+        Start the remote control server (TCP port 6700).
+    """
+
+    def __init__(self, config_file: str, skip: Sequence[str] = DEFAULT_SKIP,
+                 remote: bool = False) -> None:
+        if _import_error is not None:
+            raise _import_error
+        if not modbase.HEADLESS:
+            raise RuntimeError("modbase was imported before headless, "
+                               "call headless.prepare_environment() first")
+        EventObject.__init__(self)
+        try:
+            from PyQt4 import Qt
+            # widgets of module panes can't be created without an application object,
+            # the Qt event loop is never executed
+            self.app = Qt.QApplication.instance() or Qt.QApplication([sys.argv[0]])
+        except ImportError:
+            self.app = None
+        self.skip = list(skip)
+        self.modules: List[modbase.ModuleBase] = []
+        self.topmodule: Optional[modbase.ModuleBase] = None
+        self.recording_mode = -1
+        self.running = True
+        self.RC = None
+        self._build_chain(config_file)
+        if remote:
+            self.RC = RemoteControlServer()
+            self.connect(self.RC, SIGNAL("event(PyQt_PyObject)"), self.processEvent)
+
+    def _build_chain(self, filename: str) -> None:
+        """Instantiate the modules in configuration order and connect them top -> down."""
+        from lxml import objectify
+        cfg = objectify.parse(filename)
+        for element in cfg.xpath("//PyCorder/modules/*"):
+            module_name = element.get("module")
+            if module_name is None or module_name in self.skip:
+                continue
+            module_class = self._find_module_class(module_name, element.tag)
+            self.modules.append(module_class(instance=int(element.get("instance", 0))))
+        if not self.modules:
+            raise RuntimeError(f"{filename} does not define any headless module")
+        for parent, receiver in zip(self.modules, self.modules[1:]):
+            parent.add_receiver(receiver)
+        self.topmodule = self.modules[0]
+        self.connect(self.topmodule, SIGNAL("event(PyQt_PyObject)"), self.processEvent)
+        self.topmodule.connect(self, SIGNAL("parentevent(PyQt_PyObject)"),
+                               self.topmodule.parent_event, modbase.QueuedConnection)
+        # some modules keep their state in the online configuration pane,
+        # create the panes like the main window does, they are never shown
+        if self.app is not None:
+            self.panes = [module.get_online_configuration() for module in self.modules]
+        # initial module chain update, then apply the configuration
+        self.topmodule.update_receivers()
+        self._loadConfiguration(filename)
+
+    def _find_module_class(self, module_name: str, tag: str) -> type:
+        """Get the module class of a configuration element.
+
+        The element tag is the class name or, if they differ (e.g. EegFilter),
+        the python module defines a single ModuleBase class.
+        """
+        module = importlib.import_module(module_name)
+        if isinstance(getattr(module, tag, None), type):
+            return getattr(module, tag)
+        classes = [c for c in vars(module).values()
+                   if isinstance(c, type) and issubclass(c, modbase.ModuleBase)
+                   and c.__module__ == module.__name__]
+        if len(classes) != 1:
+            raise RuntimeError(f"module class for <{tag} module='{module_name}'> not found")
+        return classes[0]
+
+    def _loadConfiguration(self, filename: str) -> None:
+        """Set up all modules from a configuration file and update the chain."""
+        from lxml import objectify
+        cfg = objectify.parse(filename)
+        for module in self.modules:
+            module.setXML(cfg)
+        self.topmodule.update_receivers()
+        print(f"Configuration: {filename}")
+
+    def sendEvent(self, event) -> None:
+        """Send an event to the top module event chain."""
+        self.emit(SIGNAL("parentevent(PyQt_PyObject)"), event)
+
+    def start(self, mode: str = "StartRecording") -> None:
+        """Start the acquisition, mode is the top module command."""
+        self.sendEvent(ModuleEvent("Headless", EventType.COMMAND, info=mode))
+
+    def stop(self) -> None:
+        """Stop the acquisition and all modules."""
+        self.sendEvent(ModuleEvent("Headless", EventType.COMMAND, info="Stop", cmd_value="force"))
+
+    def processEvent(self, event) -> None:
+        """Log events of the module chain and handle remote commands."""
+        self.processRemoteFeedback(event)
+        if event.type == EventType.COMMAND:
+            if event.info != "RemoteCommand":
+                return
+            cmd_log, cmd_error = self.processRemoteCommand(event.cmd_value)
+            if cmd_error:
+                event.type = EventType.ERROR
+                event.severity = ErrorSeverity.IGNORE
+                event.info = cmd_error
+            else:
+                event.type = EventType.LOGMESSAGE
+                event.info = cmd_log
+        if event.type == EventType.STATUS:
+            if event.status_field == "Mode":
+                self.recording_mode = event.info
+            # status values are updated continuously, don't flood the log
+            return
+        print(f"{event.event_time:%H:%M:%S} {event}")
+        if event.type == EventType.ERROR and event.severity > 1:
+            self._stop_chain()
+
+    def _stop_chain(self) -> None:
+        """Stop the module chain, source modules may refuse to stop while recording."""
+        if "force" in inspect.signature(self.topmodule.stop).parameters:
+            self.topmodule.stop(force=True)
+        else:
+            self.topmodule.stop()
+
+    def run(self, duration: Optional[float] = None) -> None:
+        """Deliver module events until terminated or the duration is over."""
+        end = None if duration is None else time.perf_counter() + duration
+        while self.running and (end is None or time.perf_counter() < end):
+            eventbus.bus.process_events(0.1)
+
+    def terminate(self) -> None:
+        """Stop and clean up all modules and the remote control server."""
+        self._stop_chain()
+        for module in self.modules:
+            module.terminate()
+        if self.RC is not None:
+            self.RC.terminate()
+        eventbus.bus.process_events()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Command line entry point of the headless runtime."""
+    parser = argparse.ArgumentParser(description="Run a PyCorder module chain without GUI")
+    parser.add_argument("-c", "--configfile", help="PyCorder XML configuration file")
+    parser.add_argument("--skip", default=",".join(DEFAULT_SKIP),
+                        help="comma separated python modules not to instantiate")
+    parser.add_argument("--remote", action="store_true",
+                        help="start the remote control server (start/stop through port 6700)")
+    parser.add_argument("--start", choices=["monitoring", "impedance"],
+                        help="start the acquisition immediately")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="stop and exit after DURATION seconds")
+    parser.add_argument("--float32", action="store_true",
+                        help="process the channel data in single precision")
+    parser.add_argument("--simulate", default=None, metavar="SPEC",
+                        help="use the simulated actiCHamp device, SPEC is 1 or the device "
+                             "and fault options (see champsim.parse_options())")
+    parser.add_argument("--latency", type=int, default=None, metavar="MS",
+                        choices=actichamp_w.LATENCY_MODES if _import_error is None else None,
+                        help="acquisition block interval in ms (see actichamp_w.LATENCY_MODES)")
+    parser.add_argument("--metrics", default=None,
+                        help="append periodic module metrics snapshots to METRICS (JSON lines)")
+    parser.add_argument("--metrics-interval", type=float, default=10.0,
+                        help="module metrics snapshot interval in seconds")
+    args = parser.parse_args(argv)
+    if args.float32 and _import_error is None:
+        # modbase is already imported, sets the environment for kernel processes too
+        modbase.set_sample_type(np.float32)
+    # actichamp_w is already imported, the environment is passed to kernel processes
+    if args.simulate:
+        os.environ["PYCORDER_SIMULATE"] = args.simulate
+        if _import_error is None:
+            actichamp_w.SIMULATION = args.simulate
+    if args.latency:
+        os.environ["PYCORDER_LATENCY"] = str(args.latency)
+        if _import_error is None:
+            actichamp_w.USB_READ_INTERVAL = actichamp_w.latency_interval(args.latency)
+    if not args.configfile:
+        run()
+        return 0
+
+    runtime = HeadlessRuntime(args.configfile, [s for s in args.skip.split(",") if s],
+                              args.remote)
+    import metrics
+    if args.metrics:
+        metrics.registry.start_export(args.metrics, args.metrics_interval)
+
+    def _terminate(signum, frame):
+        runtime.running = False
+    signal.signal(signal.SIGINT, _terminate)
+    signal.signal(signal.SIGTERM, _terminate)
+
+    if args.start:
+        runtime.start({"monitoring": "StartRecording",
+                       "impedance": "StartImpedance"}[args.start])
+    try:
+        runtime.run(args.duration)
+    finally:
+        metrics.registry.stop_export()
+        runtime.terminate()
+    return 0
+
+
 if __name__ == "__main__":
-    run()
+    sys.exit(main())
@@ -43,6 +43,8 @@ class IMP_Display(ModuleBase):
     def __init__(self, *args, **keys):
         ''' Constructor
         '''
+        # lightweight module, runs in the worker thread of the parent module
+        keys.setdefault("inline", True)
         ModuleBase.__init__(self, name="Impedance Display", **keys)
 
         # XML parameter version
@@ -287,7 +289,7 @@ class DlgImpedance(Qt.QDialog, frmImpedanceDisplay.Ui_frmImpedanceDisplay):
         # actions
         self.connect(self.comboBoxRange, Qt.SIGNAL("editTextChanged(QString)"), self._rangeChanged)
         self.connect(self.checkBoxValues, Qt.SIGNAL("stateChanged(int)"), self._showvalues_changed)
-        self.connect(self.module, Qt.SIGNAL('update(PyQt_PyObject)'), self._updateValues)
+        self.module.connect(self.module, Qt.SIGNAL('update(PyQt_PyObject)'), self._updateValues)
 
         
     def _rangeChanged(self, rrange):
@@ -71,6 +71,7 @@ except NameError:
     unicode = str
 
 from PyQt4 import QtCore
+from PyQt4 import QtGui
 
 __version__ = "1.0.9"
 '''Application Version'''
@@ -114,13 +115,28 @@ def create_option_parser():
 		parser.add_option("-c", "--configfile", dest="ConfigurationFile",
 											help="Load CONFIGURATIONFILE instead of last configuration.")
 		parser.add_option("-r", "--runas", dest="RunAs", default="",
-											help="Specify the module configuration that should be used.")
+											help="Specify the module configuration that should be used "
+													 "(RC - remote client, MULTI - multiple amplifiers, "
+													 "REPLAY - replay a recording).")
 		parser.add_option("-o", "--options", dest="Options", default="",
 											help="General options: R - start the remote server")
 		parser.add_option("--smoketest", action="store_true", dest="SmokeTest", default=False,
 											help="Run a headless startup smoke test and quit automatically.")
 		parser.add_option("--smoketest-ms", type="int", dest="SmokeTestMs", default=1500,
 											help="Milliseconds to keep the Qt event loop running in --smoketest mode.")
+		parser.add_option("--float32", action="store_true", dest="Float32", default=False,
+											help="Process the channel data in single precision (float32).")
+		parser.add_option("--simulate", dest="Simulate", default=None, metavar="SPEC",
+											help="Use the simulated actiCHamp device instead of the hardware, SPEC is 1 or "
+													 "the device and fault options, e.g. modules=5,drop=10:100,wrap=30,stall=20:0.5")
+		parser.add_option("--latency", type="choice", dest="Latency", default=None, metavar="MS",
+											choices=[str(ms) for ms in actichamp_w.LATENCY_MODES],
+											help="Acquisition block interval in ms (%s; default %d)."%(
+												", ".join(str(ms) for ms in actichamp_w.LATENCY_MODES), actichamp_w.DEFAULT_LATENCY))
+		parser.add_option("--metrics", dest="MetricsFile", default=None,
+											help="Append periodic module metrics snapshots to METRICSFILE (JSON lines).")
+		parser.add_option("--metrics-interval", type="float", dest="MetricsInterval", default=10.0,
+											help="Module metrics snapshot interval in seconds.")
 		return parser
 
 
@@ -170,10 +186,12 @@ IMPORT AND INSTANTIATE RECORDING MODULES
 ------------------------------------------------------------
 '''
 # import the remote control server
-from remote import RemoteControlServer
+from remote import RemoteControlServer, RemoteCommandHandler
 
 # import base functionality modules
 from amplifier import AMP_ActiChamp
+from multiamp import AMP_MultiChamp
+from replay import REP_Vision
 from storage import StorageVision
 from filter import FLT_Eeg
 from trigger import TRG_Eeg
@@ -183,6 +201,11 @@ from rda_server import RDA_Server
 from rda_client import RDA_Client
 from montage import MNT_Recording
 from modbase import *
+import modbase
+import eventbus
+import actichamp_w
+import metrics
+from profiler import profiler
 
 # import your own modules here
 #from tutorial.tut_0 import TUT_0
@@ -207,6 +230,26 @@ def InstantiateModules(run_as):
 									 FLT_Eeg(),
 									 IMP_Display(),
 									 DISP_Scope(instance=0)]
+		elif 'REPLAY' in run_as:
+				# reprocess a recorded data set, the channel data are already referenced
+				modules = [REP_Vision(),
+									 TRG_Eeg(),
+									 StorageVision(),
+									 FLT_Eeg(),
+									 RDA_Server(),
+									 DISP_Scope(instance=0)
+									 ]
+		elif 'MULTI' in run_as:
+				# run as recorder for multiple synchronized actiCHamp amplifiers
+				modules = [AMP_MultiChamp(),
+									 MNT_Recording(),
+									 TRG_Eeg(),
+									 StorageVision(),
+									 FLT_Eeg(),
+									 RDA_Server(),
+									 IMP_Display(),
+									 DISP_Scope(instance=0)
+									 ]
 		else:
 				# run as actiCHamp recorder
 				modules = [AMP_ActiChamp(),
@@ -228,7 +271,7 @@ APPLICATION MAIN WINDOW
 ------------------------------------------------------------
 '''
 
-class MainWindow(Qt.QMainWindow, frmMain.Ui_MainWindow):
+class MainWindow(Qt.QMainWindow, frmMain.Ui_MainWindow, RemoteCommandHandler):
 		''' Application Main Window Class
 		includes main menu, status bar and module handling
 		'''
@@ -253,6 +296,9 @@ class MainWindow(Qt.QMainWindow, frmMain.Ui_MainWindow):
 										 Qt.SLOT('close()'))
 				self.connect(self.actionShow_Log, Qt.SIGNAL('triggered()'),
 										 self.statusWidget.showLogEntries)
+				self.connect(self.actionShow_Metrics, Qt.SIGNAL('triggered()'),
+										 self.showMetrics)
+				self.metricsDialog = None
 				self.connect(self.actionLoad_Configuration, Qt.SIGNAL('triggered()'),
 										 self.loadConfiguration)
 				self.connect(self.actionSave_Configuration, Qt.SIGNAL('triggered()'),
@@ -299,6 +345,15 @@ class MainWindow(Qt.QMainWindow, frmMain.Ui_MainWindow):
 				# merge run configuration with old style
 				if self.cmd_options.RunAs == "" and RemoteClient:
 						self.cmd_options.RunAs = "RC"
+				# channel sample type of the module chain
+				if self.cmd_options.Float32:
+						modbase.set_sample_type(np.float32)
+				# simulated amplifier device
+				if self.cmd_options.Simulate:
+						actichamp_w.SIMULATION = self.cmd_options.Simulate
+				# acquisition latency mode
+				if self.cmd_options.Latency:
+						actichamp_w.USB_READ_INTERVAL = actichamp_w.latency_interval(self.cmd_options.Latency)
 
 
 				# create module chain (top = index 0, bottom = last index)
@@ -335,10 +390,10 @@ class MainWindow(Qt.QMainWindow, frmMain.Ui_MainWindow):
 						self.bottommodule = self.modules[-1]
 
 				# get events from module chain top module
-				self.connect(self.topmodule, Qt.SIGNAL("event(PyQt_PyObject)"), self.processEvent)
+				eventbus.connect(self.topmodule, Qt.SIGNAL("event(PyQt_PyObject)"), self.processEvent)
 
 				# tell the top module to get events from us
-				self.topmodule.connect(self, Qt.SIGNAL("parentevent(PyQt_PyObject)"), self.topmodule.parent_event, Qt.Qt.QueuedConnection)
+				eventbus.connect(self, Qt.SIGNAL("parentevent(PyQt_PyObject)"), self.topmodule.parent_event, QueuedConnection)
 
 				# get signal panes for plot area
 				self.horizontalLayout_SignalPane.removeItem(self.horizontalLayout_SignalPane.itemAt(0))
@@ -394,9 +449,14 @@ class MainWindow(Qt.QMainWindow, frmMain.Ui_MainWindow):
 				except Exception as e:
 						self.RC = None
 						Qt.QMessageBox.information(None, "Remote Control Server", str(e))
+				# write periodic module metrics snapshots
+				if self.cmd_options.MetricsFile != None:
+						metrics.registry.start_export(self.cmd_options.MetricsFile,
+																					self.cmd_options.MetricsInterval)
+
 				if self.RC != None:
 						# get events from server
-						self.connect(self.RC, Qt.SIGNAL("event(PyQt_PyObject)"), self.processEvent)
+						eventbus.connect(self.RC, Qt.SIGNAL("event(PyQt_PyObject)"), self.processEvent)
 
 				# performance boost ;-)
 				self.startTimer(1)
@@ -638,6 +698,14 @@ class MainWindow(Qt.QMainWindow, frmMain.Ui_MainWindow):
 				self.updateModuleInfo()
 				self.statusWidget.showLogEntries()
 
+		def showMetrics(self):
+				''' Show the module latency and throughput metrics
+				'''
+				if self.metricsDialog == None:
+						self.metricsDialog = DlgMetricsView(self)
+				self.metricsDialog.show()
+				self.metricsDialog.raise_()
+
 		def saveLogFile(self):
 				''' Write log entries to file
 				'''
@@ -672,6 +740,7 @@ class MainWindow(Qt.QMainWindow, frmMain.Ui_MainWindow):
 						event.ignore()
 				else:
 						self.topmodule.stop(force=True)
+						metrics.registry.stop_export()
 						self.savePreferences()
 						# clean up modules
 						for module in flatten(self.modules):
@@ -687,145 +756,6 @@ class MainWindow(Qt.QMainWindow, frmMain.Ui_MainWindow):
 				self.emit(Qt.SIGNAL('parentevent(PyQt_PyObject)'), event)
 
 
-		def processRemoteCommand(self, cmd_string):
-				''' Process commands received from remote control
-				@param cmd: the received command
-				@return: log entry and error message
-				'''
-				error_message = ""
-				log_entry = u"command received: '%s'"%(cmd_string)
-				if len(cmd_string) > 0:
-						# split command and value
-						cmd = cmd_string[0].upper()
-						if len(cmd_string) > 1:
-								cmd_value = cmd_string[1:]
-						else:
-								cmd_value = ""
-
-						# check for supported commands
-						if cmd not in ["1", "2", "3", "4", "M", "I", "S", "Q", "X", "F"]:
-								error_message = u"command not supported: '%s'"%(cmd_string)
-
-						# check the recording state and if the requested command can be applied
-						elif cmd in ["S", "I", "M", "X", "Q"] and self.topmodule.isRunning() and not self.RC.remoteRecording:
-								error_message = u"recording is in progress and was not started remote: '%s'"%(cmd_string)
-
-						elif cmd not in ["Q", "X"] and not self.topmodule.query("RemoteStop"):
-								error_message = u"recording is still in progress, stop it first with 'X': '%s'"%(cmd_string)
-
-						elif cmd in ["1", "2", "3", "4"] and self.topmodule.isRunning():
-								error_message = u"data acquisition is still in progress, stop it first with 'X': '%s'"%(cmd_string)
-
-						elif cmd in ["4", "S", "I", "M", "X", "Q"] and not self.RC.isInitialized():
-								error_message = u"some variables (1 Configuration file, 2 Experiment ID or 3 Subject ID) are not initialized: '%s'"%(cmd_string)
-
-						# Initialization
-						elif cmd == "1":
-								self.RC.S_ConfigurationFile = cmd_value
-						elif cmd == "2":
-								self.RC.S_ExperimentNr = cmd_value
-						elif cmd == "3":
-								self.RC.S_SubjectID = cmd_value
-						elif cmd == "4":
-								# prepare recording
-								# load configuration file
-								try:
-										self._loadConfiguration(self.RC.S_ConfigurationFile)
-								except:
-										error_message = u"failed to load configuration file: '%s'"%(self.RC.S_ConfigurationFile)
-
-						# Exit
-						elif cmd == "X":
-								# exit, stop everything and reset all state variables
-								# stop data acquisition
-								self.sendEvent(ModuleEvent("RemoteControl",
-																						EventType.COMMAND,
-																						info="Stop",
-																						cmd_value="force"))
-								#self.RC.resetControlState()
-								self.RC.remoteRecording = False
-
-						# Monitoring
-						elif cmd == "I":
-								# start impedance mode
-								self.sendEvent(ModuleEvent("RemoteControl",
-																						EventType.COMMAND,
-																						info="StartImpedance"))
-								self.RC.remoteRecording = True
-
-						elif cmd == "M":
-								# start monitoring
-								self.sendEvent(ModuleEvent("RemoteControl",
-																						EventType.COMMAND,
-																						info="StartRecording"))
-								self.RC.remoteRecording = True
-
-						# Recording
-						elif cmd == "S":
-								# start monitoring if not yet started
-								if not self.topmodule.isRunning() or self.recording_mode != RecordingMode.NORMAL:
-										self.sendEvent(ModuleEvent("RemoteControl",
-																								EventType.COMMAND,
-																								info="StartRecording"))
-								# start recording
-								filename = "%s_%s"%(self.RC.S_ExperimentNr, self.RC.S_SubjectID)
-								self.sendEvent(ModuleEvent("RemoteControl",
-																						EventType.COMMAND,
-																						info="StartSaving",
-																						cmd_value=filename))
-								self.RC.remoteRecording = True
-
-						elif cmd == "Q":
-								# stop recording
-								self.sendEvent(ModuleEvent("RemoteControl",
-																						EventType.COMMAND,
-																						info="StopSaving"))
-
-						# enable / disable feedback
-						elif cmd == "F":
-								self.RC.feedbackEnabled = (cmd_value == "1")
-
-				else:
-						error_message = u"invalid command (size=0)"
-
-				# send feedback
-				if error_message:
-						self.RC.send_feedback("%sFAILED %s"%(cmd, error_message))
-				else:
-						if cmd in ["S", "I", "M"]:
-								self.RC.postpone_feedback(cmd)
-						else:
-								self.RC.send_feedback("%sOK"%(cmd))
-
-				return log_entry, error_message
-
-
-		def processRemoteFeedback(self, event):
-				''' Handle postponed command feedbacks
-				'''
-				if not self.RC:
-						return
-				if not self.RC.isClientConnected():
-						return
-
-				for idx, cmd in enumerate(self.RC.postponed):
-						if event.type == EventType.ERROR:
-								self.RC.send_feedback("%sFAILED %s"%(cmd, event.info))
-								del self.RC.postponed[idx]
-						elif cmd == "M":
-								if event.type == EventType.STATUS and event.status_field == "Mode" and event.info == RecordingMode.NORMAL:
-										self.RC.send_feedback("%sOK"%(cmd))
-										del self.RC.postponed[idx]
-						elif cmd == "I":
-								if event.type == EventType.STATUS and event.status_field == "Mode" and event.info == RecordingMode.IMPEDANCE:
-										self.RC.send_feedback("%sOK"%(cmd))
-										del self.RC.postponed[idx]
-						elif cmd == "S":
-								if event.type == EventType.STATUS and event.status_field == "Storage" and event.info:
-										self.RC.send_feedback("%sOK %s"%(cmd, event.info))
-										del self.RC.postponed[idx]
-
-
 		def processEvent(self, event):
 				''' Process events from module chain
 				@param event: ModuleEvent object
@@ -1039,6 +969,96 @@ class DlgLogView(Qt.QDialog, frmLogView.Ui_frmLogView):
 				self.labelView.setPlainText(entry)
 
 
+'''
+------------------------------------------------------------
+MODULE METRICS DIALOG
+------------------------------------------------------------
+'''
+
+class DlgMetricsView(Qt.QDialog):
+		''' Show latency and throughput metrics of all modules, updated every second
+		'''
+		columns = [("Module", lambda m: "%s %d"%(m['module'], m['instance'])),
+							 ("Blocks", lambda m: "%d"%(m['blocks_in'])),
+							 ("Samples", lambda m: "%d"%(m['samples_in'])),
+							 ("Input p50/p99/max [ms]", lambda m: "%.2f / %.2f / %.2f"%(m['input_ms']['p50'], m['input_ms']['p99'], m['input_ms']['max'])),
+							 ("Output p50/p99/max [ms]", lambda m: "%.2f / %.2f / %.2f"%(m['output_ms']['p50'], m['output_ms']['p99'], m['output_ms']['max'])),
+							 ("Queue / max", lambda m: "%d / %d"%(m['queue_depth'], m['queue_high_water'])),
+							 ("Dropped", lambda m: "%d (%d samples)"%(m['dropped_blocks'], m['dropped_samples'])),
+							 ("Coalesced / Blocked [s]", lambda m: "%d / %.1f"%(m['coalesced_blocks'], m['blocked_time'])),
+							 ("Idle [%]", lambda m: "%.1f"%(100.0 * m['idle_time'] / m['elapsed'])),
+							 ("Utilization [%]", lambda m: "%.1f"%(m['utilization'])),
+							 ]
+
+		def __init__(self, *args):
+				Qt.QDialog.__init__(self, *args)
+				self.setWindowTitle("Module Metrics")
+				self.resize(1000, 300)
+				layout = QtGui.QVBoxLayout(self)
+				self.table = QtGui.QTableWidget(0, len(self.columns), self)
+				self.table.setHorizontalHeaderLabels([c[0] for c in self.columns])
+				self.table.verticalHeader().setVisible(False)
+				self.table.setEditTriggers(Qt.QAbstractItemView.NoEditTriggers)
+				self.table.setSelectionBehavior(Qt.QAbstractItemView.SelectRows)
+				layout.addWidget(self.table)
+				# sampling profiler for the selected modules
+				profileLayout = QtGui.QHBoxLayout()
+				self.spinBoxProfile = Qt.QSpinBox(self)
+				self.spinBoxProfile.setRange(1, 3600)
+				self.spinBoxProfile.setValue(60)
+				self.spinBoxProfile.setSuffix(" s")
+				self.pushButtonProfile = QtGui.QPushButton(self)
+				self.labelProfile = Qt.QLabel(self)
+				profileLayout.addWidget(self.spinBoxProfile)
+				profileLayout.addWidget(self.pushButtonProfile)
+				profileLayout.addWidget(self.labelProfile, 1)
+				layout.addLayout(profileLayout)
+				self.connect(self.pushButtonProfile, Qt.SIGNAL("clicked()"), self._profileClicked)
+				self.updateTable()
+				self.startTimer(1000)
+
+		def timerEvent(self, e):
+				if self.isVisible():
+						self.updateTable()
+
+		def _profileClicked(self):
+				''' Start profiling the selected modules (all modules if nothing is selected)
+				or stop the running profiler
+				'''
+				if profiler.isRunning():
+						profiler.stop()
+						self.updateTable()
+						return
+				rows = sorted(set(index.row() for index in self.table.selectedIndexes()))
+				names = [str(self.table.item(row, 0).text()) for row in rows]
+				try:
+						self.parent().startProfiler(names or None, self.spinBoxProfile.value())
+				except Exception as e:
+						Qt.QMessageBox.warning(self, "Profiler", str(e))
+				self.updateTable()
+
+		def updateTable(self):
+				''' Get a new snapshot from the metrics registry
+				'''
+				snapshot = metrics.registry.snapshot()['modules']
+				self.table.setRowCount(len(snapshot))
+				for row, m in enumerate(snapshot):
+						for column, c in enumerate(self.columns):
+								# keep the items, the selection gets lost if they are replaced
+								item = self.table.item(row, column)
+								if item == None:
+										self.table.setItem(row, column, QtGui.QTableWidgetItem(c[1](m)))
+								else:
+										item.setText(c[1](m))
+				self.table.resizeColumnsToContents()
+				if profiler.isRunning():
+						self.pushButtonProfile.setText("Stop Profiling")
+						self.labelProfile.setText("Profiling to %s"%(profiler.filename))
+				else:
+						self.pushButtonProfile.setText("Profile Selected Modules")
+						self.labelProfile.setText("" if profiler.filename == None else "Last profile: %s"%(profiler.filename))
+
+
 '''
 ------------------------------------------------------------
 BATTERY INFO DIALOG
@@ -1378,6 +1398,8 @@ def main(args):
 		print("Starting PyCorder, please wait ...\n")
 		setpriority(priority=4)
 		app = Qt.QApplication(args)
+		# deliver queued module chain events in the GUI thread
+		attach_event_loop()
 		rc = 0
 		try:
 				from res import resources_rc as _resources_rc
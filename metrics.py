@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+'''
+Module Latency and Throughput Metrics
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Every module keeps a ModuleMetrics object, which is registered in the global
+metrics registry. The registry provides snapshots of all modules and can
+append them periodically to a snapshot file (one JSON object per line).
+'''
+
+import bisect
+import datetime
+import json
+import sys
+import threading
+import time
+
+
+class Histogram(object):
+    ''' Logarithmic time histogram from 1us to 10s (10 bins per decade)
+    '''
+    EDGES = [10.0 ** (e / 10.0) for e in range(-60, 11)]    #: upper bin edges in seconds
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        ''' Clear all bins
+        '''
+        self.bins = [0] * (len(self.EDGES) + 1)     #: bin counters, last bin = overflow
+        self.count = 0                              #: number of values
+        self.total = 0.0                            #: sum of all values
+        self.max = 0.0                              #: maximum value
+
+    def add(self, value):
+        ''' Add a value to the histogram
+        @param value: time in seconds
+        '''
+        self.bins[bisect.bisect_left(self.EDGES, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        ''' Get the upper bin edge below which p percent of all values are located
+        @param p: percentile 0..100
+        @return: time in seconds
+        '''
+        if self.count == 0:
+            return 0.0
+        limit = self.count * p / 100.0
+        cumulated = 0
+        for idx, n in enumerate(self.bins):
+            cumulated += n
+            if cumulated >= limit and n > 0:
+                if idx < len(self.EDGES):
+                    return min(self.EDGES[idx], self.max)
+                return self.max
+        return self.max
+
+    def summary(self):
+        ''' Get the histogram statistics in ms
+        @return: dictionary with count, mean, p50, p90, p99 and max
+        '''
+        mean = self.total / self.count if self.count else 0.0
+        return {'count': self.count,
+                'mean': mean * 1000.0,
+                'p50': self.percentile(50) * 1000.0,
+                'p90': self.percentile(90) * 1000.0,
+                'p99': self.percentile(99) * 1000.0,
+                'max': self.max * 1000.0}
+
+
+class ModuleMetrics(object):
+    ''' Latency and throughput counters of a single module.
+    Counters are updated by the module worker thread, except the drop, coalesce
+    and blocking counters, which are updated by the parent module, and the
+    latency counters, which are updated by any thread of a sink module (e.g.
+    the RDA client transmit threads) under the lock.
+    '''
+    def __init__(self, name, instance=0):
+        ''' Create the counter set
+        @param name: module object name
+        @param instance: module instance number
+        '''
+        self.name = name                #: module object name
+        self.instance = instance        #: module instance number
+        self.thread_id = None           #: ident of the thread which executes the module
+        self.input_time = Histogram()   #: process_input() time
+        self.output_time = Histogram()  #: process_output() time, only for blocks sent
+        self.latency = Histogram()      #: acquisition to sink latency, reported by sink modules
+        self.deadline = None            #: latency deadline in seconds, None = no deadline
+        self.lock = threading.RLock()   #: protects the latency histogram and the deadline counters
+        self.reset()
+
+    def reset(self):
+        ''' Reset all counters
+        '''
+        self.input_time.reset()
+        self.output_time.reset()
+        with self.lock:
+            self.latency.reset()
+            self.deadline_misses = 0    #: blocks which arrived after the latency deadline
+        self.blocks_in = 0              #: blocks processed by process_input()
+        self.samples_in = 0             #: samples processed by process_input()
+        self.blocks_out = 0             #: blocks sent to the receivers
+        self.samples_out = 0            #: samples sent to the receivers
+        self.queue_depth = 0            #: current input queue depth
+        self.queue_high_water = 0       #: maximum input queue depth
+        self.dropped_blocks = 0         #: blocks lost because of input queue overrun
+        self.dropped_samples = 0        #: samples lost because of input queue overrun
+        self.dropped_oldest = 0         #: queued blocks replaced by newer blocks
+        self.coalesced_blocks = 0       #: blocks appended to a queued block
+        self.blocked_count = 0          #: number of times the producer had to wait
+        self.blocked_time = 0.0         #: total producer wait time in seconds
+        self.idle_time = 0.0            #: time spent in process_idle() in seconds
+        self.cpu_time = 0.0             #: CPU time of the worker thread in seconds, includes inline receivers
+        self.started = time.perf_counter()
+
+    def add_input(self, duration, samples):
+        self.input_time.add(duration)
+        self.blocks_in += 1
+        self.samples_in += samples
+
+    def add_output(self, duration, samples):
+        self.output_time.add(duration)
+        self.blocks_out += 1
+        self.samples_out += samples
+
+    def add_latency(self, latency):
+        ''' Add an acquisition to sink latency
+        @param latency: time in seconds
+        @return: True if the latency deadline is exceeded
+        '''
+        with self.lock:
+            self.latency.add(latency)
+            if self.deadline != None and latency > self.deadline:
+                self.deadline_misses += 1
+                return True
+            return False
+
+    def add_queue_depth(self, depth):
+        self.queue_depth = depth
+        if depth > self.queue_high_water:
+            self.queue_high_water = depth
+
+    def add_drop(self, samples, oldest=False):
+        self.dropped_blocks += 1
+        self.dropped_samples += samples
+        if oldest:
+            self.dropped_oldest += 1
+
+    def add_coalesced(self):
+        self.coalesced_blocks += 1
+
+    def add_blocked(self, duration):
+        self.blocked_count += 1
+        self.blocked_time += duration
+
+    def add_idle(self, duration):
+        self.idle_time += duration
+
+    def set_cpu_time(self, cpu_time):
+        self.cpu_time = cpu_time
+
+    def add_cpu_time(self, cpu_time):
+        self.cpu_time += cpu_time
+
+    def snapshot(self):
+        ''' Get the current counter values
+        @return: dictionary
+        '''
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        busy = self.input_time.total + self.output_time.total
+        with self.lock:
+            latency = self.latency.summary()
+            deadline_misses = self.deadline_misses
+        return {'module': self.name,
+                'instance': self.instance,
+                'elapsed': elapsed,
+                'blocks_in': self.blocks_in,
+                'samples_in': self.samples_in,
+                'blocks_out': self.blocks_out,
+                'samples_out': self.samples_out,
+                'queue_depth': self.queue_depth,
+                'queue_high_water': self.queue_high_water,
+                'dropped_blocks': self.dropped_blocks,
+                'dropped_samples': self.dropped_samples,
+                'dropped_oldest': self.dropped_oldest,
+                'coalesced_blocks': self.coalesced_blocks,
+                'blocked_count': self.blocked_count,
+                'blocked_time': self.blocked_time,
+                'idle_time': self.idle_time,
+                'cpu_time': self.cpu_time,
+                'cpu_load': 100.0 * self.cpu_time / elapsed,
+                'utilization': 100.0 * busy / elapsed,
+                'input_ms': self.input_time.summary(),
+                'output_ms': self.output_time.summary(),
+                'latency_ms': latency,
+                'deadline_ms': None if self.deadline == None else self.deadline * 1000.0,
+                'deadline_misses': deadline_misses}
+
+
+class MetricsRegistry(object):
+    ''' Collection of all module metrics
+    '''
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+        self._export_thread = None
+        self._export_stop = threading.Event()
+        self.export_error = None        #: first snapshot write error of the current export
+
+    def register(self, metrics):
+        ''' Add a module counter set to the registry
+        @param metrics: ModuleMetrics object
+        '''
+        with self._lock:
+            self._metrics.append(metrics)
+
+    def unregister(self, metrics):
+        ''' Remove a module counter set from the registry
+        @param metrics: ModuleMetrics object
+        '''
+        with self._lock:
+            if metrics in self._metrics:
+                self._metrics.remove(metrics)
+
+    def items(self):
+        ''' Get all registered counter sets
+        @return: list of ModuleMetrics objects
+        '''
+        with self._lock:
+            return list(self._metrics)
+
+    def snapshot(self):
+        ''' Get the counter values of all registered modules
+        @return: dictionary with time stamp and list of module snapshots
+        '''
+        with self._lock:
+            metrics = list(self._metrics)
+        return {'time': datetime.datetime.now().isoformat(),
+                'modules': [m.snapshot() for m in metrics]}
+
+    def write_snapshot(self, filename):
+        ''' Append a snapshot of all modules to a file, one JSON object per line
+        @param filename: snapshot file name
+        '''
+        with open(filename, "a") as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+    def start_export(self, filename, interval=10.0):
+        ''' Start writing periodic snapshots, a final snapshot is written by stop_export()
+        @param filename: snapshot file name
+        @param interval: snapshot interval in seconds
+        '''
+        self.stop_export()
+        self.export_error = None
+        self._export_stop.clear()
+        self._export_thread = threading.Thread(target=self._export_worker, args=(filename, interval))
+        self._export_thread.daemon = True
+        self._export_thread.start()
+
+    def stop_export(self):
+        ''' Write a final snapshot and stop writing periodic snapshots
+        '''
+        if self._export_thread != None:
+            self._export_stop.set()
+            self._export_thread.join(5.0)
+            self._export_thread = None
+
+    def _export_worker(self, filename, interval):
+        while not self._export_stop.wait(interval):
+            self._export(filename)
+        # the last interval of the run, or the whole run if it was shorter than an interval
+        self._export(filename)
+
+    def _export(self, filename):
+        ''' Write a snapshot, report the first write error of the export only
+        @param filename: snapshot file name
+        '''
+        try:
+            self.write_snapshot(filename)
+        except Exception as e:
+            if self.export_error == None:
+                self.export_error = str(e)
+                print("PyCorder metrics export to %s failed: %s"%(filename, e), file=sys.stderr)
+
+
+registry = MetricsRegistry()    #: global metrics registry
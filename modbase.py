@@ -32,7 +32,16 @@ along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
 B{Revision:} $LastChangedRevision: 201 $
 '''
 
-from PyQt4 import Qt
+import os
+# run the module chain without Qt signals and Qt event loop (headless runtime),
+# enabled by the environment variable PYCORDER_HEADLESS or if Qt is not available
+HEADLESS = os.environ.get("PYCORDER_HEADLESS", "") not in ("", "0")
+try:
+    from PyQt4 import Qt
+except ImportError:
+    Qt = None
+    HEADLESS = True
+import eventbus
 import numpy as np
 import time
 import datetime
@@ -41,16 +50,133 @@ try:
 except ImportError:
     import queue
 import threading
+import collections
+import itertools
 import copy
-import os, sys, traceback
+import sys, traceback
 from lxml import etree
 from lxml import objectify 
+from ringbuffer import SampleRingBuffer, RingSpan, RingOverrun
+from procexec import ProcessKernel, KernelProcess
+from metrics import ModuleMetrics
+import metrics
 
 
 # impedance value invalid (electrode disconnected)
 #CHAMP_IMP_INVALID = 2147483647  # INT_MAX
 CHAMP_IMP_INVALID = 999900  # INT_MAX
 
+# worker thread scheduling, True: threads sleep until they get notified about new
+# input data, readiness of output data or incoming commands. False: threads poll
+# the input queue every millisecond (old behavior).
+EVENT_DRIVEN_SCHEDULING = True
+# maximum time in seconds an event driven worker thread sleeps without notification
+IDLE_WAKEUP_TIMEOUT = 0.1
+
+# copy-on-write debug mode, shared data blocks get read-only sample arrays and
+# modifications of shared channel properties or markers are reported as ERROR
+COW_DEBUG = False
+
+# default transport for module output data (class Transport)
+DEFAULT_TRANSPORT = 0
+# ring buffer transport capacity in seconds
+RING_BUFFER_SECONDS = 10.0
+
+# default execution mode for module kernels (class Execution)
+DEFAULT_EXECUTION = 0
+
+# default input queue backpressure policy (class Backpressure)
+DEFAULT_BACKPRESSURE = 0
+# maximum time in seconds a producer waits for a full input queue (Backpressure.BLOCK)
+BACKPRESSURE_TIMEOUT = 5.0
+# maximum number of samples a coalesced block can grow to (Backpressure.COALESCE)
+COALESCE_MAX_SAMPLES = 100000
+
+# inline execution, modules created with inline=True and a single parent module
+# are executed by the worker thread of the parent. False: every module gets its own thread.
+INLINE_EXECUTION = True
+
+# maximum number of module events per second for each module, event type and status field,
+# events in between are coalesced (last value wins). Only STATUS and LOG events are
+# coalesced, all other events are delivered immediately. 0: deliver all events.
+EVENT_RATE_LIMIT = 10.0
+
+# data type of the channel samples (EEG_DataBlock.eeg_channels), set by the source modules.
+# np.float32 halves the memory bandwidth of the module chain and the storage and RDA output
+# conversions, filter coefficients and states are kept in double precision.
+# Enabled by the environment variable PYCORDER_FLOAT32 or the command line option --float32
+SAMPLE_TYPE = np.float32 if os.environ.get("PYCORDER_FLOAT32", "") not in ("", "0") else np.float64
+
+# block interval in seconds the module input queue sizes are specified for, the queues
+# are enlarged for sources with shorter blocks (EEG_DataBlock.block_interval), so they
+# keep buffering the same time span (e.g. in the low latency acquisition modes)
+QUEUE_BLOCK_INTERVAL = 0.05
+
+# minimum interval in seconds between two latency deadline notifications of a module,
+# deadline misses in between are counted and reported with the next notification
+DEADLINE_NOTIFY_INTERVAL = 5.0
+
+# signal base class and helpers of the module chain, module events are dispatched
+# by the event bus, with and without Qt (see attach_event_loop())
+SignalObject = eventbus.EventObject
+SIGNAL = eventbus.SIGNAL
+QueuedConnection = eventbus.Connection.QUEUED
+
+# signal keys of the module chain events
+_EVENT = SIGNAL("event(PyQt_PyObject)")
+_PARENTEVENT = SIGNAL("parentevent(PyQt_PyObject)")
+
+if not HEADLESS:
+    class _EventPump(Qt.QObject):
+        ''' Delivers the queued module chain signals in the GUI thread.
+        All signals posted until the event loop gets control are delivered
+        by a single posted event, i.e. batched per event loop iteration.
+        '''
+        EVENT_TYPE = Qt.QtCore.QEvent.Type(Qt.QtCore.QEvent.registerEventType())
+
+        def wakeup(self):
+            ''' Schedule the delivery, may be called from any thread
+            '''
+            Qt.QtCore.QCoreApplication.postEvent(self, Qt.QtCore.QEvent(self.EVENT_TYPE))
+
+        def event(self, e):
+            if e.type() == self.EVENT_TYPE:
+                eventbus.bus.process_events()
+                return True
+            return Qt.QObject.event(self, e)
+
+_event_pump = None
+
+def attach_event_loop():
+    ''' Let the Qt event loop of the calling (GUI) thread deliver the queued
+    module chain signals. Has to be called after the application object is created.
+    '''
+    global _event_pump
+    if HEADLESS or _event_pump != None:
+        return
+    _event_pump = _EventPump()
+    eventbus.bus.set_wakeup(_event_pump.wakeup)
+    # deliver signals which were queued before the event loop was attached
+    _event_pump.wakeup()
+
+def sample_type():
+    ''' Get the channel sample data type of the module chain, see SAMPLE_TYPE
+    @return: numpy dtype
+    '''
+    return np.dtype(SAMPLE_TYPE)
+
+def set_sample_type(dtype):
+    ''' Set the channel sample data type of the module chain (command line option --float32).
+    The environment is updated too, kernel worker processes (procexec) get the same type.
+    @param dtype: np.float32 or np.float64
+    '''
+    global SAMPLE_TYPE
+    SAMPLE_TYPE = np.dtype(dtype).type
+    os.environ["PYCORDER_FLOAT32"] = "1" if SAMPLE_TYPE == np.float32 else "0"
+
+# configuration epoch ids, each module parameter update publishes a new epoch
+_config_epochs = itertools.count(1)
+
 def GetExceptionTraceBack():
     ''' Get last trace back info as tuple
     @return: tuple(string representation, filename, line number, module)
@@ -114,14 +240,103 @@ class ModuleEvent(object):
         self.status_field = status_field
         self.cmd_value = cmd_value
         self.event_time = datetime.datetime.now()
+        self.coalesced = 0          #: number of replaced events of the same kind (see EventCoalescer)
         
     def __str__(self):
         ''' Event string representation
         '''
         txt = str(self.module) + ': ' + str(self.info)
+        if self.coalesced > 0:
+            txt += " (%d similar events suppressed)"%(self.coalesced)
         return txt
 
 
+class EventCoalescer(object):
+    ''' Rate limiter for STATUS and LOG events sent at block rate (e.g. status values or
+    sample loss log messages). Events are keyed by module, event type and status field.
+    The first event of a key is delivered immediately, events within the following
+    1 / EVENT_RATE_LIMIT seconds replace each other and only the last one is delivered
+    by the flush thread when the interval has elapsed.
+    '''
+    def __init__(self):
+        self._pending = {}      #: key -> [last delivery time, pending module, pending event]
+        self._lock = threading.Condition()
+        self._thread = None     #: flush thread, started with the first coalesced event
+
+    def send(self, module, event):
+        ''' Deliver an event now or coalesce it with the following events
+        @param module: sending ModuleBase object
+        @param event: ModuleEvent object
+        '''
+        rate = EVENT_RATE_LIMIT
+        # messages shown to the user must not replace each other
+        if rate <= 0 or (event.type != EventType.STATUS and event.type != EventType.LOG):
+            module._emit_event(event)
+            return
+        key = (module, event.type, event.status_field)
+        now = time.perf_counter()
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry == None:
+                entry = self._pending[key] = [-1e9, None, None]
+            if entry[2] == None and now - entry[0] >= 1.0 / rate:
+                entry[0] = now
+            else:
+                # last value wins, keep track of the replaced events
+                if entry[2] != None:
+                    event.coalesced += entry[2].coalesced + 1
+                entry[1] = module
+                entry[2] = event
+                if self._thread == None:
+                    self._thread = threading.Thread(target=self._flush_thread, name="EventCoalescer")
+                    self._thread.daemon = True
+                    self._thread.start()
+                self._lock.notify()
+                return
+        module._emit_event(event)
+
+    def remove(self, module):
+        ''' Deliver the pending events of a module and forget its keys,
+        called when the module is stopped or terminated
+        @param module: ModuleBase object
+        '''
+        with self._lock:
+            keys = [key for key in self._pending if key[0] is module]
+            pending = [self._pending.pop(key)[2] for key in keys]
+        for event in pending:
+            if event != None:
+                module._emit_event(event)
+
+    def _flush_thread(self):
+        ''' Deliver coalesced events when their rate limit interval has elapsed
+        '''
+        while True:
+            due = []
+            with self._lock:
+                now = time.perf_counter()
+                interval = 1.0 / EVENT_RATE_LIMIT if EVENT_RATE_LIMIT > 0 else 0.0
+                wait = None
+                for entry in self._pending.values():
+                    if entry[2] == None:
+                        continue
+                    remaining = entry[0] + interval - now
+                    if remaining <= 0:
+                        due.append((entry[1], entry[2]))
+                        entry[0] = now
+                        entry[1] = entry[2] = None
+                    elif wait == None or remaining < wait:
+                        wait = remaining
+                if len(due) == 0:
+                    self._lock.wait(wait)
+                    continue
+            for module, event in due:
+                module._emit_event(event)
+
+
+#: event coalescer of all modules
+_event_coalescer = EventCoalescer()
+
+
 class RecordingMode:
     ''' Module Recording Modes
     @ivar NORMAL: Record EEG
@@ -169,8 +384,15 @@ class EEG_ChannelProperties(object):
         self.highpass = 0.0                 #: high pass cutoff frequency in Hz
         self.notchfilter = False            #: enable / disable notch filter
         self.isReference = False            #: use this channel as reference channel
-        self.color = Qt.Qt.darkBlue         #: display color
+        self.color = Qt.Qt.darkBlue if Qt else None #: display color
         self.unit = ""                      #: channel unit string (use uV if empty)
+
+    def __copy__(self):
+        ''' Shallow copy, all attributes are immutable
+        '''
+        copy_obj = EEG_ChannelProperties.__new__(EEG_ChannelProperties)
+        copy_obj.__dict__.update(self.__dict__)
+        return copy_obj
         
     def __cmp__(self, other):
         ''' Compare two channels by name and group
@@ -236,6 +458,8 @@ class EEG_ChannelProperties(object):
 class EEG_Marker(object):
     ''' Recording marker position and description
     '''
+    __slots__ = ("position", "points", "type", "description", "invisible", "channel", "date", "dt")
+
     def __init__(self, position=0, points=1, type="unknown", description="", channel=0, date=False):
         ''' Create a new marker object
         '''
@@ -246,11 +470,72 @@ class EEG_Marker(object):
         self.invisible = False          #: If true, marker should not be shown.
         self.channel = channel          #: Channel number of marker (0 = all channels).
         self.date = date                #: If true, write date / time to file
+        self.dt = None                  #: Date / time of the marker, set by the storage module
+
+    def __copy__(self):
+        ''' Shallow copy, all attributes are immutable
+        '''
+        copy_obj = EEG_Marker.__new__(EEG_Marker)
+        for name in EEG_Marker.__slots__:
+            setattr(copy_obj, name, getattr(self, name))
+        return copy_obj
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
              
 
+class Transport:
+    ''' Module output data transport
+    @ivar QUEUE: data blocks including sample arrays are passed through the receiver input queues
+    @ivar RING: sample data is written to a shared memory ring buffer, the receiver
+    input queues get data blocks which only reference the ring buffer span. The receiver
+    copies the span out of the ring buffer when it takes the block from the queue.
+    '''
+    (QUEUE, RING) = range(2)
+
+
+class Execution:
+    ''' Module kernel execution mode
+    @ivar THREAD: execute the kernel in the module worker thread
+    @ivar PROCESS: execute the kernel in a separate worker process
+    '''
+    (THREAD, PROCESS) = range(2)
+
+
+class Backpressure:
+    ''' Input queue overrun handling
+    @ivar DROP_NEWEST: drop the new block and send an ERROR event
+    @ivar DROP_OLDEST: drop the oldest queued block (lossy, e.g. for displays)
+    @ivar BLOCK: let the producer wait until there is space in the queue, drop the
+    new block with an ERROR event after the timeout (lossless, e.g. for storage).
+    Only the single receiver of a parent can block it, a waiting parent would stall its
+    other receivers. Receivers with siblings are handled like DROP_NEWEST.
+    @ivar COALESCE: append the new block to the last queued block, drop the oldest
+    block if the blocks can't be merged or the merged block would grow too large
+    '''
+    (DROP_NEWEST, DROP_OLDEST, BLOCK, COALESCE) = range(4)
+    Name = ["drop newest", "drop oldest", "block", "coalesce"]
+
+
+class BlockPart:
+    ''' Parts of an EEG_DataBlock that can be shared between receivers (bit mask)
+    @ivar DATA: eeg_channels, trigger_channel and sample_channel arrays
+    @ivar PROPERTIES: channel_properties array and its EEG_ChannelProperties objects
+    @ivar MARKERS: markers list and its EEG_Marker objects
+    @ivar ALL: all of the above
+    '''
+    (DATA, PROPERTIES, MARKERS, ALL) = (1, 2, 4, 7)
+    Name = {DATA:"data", PROPERTIES:"channel properties", MARKERS:"markers"}
+
+
 class EEG_DataBlock(object):
     ''' Block of EEG data, channel properties, marker and impedance values 
     '''
+    __slots__ = ("sample_counter", "sample_rate", "eeg_channels", "trigger_channel", "sample_channel",
+                 "channel_properties", "markers", "impedances", "block_time", "performance_timer",
+                 "performance_timer_max", "recording_mode", "ref_channel_name", "shared",
+                 "_shared_state", "ring_span", "epoch", "acquisition_time", "block_interval")
+
     def __init__(self, eeg=32, aux=8):
         ''' Set default values for requested number of channels
         @param eeg: number of EEG channels for this block
@@ -258,7 +543,7 @@ class EEG_DataBlock(object):
         '''
         self.sample_counter = 0          #: total number of received samples
         self.sample_rate = 500.0         #: sample rate in Hz
-        self.eeg_channels = np.zeros((eeg+aux, 1000), 'd')      #: channel data for EEG and AUX
+        self.eeg_channels = np.zeros((eeg+aux, 1000), SAMPLE_TYPE)  #: channel data for EEG and AUX
         self.trigger_channel = np.zeros((1, 1000), np.uint32)   #: trigger values
         self.sample_channel = np.zeros((1, 1000), np.uint64)    #: sample counter
         self.channel_properties = self.get_default_properties(eeg, aux) #: channel properties
@@ -269,26 +554,193 @@ class EEG_DataBlock(object):
         self.performance_timer_max = 0      #: maximum module processing time for this block
         self.recording_mode = RecordingMode.NORMAL #: recording mode of this block
         self.ref_channel_name = ""          #: combined name of reference channels
+        self.shared = 0                     #: BlockPart mask of parts shared with other receivers
+        self._shared_state = None           #: shared references and fingerprints (COW_DEBUG only)
+        self.ring_span = None               #: location of the sample data if transported by ring buffer
+        self.epoch = 0                      #: configuration epoch of the channel properties, 0 = unknown
+        self.acquisition_time = 0.0         #: time.perf_counter() of the hardware read, 0 = unknown
+        self.block_interval = 0.0           #: nominal block length of the source in s, 0 = unknown
+
+    def _clone(self):
+        ''' Get a new block referencing all attributes of this block
+        '''
+        clone = EEG_DataBlock.__new__(EEG_DataBlock)
+        for name in EEG_DataBlock.__slots__:
+            setattr(clone, name, getattr(self, name))
+        return clone
 
     def __copy__(self):
-        ''' We always need a deep copy of channel properties, markers and impedance values
-        '''
-        copy_obj = EEG_DataBlock(1,1)
-        copy_obj.sample_counter = self.sample_counter
-        copy_obj.sample_rate = self.sample_rate
-        copy_obj.eeg_channels = self.eeg_channels
-        copy_obj.trigger_channel = self.trigger_channel
-        copy_obj.sample_channel = self.sample_channel
-        copy_obj.channel_properties = copy.deepcopy(self.channel_properties)
-        copy_obj.markers = copy.deepcopy(self.markers)
-        copy_obj.impedances = copy.deepcopy(self.impedances)
-        copy_obj.block_time = copy.deepcopy(self.block_time)
-        copy_obj.performance_timer = self.performance_timer
-        copy_obj.performance_timer_max = self.performance_timer_max
-        copy_obj.recording_mode = self.recording_mode
-        copy_obj.ref_channel_name = self.ref_channel_name
+        ''' Sample arrays are referenced, channel properties and markers are shared
+        copy-on-write. Call make_writable() on the copy before modifying them in place.
+        The source block is not flagged, its owner (e.g. the output block template of a
+        module) must replace its channel properties or markers after copying instead of
+        modifying them in place (e.g. self.data.markers = []).
+        '''
+        copy_obj = self._clone()
+        copy_obj.shared |= BlockPart.PROPERTIES | BlockPart.MARKERS
+        copy_obj.impedances = list(self.impedances)
+        copy_obj._shared_state = None
+        copy_obj.ring_span = None
         return copy_obj 
 
+    def __deepcopy__(self, memo):
+        ''' Deep copy is always private, nothing is shared with other receivers
+        '''
+        copy_obj = self.__copy__()
+        copy_obj.make_writable(BlockPart.PROPERTIES | BlockPart.MARKERS)
+        copy_obj.eeg_channels = self.eeg_channels.copy()
+        copy_obj.trigger_channel = self.trigger_channel.copy()
+        copy_obj.sample_channel = self.sample_channel.copy()
+        copy_obj.shared = 0
+        return copy_obj
+
+    def share(self):
+        ''' Get a lightweight block for one of several receivers. Sample arrays, channel
+        properties and markers are not copied but shared with all other receivers.
+        Receivers have to call make_writable() before they modify the block in place.
+        Replacing an attribute (e.g. self.data.eeg_channels = filtered) is always allowed.
+        @return: EEG_DataBlock object
+        '''
+        shared_obj = self._clone()
+        shared_obj.shared = BlockPart.ALL
+        shared_obj._shared_state = None
+        shared_obj.ring_span = None
+        if COW_DEBUG:
+            shared_obj.eeg_channels = self._readonly(self.eeg_channels)
+            shared_obj.trigger_channel = self._readonly(self.trigger_channel)
+            shared_obj.sample_channel = self._readonly(self.sample_channel)
+            shared_obj._shared_state = (self.channel_properties, self._fingerprint(self.channel_properties),
+                                        self.markers, self._fingerprint(self.markers))
+        return shared_obj
+
+    def can_concatenate(self, other):
+        ''' Check if another block can be appended to this block
+        @param other: EEG_DataBlock object
+        '''
+        if self.ring_span != None or other.ring_span != None:
+            return False
+        return self.recording_mode != RecordingMode.IMPEDANCE and \
+               self.recording_mode == other.recording_mode and \
+               self.sample_rate == other.sample_rate and \
+               self.eeg_channels.ndim == 2 and other.eeg_channels.ndim == 2 and \
+               self.eeg_channels.shape[0] == other.eeg_channels.shape[0] and \
+               self.eeg_channels.dtype == other.eeg_channels.dtype and \
+               len(self.channel_properties) == len(other.channel_properties)
+
+    def concatenate(cls, blocks):
+        ''' Merge consecutive blocks into one block. Channel properties and block time are
+        taken from the first block, marker positions are sample counter based and don't
+        need to be adjusted.
+        @param blocks: list of EEG_DataBlock objects, see can_concatenate()
+        @return: new EEG_DataBlock object
+        '''
+        first = blocks[0]
+        merged = first._clone()
+        merged.eeg_channels = np.concatenate([b.eeg_channels for b in blocks], 1)
+        merged.trigger_channel = np.concatenate([b.trigger_channel for b in blocks], 1)
+        merged.sample_channel = np.concatenate([b.sample_channel for b in blocks], 1)
+        merged.markers = []
+        shared = 0
+        for b in blocks:
+            merged.markers.extend(b.markers)
+            shared |= b.shared
+        merged.sample_counter = blocks[-1].sample_counter
+        merged.impedances = blocks[-1].impedances
+        merged.performance_timer = max([b.performance_timer for b in blocks])
+        merged.performance_timer_max = max([b.performance_timer_max for b in blocks])
+        # sample data is new, marker objects and properties may still be shared
+        merged.shared = shared & (BlockPart.PROPERTIES | BlockPart.MARKERS)
+        merged._shared_state = None
+        return merged
+    concatenate = classmethod(concatenate)
+
+    def get_slice(self, start, stop):
+        ''' Get a block with a sample range of this block. Sample arrays are views of
+        this block, markers are assigned by their sample counter position.
+        @param start: index of the first sample
+        @param stop: index following the last sample
+        @return: new EEG_DataBlock object
+        '''
+        part = self._clone()
+        part.eeg_channels = self.eeg_channels[:, start:stop]
+        part.trigger_channel = self.trigger_channel[:, start:stop]
+        part.sample_channel = self.sample_channel[:, start:stop]
+        samples = self.sample_channel.shape[1]
+        # markers outside of the block range belong to the first or last part
+        first = self.sample_channel[0, start] if start > 0 else None
+        following = self.sample_channel[0, stop] if stop < samples else None
+        part.markers = [m for m in self.markers
+                        if (first == None or m.position >= first) and
+                           (following == None or m.position < following)]
+        part.block_time = self.block_time + datetime.timedelta(seconds=start / self.sample_rate)
+        part.sample_counter = self.sample_counter - (samples - stop)
+        part._shared_state = None
+        return part
+
+    def get_samples(self):
+        ''' Get the number of samples within this block
+        '''
+        if self.ring_span != None:
+            return self.ring_span.count
+        if self.sample_channel is None or self.sample_channel.ndim != 2:
+            return 0
+        return self.sample_channel.shape[1]
+
+    def make_writable(self, parts=BlockPart.ALL):
+        ''' Copy shared parts of the block before modifying them in place (copy-on-write)
+        @param parts: BlockPart mask of the parts to modify
+        '''
+        parts &= self.shared
+        if parts & BlockPart.DATA:
+            self.eeg_channels = self.eeg_channels.copy()
+            self.trigger_channel = self.trigger_channel.copy()
+            self.sample_channel = self.sample_channel.copy()
+        if parts & BlockPart.PROPERTIES:
+            properties = self.channel_properties.copy()
+            for idx in range(properties.size):
+                properties[idx] = copy.copy(properties[idx])
+            self.channel_properties = properties
+        if parts & BlockPart.MARKERS:
+            self.markers = [copy.copy(marker) for marker in self.markers]
+        self.shared &= ~parts
+
+    def check_shared(self):
+        ''' Check for in place modifications of shared channel properties and markers
+        (COW_DEBUG only, shared sample arrays are read-only in debug mode)
+        @return: BlockPart mask of modified parts
+        '''
+        if self._shared_state == None:
+            return 0
+        properties, properties_fp, markers, markers_fp = self._shared_state
+        modified = 0
+        if (self.shared & BlockPart.PROPERTIES) and (self.channel_properties is properties) and \
+           self._fingerprint(properties) != properties_fp:
+            modified |= BlockPart.PROPERTIES
+        if (self.shared & BlockPart.MARKERS) and (self.markers is markers) and \
+           self._fingerprint(markers) != markers_fp:
+            modified |= BlockPart.MARKERS
+        return modified
+
+    def _readonly(array):
+        ''' Get a read-only view of a numpy array
+        '''
+        view = array.view()
+        view.flags.writeable = False
+        return view
+    _readonly = staticmethod(_readonly)
+
+    def _fingerprint(objects):
+        ''' Get a comparable snapshot of all attributes of a list of objects 
+        '''
+        fingerprint = []
+        for obj in objects:
+            if hasattr(obj, "__slots__"):
+                fingerprint.append((id(obj), [getattr(obj, name) for name in obj.__slots__]))
+            else:
+                fingerprint.append((id(obj), dict(obj.__dict__)))
+        return fingerprint
+    _fingerprint = staticmethod(_fingerprint)
+
     def __cmp__(self, other):
         ''' Compare settings of two data blocks
         '''
@@ -332,24 +784,109 @@ class EEG_DataBlock(object):
 
 
 
-class ModuleBase(Qt.QObject):
+class BlockRechunker(object):
+    ''' Merge or split consecutive data blocks into blocks of a target length
+    '''
+    def __init__(self, samples=None, duration=None):
+        ''' Create the re-chunking buffer
+        @param samples: target block length in samples
+        @param duration: target block length in seconds, used if samples is None
+        '''
+        self.samples = samples
+        self.duration = duration
+        self.reset()
+
+    def reset(self):
+        ''' Discard all pending samples
+        '''
+        self.pending = []
+        self.pending_samples = 0
+
+    def get_target(self, block):
+        ''' Get the target block length in samples for the sample rate of a block
+        '''
+        if self.samples != None:
+            return max(int(self.samples), 1)
+        return max(int(round(self.duration * block.sample_rate)), 1)
+
+    def push(self, block):
+        ''' Add a block to the re-chunking buffer
+        @param block: EEG_DataBlock object
+        @return: list of EEG_DataBlock objects with target length, blocks that can't
+        be re-chunked (e.g. impedance values) are passed through and flush the buffer
+        '''
+        output = []
+        if len(self.pending) > 0 and not self.pending[-1].can_concatenate(block):
+            output.extend(self.flush())
+        if block.recording_mode == RecordingMode.IMPEDANCE or block.eeg_channels.ndim != 2:
+            output.append(block)
+            return output
+        self.pending.append(block)
+        self.pending_samples += block.get_samples()
+        target = self.get_target(block)
+        if self.pending_samples < target:
+            return output
+        # merge the pending blocks and cut them into chunks
+        if len(self.pending) > 1:
+            merged = EEG_DataBlock.concatenate(self.pending)
+        else:
+            merged = self.pending[0]
+        start = 0
+        while self.pending_samples - start >= target:
+            output.append(merged.get_slice(start, start + target))
+            start += target
+        self.reset()
+        if start < merged.get_samples():
+            remainder = merged.get_slice(start, merged.get_samples())
+            self.pending.append(remainder)
+            self.pending_samples = remainder.get_samples()
+        return output
+
+    def flush(self):
+        ''' Get the pending samples as one block
+        @return: list with a single EEG_DataBlock or an empty list
+        '''
+        if len(self.pending) == 0:
+            return []
+        if len(self.pending) > 1:
+            block = EEG_DataBlock.concatenate(self.pending)
+        else:
+            block = self.pending[0]
+        self.reset()
+        return [block]
+
+
+class ModuleBase(SignalObject):
     ''' Base class for all recording modules
     '''
 
-    def __init__(self, usethread=True, queuesize=20, name="ModuleBase", instance=0):
+    def __init__(self, usethread=True, queuesize=20, name="ModuleBase", instance=0, eventdriven=None,
+                 transport=None, execution=None, backpressure=None, backpressure_timeout=None,
+                 chunk_samples=None, chunk_duration=None, inline=False, deadline=None):
         ''' Create a new recording module object
         @param usethread: true if data transfer should be handled internally by worker thread
         @param queuesize: size of receiver input queue in elements
         @param name: module object identifier 
         @param instance: instance number for this object
+        @param eventdriven: worker thread scheduling, True = wait for notification,
+        False = poll the input queue, None = use the global EVENT_DRIVEN_SCHEDULING setting
+        @param transport: output data transport to the receivers (class Transport),
+        None = use the global DEFAULT_TRANSPORT setting
+        @param execution: kernel execution mode (class Execution), only used by modules
+        which provide a processing kernel, None = use the global DEFAULT_EXECUTION setting
+        @param backpressure: input queue overrun handling (class Backpressure),
+        None = use the global DEFAULT_BACKPRESSURE setting
+        @param backpressure_timeout: maximum producer wait time in seconds for Backpressure.BLOCK,
+        None = use the global BACKPRESSURE_TIMEOUT setting
+        @param chunk_samples: re-chunk input blocks to this number of samples
+        @param chunk_duration: re-chunk input blocks to this duration in seconds
+        @param inline: lightweight module, execute it synchronously in the worker thread
+        of the parent module instead of its own thread (see INLINE_EXECUTION).
+        process_output() is called after each input block, process_idle() is not called.
+        @param deadline: acquisition to sink latency deadline in seconds, see report_latency(),
+        None = no deadline
         '''
-        # PySide6 raises a RuntimeError when QObject is initialized twice.
-        # This can happen for UI modules that inherit both QWidget/QwtPlot and ModuleBase.
-        try:
-            Qt.QObject.__init__(self)
-        except RuntimeError as exc:
-            if "QObject object in class" not in str(exc) or "twice" not in str(exc):
-                raise
+        SignalObject.__init__(self)
         # set identifier and instance
         self._object_name = name
         self._instance = instance
@@ -358,6 +895,7 @@ class ModuleBase(Qt.QObject):
 
         # receiver input queue and data block
         self._input_queue = queue.Queue(queuesize)
+        self._queuesize = queuesize     #: input queue size for QUEUE_BLOCK_INTERVAL blocks
         self._input_data = EEG_DataBlock()
 
         # reset the I/O worker thread
@@ -365,10 +903,64 @@ class ModuleBase(Qt.QObject):
         self._running = False
         self._usethread = usethread
         self._thLock = threading.Lock()
+        if eventdriven == None:
+            eventdriven = EVENT_DRIVEN_SCHEDULING
+        self._eventdriven = eventdriven     #: worker thread sleeps until notified
+        self._wakeup_event = threading.Event()
+        self._busy = False                  #: worker thread did some work in the last loop
+        self._inline = inline               #: module can be fused into the parent worker thread
+        self._run_inline = False            #: module is executed by the parent worker thread
+        self._parents = 0                   #: number of modules this module is receiver of
+
+        # output data transport
+        if transport == None:
+            transport = DEFAULT_TRANSPORT
+        self._transport = transport
+        self._ring = None                   #: output ring buffer (Transport.RING)
+        self._ring_consumers = []           #: ring buffer consumer id for each receiver
+        self._retired_rings = []            #: ring buffers with a previous channel layout
+
+        # processing kernel execution
+        if execution == None:
+            execution = DEFAULT_EXECUTION
+        self._execution = execution
+        self._kernel = None                 #: ProcessKernel object
+        self._kernel_process = None         #: worker process (Execution.PROCESS)
+
+        # input queue overrun handling
+        if backpressure == None:
+            backpressure = DEFAULT_BACKPRESSURE
+        if backpressure_timeout == None:
+            backpressure_timeout = BACKPRESSURE_TIMEOUT
+        self._backpressure = backpressure
+        self._backpressure_timeout = backpressure_timeout
+
+        # input block re-chunking
+        self._rechunker = None
+        if chunk_samples != None or chunk_duration != None:
+            self._rechunker = BlockRechunker(chunk_samples, chunk_duration)
+        self._chunks = collections.deque()  #: re-chunked blocks waiting for processing
+
+        # output channel layout, published by update_receivers()
+        self._layout_epoch = 0
+        self._layout_properties = None
+
+        # latency and throughput counters, replace the counters of a previous
+        # initialization (UI modules may be initialized twice)
+        if "metrics" in self.__dict__:
+            metrics.registry.unregister(self.metrics)
+        self.metrics = ModuleMetrics(name, instance)
+        self.metrics.deadline = deadline
+        metrics.registry.register(self.metrics)
+        self._deadline_notified = 0.0       #: time of the last deadline notification
+        self._deadline_pending = 0          #: deadline misses since the last notification
         
     def terminate(self):
         ''' Destructor, override this method if you need to clean up 
         '''
+        self.stop_kernel_process()
+        metrics.registry.unregister(self.metrics)
+        _event_coalescer.remove(self)
         return
         
     def setDefault(self):
@@ -383,6 +975,10 @@ class ModuleBase(Qt.QObject):
         # flush input queue
         while not self._input_queue.empty():
             self._input_queue.get_nowait()
+        self.metrics.reset()
+        self._chunks.clear()
+        if self._rechunker != None:
+            self._rechunker.reset()
         # let derived class objects handle the start command
         try:
             self.process_start()
@@ -392,8 +988,11 @@ class ModuleBase(Qt.QObject):
         # propagate start command to all attached receivers
         for receiver in self._receivers:
             receiver.start()
-        # start the data transfer worker thread
-        if self._usethread:
+        # start the data transfer worker thread, inline modules don't need one
+        self._run_inline = self._inline and INLINE_EXECUTION and self._parents == 1
+        if self._run_inline:
+            self._running = True
+        elif self._usethread:
             if not self._running:
                 # create a new thread because threads are not reusable
                 self._running = True
@@ -406,6 +1005,7 @@ class ModuleBase(Qt.QObject):
         # terminate the data transfer worker thread
         if self._usethread:
             self._running = False    
+            self._wakeup_event.set()
             if self._work != None:
                 self._work.join(5.0) # wait 5s for terminating
                 self._work = None
@@ -417,6 +1017,11 @@ class ModuleBase(Qt.QObject):
             self.process_stop()
         except Exception as e:
             self.send_exception(e, ErrorSeverity.NOTIFY)
+        self._log_latency()
+        # deliver the last coalesced events, the coalescer must not keep the module alive
+        _event_coalescer.remove(self)
+        # receivers are stopped, release the output ring buffers
+        self._close_rings()
 
 
     def query(self, command):
@@ -468,15 +1073,58 @@ class ModuleBase(Qt.QObject):
         if not propagate_only:
             # let derived class objects process parameter update
             try:
-                params = self.process_update(copy.copy(params))
+                params = copy.copy(params)
+                if params != None:
+                    params.make_writable(BlockPart.PROPERTIES | BlockPart.MARKERS)
+                    self._scale_input_queue(params.block_interval)
+                params = self.process_update(params)
             except Exception as e:
                 self.send_exception(e, ErrorSeverity.STOP)
                 return
+        self._publish_layout(params)
         # propagate down to all attached receivers
         for receiver in self._receivers:
             receiver.update_receivers(params)
         
         
+    def _scale_input_queue(self, block_interval):
+        ''' Adjust the input queue size to the block interval of the source,
+        the queue keeps buffering the same time span.
+        @param block_interval: nominal block length in s, 0 = unknown
+        '''
+        size = self._queuesize
+        if 0 < block_interval < QUEUE_BLOCK_INTERVAL:
+            size = int(np.ceil(self._queuesize * QUEUE_BLOCK_INTERVAL / block_interval))
+        with self._input_queue.mutex:
+            self._input_queue.maxsize = size
+            self._input_queue.not_full.notify_all()
+
+    def _publish_layout(self, params):
+        ''' Publish the channel properties of updated parameters as new output
+        configuration epoch. Output data blocks reference the published properties.
+        @param params: EEG_Datablock object
+        '''
+        if params == None:
+            return
+        params.epoch = next(_config_epochs)
+        self._layout_properties = params.channel_properties
+        self._layout_epoch = params.epoch
+
+    def _apply_layout(self, datablock):
+        ''' Let an output data block reference the published channel properties,
+        if the number of channels matches the published configuration
+        @param datablock: EEG_Datablock object
+        '''
+        if datablock.epoch == self._layout_epoch or self._layout_properties is None:
+            return
+        if datablock.eeg_channels.ndim == 2 and \
+           datablock.eeg_channels.shape[0] == len(self._layout_properties):
+            datablock.channel_properties = self._layout_properties
+            datablock.shared |= BlockPart.PROPERTIES
+            datablock.epoch = self._layout_epoch
+        else:
+            datablock.epoch = 0
+
     def add_receiver(self, receiver):
         ''' Add an receiver object to the receiver collection.
         Don't override this method.
@@ -489,10 +1137,12 @@ class ModuleBase(Qt.QObject):
             receiver.start()
         # attach receiver
         self._receivers.append(receiver)
+        receiver._parents += 1
         # get events from receiver
-        self.connect(receiver, Qt.SIGNAL("event(PyQt_PyObject)"), self.receiver_event, Qt.Qt.QueuedConnection)
+        # (module functions, QObject modules have the native QObject.connect() method)
+        eventbus.connect(receiver, _EVENT, self.receiver_event, QueuedConnection)
         # tell the receiver to get events from parent
-        receiver.connect(self, Qt.SIGNAL("parentevent(PyQt_PyObject)"), receiver.parent_event, Qt.Qt.QueuedConnection)
+        eventbus.connect(self, _PARENTEVENT, receiver.parent_event, QueuedConnection)
 
 
     def remove_receiver(self, receiver):
@@ -504,9 +1154,81 @@ class ModuleBase(Qt.QObject):
             return
         # detach receiver
         self._receivers.remove(receiver)
+        receiver._parents -= 1
         # propagate stop command to removed receiver
         receiver.stop()
 
+    def set_deadline(self, deadline):
+        ''' Set the acquisition to sink latency deadline
+        Don't override this method.
+        @param deadline: time in seconds, None = no deadline
+        '''
+        self.metrics.deadline = deadline
+
+    def report_latency(self, acquisition_time):
+        ''' Record the acquisition to sink latency of a block. Sink modules call this
+        method when the block has left the application (written, sent or displayed),
+        an ERROR NOTIFY event is sent if the latency deadline is exceeded.
+        May be called from any thread, the counters and the deadline notification state
+        are protected by the lock of the module metrics. Don't override this method.
+        @param acquisition_time: EEG_DataBlock.acquisition_time
+        '''
+        if not acquisition_time:
+            return
+        now = time.perf_counter()
+        latency = now - acquisition_time
+        with self.metrics.lock:
+            if not self.metrics.add_latency(latency):
+                return
+            self._deadline_pending += 1
+            if now - self._deadline_notified < DEADLINE_NOTIFY_INTERVAL:
+                return
+            pending = self._deadline_pending
+            self._deadline_notified = now
+            self._deadline_pending = 0
+        info = "latency %.1fms exceeds the deadline of %.1fms"%(latency * 1000.0,
+                                                                self.metrics.deadline * 1000.0)
+        if pending > 1:
+            info += " (%d blocks)"%(pending)
+        self.send_event(ModuleEvent(self._object_name, EventType.ERROR, info=info,
+                                    severity=ErrorSeverity.NOTIFY))
+
+    def _log_latency(self):
+        ''' Log the acquisition to sink latency percentiles of the last run
+        '''
+        with self.metrics.lock:
+            latency = self.metrics.latency.summary()
+            deadline_misses = self.metrics.deadline_misses
+        if latency['count'] == 0:
+            return
+        info = "Latency p50 %.1fms, p99 %.1fms, max %.1fms"%(latency['p50'], latency['p99'], latency['max'])
+        if self.metrics.deadline != None:
+            info += ", %d of %d blocks after the deadline of %.1fms"%(
+                    deadline_misses, latency['count'], self.metrics.deadline * 1000.0)
+        self.send_event(ModuleEvent(self._object_name, EventType.LOGMESSAGE, info))
+
+    def get_receivers(self):
+        ''' Get the attached receivers.
+        Don't override this method.
+        @return: list of ModuleBase objects
+        '''
+        return list(self._receivers)
+
+    def set_backpressure(self, backpressure, timeout=None):
+        ''' Change the input queue overrun handling, e.g. while a source module
+        sends faster than real time.
+        Don't override this method.
+        @param backpressure: input queue overrun handling (class Backpressure)
+        @param timeout: maximum producer wait time in seconds for Backpressure.BLOCK,
+        None = unchanged
+        @return: previous backpressure policy
+        '''
+        previous = self._backpressure
+        self._backpressure = backpressure
+        if timeout != None:
+            self._backpressure_timeout = timeout
+        return previous
+
 
     def parent_event(self, event):
         ''' Get events from attached parent.
@@ -515,8 +1237,11 @@ class ModuleBase(Qt.QObject):
         '''
         # let derived class objects handle the event
         self.process_event(event)
+        # commands may change the module state, give the worker thread a chance to react
+        if event.type == EventType.COMMAND:
+            self.wakeup()
         # propagate event to receivers
-        self.emit(Qt.SIGNAL('parentevent(PyQt_PyObject)'), event)
+        eventbus.emit(self, _PARENTEVENT, event)
 
     def receiver_event(self, event):
         ''' Get events from attached receivers.
@@ -525,18 +1250,27 @@ class ModuleBase(Qt.QObject):
         '''
         # let derived class objects handle the event
         self.process_event(event)
+        if event.type == EventType.COMMAND:
+            self.wakeup()
         # propagate event to parent
         #self.send_event(event)  
-        self.emit(Qt.SIGNAL('event(PyQt_PyObject)'), event)
+        eventbus.emit(self, _EVENT, event)
 
         
     def send_event(self, event):
         ''' Send ModuleEvent objects to all connected slots.
+        Frequent events of the same kind are coalesced, see EVENT_RATE_LIMIT.
         Don't override this method.
         @param event: ModuleEvent object
         '''
-        self.emit(Qt.SIGNAL('event(PyQt_PyObject)'), event)
-        self.emit(Qt.SIGNAL('parentevent(PyQt_PyObject)'), event)
+        _event_coalescer.send(self, event)
+
+    def _emit_event(self, event):
+        ''' Send a ModuleEvent object to the parent and receiver modules
+        @param event: ModuleEvent object
+        '''
+        eventbus.emit(self, _EVENT, event)
+        eventbus.emit(self, _PARENTEVENT, event)
 
         
     def isRunning(self):
@@ -546,7 +1280,29 @@ class ModuleBase(Qt.QObject):
         '''
         return self._running
 
+    def wakeup(self):
+        ''' Notify the worker thread that there is something to do.
+        Call this method from other threads or event handlers if process_output() 
+        has new data available, without getting data from the input queue.
+        Don't override this method.
+        '''
+        self._wakeup_event.set()
+
+    def wait_for_wakeup(self, timeout=None):
+        ''' Suspend the worker thread until new input data arrives, wakeup() is called
+        or the timeout expires. Returns immediately if the input queue is not empty.
+        Don't override this method.
+        @param timeout: maximum suspend time in seconds (None = IDLE_WAKEUP_TIMEOUT)
+        @return: True if notified, False on timeout
+        '''
+        if timeout == None:
+            timeout = IDLE_WAKEUP_TIMEOUT
+        self._wakeup_event.clear()
+        if not self._input_queue.empty() or not self._running:
+            return True
+        return self._wakeup_event.wait(timeout)
     
+
     def process_event(self, event):
         ''' Override this method to handle events from attached receivers
         @param event: ModuleEvent
@@ -604,7 +1360,10 @@ class ModuleBase(Qt.QObject):
         ''' Override this method to do something else during worker thread idle time or to
         change the thread suspend time.
         '''
-        time.sleep(0.001)        # suspend thread (default = 1ms)
+        if not self._eventdriven:
+            time.sleep(0.001)        # suspend thread (default = 1ms)
+        elif not self._busy:
+            self.wait_for_wakeup()   # suspend thread until notified
         return
 
     
@@ -619,66 +1378,360 @@ class ModuleBase(Qt.QObject):
         return self._input_queue.qsize()
 
 
-    def _transmit_data(self, data):
+    def _transmit_data(self, data, exclusive=True):
         ''' Put data into the input queue. This method is invoked from the parent module.
         Don't override this method.
         @param data: EEG_DataBlock object
+        @param exclusive: this module is the only receiver of the parent,
+        the parent may wait for the queue (Backpressure.BLOCK)
         '''
+        if self._run_inline:
+            self._process_inline(data)
+            return
         try:
             self._input_queue.put(data, False)
-        except:
-            self.send_event(ModuleEvent(self._object_name, EventType.ERROR,
-                                        "Input queue FULL, overrun!", severity=ErrorSeverity.NOTIFY))
+        except queue.Full:
+            if self._backpressure == Backpressure.BLOCK and exclusive:
+                self._put_blocking(data)
+            elif self._backpressure == Backpressure.DROP_OLDEST:
+                self._put_drop_oldest(data)
+            elif self._backpressure == Backpressure.COALESCE:
+                self._put_coalesce(data)
+            else:
+                self.metrics.add_drop(data.get_samples())
+                self.send_event(ModuleEvent(self._object_name, EventType.ERROR,
+                                            "Input queue FULL, overrun!", severity=ErrorSeverity.NOTIFY))
+        self._wakeup_event.set()
+
+    def _put_blocking(self, data):
+        ''' Wait for space in the input queue (Backpressure.BLOCK)
+        @param data: EEG_DataBlock object
+        '''
+        t = time.perf_counter()
+        self._wakeup_event.set()
+        while self._running and time.perf_counter() - t < self._backpressure_timeout:
+            try:
+                self._input_queue.put(data, True, 0.1)
+                self.metrics.add_blocked(time.perf_counter() - t)
+                return
+            except queue.Full:
+                pass
+        waited = time.perf_counter() - t
+        self.metrics.add_blocked(waited)
+        self.metrics.add_drop(data.get_samples())
+        self.send_event(ModuleEvent(self._object_name, EventType.ERROR,
+                                    "Input queue FULL, overrun after waiting %.1fs!"%(waited),
+                                    severity=ErrorSeverity.NOTIFY))
+
+    def _put_drop_oldest(self, data):
+        ''' Replace the oldest queued block by the new one (Backpressure.DROP_OLDEST)
+        @param data: EEG_DataBlock object
+        '''
+        # modules with several parents: the other producers may refill the queue in between
+        for attempt in range(3):
+            try:
+                oldest = self._input_queue.get_nowait()
+                self.metrics.add_drop(oldest.get_samples(), oldest=True)
+            except queue.Empty:
+                pass
+            try:
+                self._input_queue.put_nowait(data)
+                return
+            except queue.Full:
+                pass
+        self.metrics.add_drop(data.get_samples())
+
+    def _put_coalesce(self, data):
+        ''' Append the new block to the last queued block (Backpressure.COALESCE)
+        @param data: EEG_DataBlock object
+        '''
+        q = self._input_queue
+        with q.mutex:
+            if len(q.queue) > 0:
+                last = q.queue[-1]
+                if last.can_concatenate(data) and \
+                   last.get_samples() + data.get_samples() <= COALESCE_MAX_SAMPLES:
+                    q.queue[-1] = EEG_DataBlock.concatenate([last, data])
+                    self.metrics.add_coalesced()
+                    return
+        self._put_drop_oldest(data)
 
     def _worker_thread(self):
         ''' The worker thread takes data from the input queue and 
         puts the processed data into the output queue.
         Don't override this method.
         '''   
+        cpu_start = time.thread_time()
+        self._set_thread_id(threading.get_ident())
         while self._running:
-            wt = 0                      # reset performance timer
-            # process input queue
+            # process input queue, take the lock only if there is something to do
+            self.metrics.add_queue_depth(self._input_queue.qsize())
+            span = None
+            if len(self._chunks) > 0:
+                data = self._chunks.popleft()
+            else:
+                try:
+                    data = self._input_queue.get(False)
+                except queue.Empty:
+                    data = None
+                data, span = self._receive_block(data)
+            self._busy = data != None
+            if self._process_block(data, span):
+                self._busy = True
+                    
+            # give a chance for idle processing
+            t = time.perf_counter()
+            self.process_idle()
+            self.metrics.add_idle(time.perf_counter() - t)
+            self.metrics.set_cpu_time(time.thread_time() - cpu_start)
+
+    def _set_thread_id(self, thread_id):
+        ''' Tell the metrics of this module and its inline receivers the executing thread
+        @param thread_id: thread ident
+        '''
+        self.metrics.thread_id = thread_id
+        for receiver in self._receivers:
+            if receiver._run_inline:
+                receiver._set_thread_id(thread_id)
+
+    def _process_inline(self, data):
+        ''' Process an input block in the worker thread of the parent module (inline module).
+        Don't override this method.
+        @param data: EEG_DataBlock object
+        '''
+        if not self._running:
+            return
+        cpu_start = time.thread_time()
+        self.metrics.thread_id = threading.get_ident()
+        data, span = self._receive_block(data)
+        self._process_block(data, span)
+        while len(self._chunks) > 0:
+            self._process_block(self._chunks.popleft(), None)
+        self.metrics.add_cpu_time(time.thread_time() - cpu_start)
+
+    def _receive_block(self, data):
+        ''' Resolve the ring buffer span and re-chunk a block taken from the input queue
+        @param data: EEG_DataBlock object or None
+        @return: tuple(block to process or None, ring buffer span to release after processing)
+        '''
+        span = None
+        if data != None and data.ring_span != None:
+            span = data.ring_span
+            data = self._resolve_ring_span(data)
+        if data != None and self._rechunker != None:
+            self._chunks.extend(self._rechunker.push(data))
+            data = self._chunks.popleft() if len(self._chunks) > 0 else None
+        return data, span
+
+    def _process_block(self, data, span):
+        ''' Let the derived class process an input block, get the output block
+        and put it into the receiver input queues
+        @param data: EEG_DataBlock object or None
+        @param span: ring buffer span of the input block to release or None
+        @return: True if an output block was sent
+        '''
+        wt = 0                      # reset performance timer
+        if data != None:
             self._thLock.acquire()
             try:
-                data = self._input_queue.get(False)
                 t = time.perf_counter() 
                 self.process_input(data)
-                wt += time.perf_counter() - t
-                self._thLock.release()
-            except queue.Empty:
+                it = time.perf_counter() - t
+                wt += it
                 self._thLock.release()
+                self.metrics.add_input(it, data.get_samples())
             except Exception as e:
                 self._thLock.release()
                 self.send_exception(e, severity=ErrorSeverity.STOP)
-                
+            if COW_DEBUG:
+                self._check_shared(data)
+        if span != None:
+            span.ring.release(span.consumer, span.start + span.count)
             
-            # put data to all registered output queues
-            self._thLock.acquire()
+        # put data to all registered output queues
+        self._thLock.acquire()
+        try:
+            self.output_timer = time.perf_counter() 
+            data = self.process_output()
+            wt += time.perf_counter() - self.output_timer
+            self._thLock.release()
+        except Exception as e:
+            self._thLock.release()
+            self.send_exception(e, severity=ErrorSeverity.STOP)
+            data = None
+
+        if data == None:
+            return False
+        self.metrics.add_output(time.perf_counter() - self.output_timer, data.get_samples())
+        data.performance_timer_max = max(data.performance_timer_max, wt)
+        data.performance_timer += wt
+        self._apply_layout(data)
+        # a single receiver gets the block itself, multiple receivers
+        # share the block and have to copy it on write
+        if self._transport == Transport.RING and self._transmit_ring(data):
+            pass
+        elif len(self._receivers) > 1:
+            for receiver in reversed(self._receivers):
+                receiver._transmit_data(data.share(), exclusive=False)
+        else:
+            for receiver in self._receivers:
+                receiver._transmit_data(data)
+        return True
+
+            
+    def set_chunking(self, samples=None, duration=None):
+        ''' Set the input block re-chunking, the module must be stopped
+        Don't override this method.
+        @param samples: target block length in samples
+        @param duration: target block length in seconds, used if samples is None
+        (samples and duration None = disable re-chunking)
+        '''
+        if samples == None and duration == None:
+            self._rechunker = None
+        else:
+            self._rechunker = BlockRechunker(samples, duration)
+        self._chunks.clear()
+
+    def get_metrics(self):
+        ''' Get the latency and throughput counters of this module
+        Don't override this method.
+        @return: dictionary, see metrics.ModuleMetrics.snapshot()
+        '''
+        return self.metrics.snapshot()
+
+    def set_kernel(self, kernel):
+        ''' Set the processing kernel of this module. Call this method from process_update()
+        whenever the processing parameters have changed.
+        Don't override this method.
+        @param kernel: ProcessKernel object
+        '''
+        self._kernel = kernel
+        # start the kernel worker process with the first kernel, it will be reused for all
+        # following kernels and starts. The start up runs in the background, this method
+        # is called from the GUI thread and must not wait for it.
+        if self._execution == Execution.PROCESS and kernel != None and self._kernel_process == None:
             try:
-                self.output_timer = time.perf_counter() 
-                data = self.process_output()
-                wt += time.perf_counter() - self.output_timer
-                self._thLock.release()
+                self._kernel_process = KernelProcess(self._object_name, kernel)
             except Exception as e:
-                self._thLock.release()
-                self.send_exception(e, severity=ErrorSeverity.STOP)
-                data = None
-
-            if data != None:
-                data.performance_timer_max = max(data.performance_timer_max, wt)
-                data.performance_timer += wt
-                #for idx, receiver in enumerate(self._receivers):
-                for idx, receiver in enumerate(reversed(self._receivers)):
-                    if idx == 0:
-                        receiver._transmit_data(data)
-                    else:
-                        receiver._transmit_data(copy.deepcopy(data))
-                    
-                    
-            # give a chance for idle processing
-            self.process_idle()
+                self._execution = Execution.THREAD
+                self.send_exception(e, ErrorSeverity.NOTIFY)
+
+    def execute_kernel(self, datablock):
+        ''' Process the channel data of a data block with the current kernel, either
+        in the worker thread or in the kernel worker process.
+        Call this method from process_input() or process_output().
+        Don't override this method.
+        @param datablock: EEG_DataBlock object
+        '''
+        if self._kernel == None:
+            return
+        if self._kernel_process != None:
+            try:
+                ready = self._kernel_process.ready()
+            except Exception as e:
+                self.stop_kernel_process()
+                self._execution = Execution.THREAD
+                self.send_exception(e, ErrorSeverity.NOTIFY)
+                ready = False
+            if ready:
+                # the kernel state of the thread execution is transferred with the kernel,
+                # the result is a new array, no need to copy shared data
+                datablock.eeg_channels = self._kernel_process.execute(self._kernel, datablock.eeg_channels)
+                return
+        # worker thread, also while the worker process is starting up
+        datablock.make_writable(BlockPart.DATA)
+        datablock.eeg_channels = self._kernel.process(datablock.eeg_channels)
+
+    def stop_kernel_process(self):
+        ''' Terminate the kernel worker process
+        Don't override this method.
+        '''
+        if self._kernel_process != None:
+            self._kernel_process.stop()
+            self._kernel_process = None
+
+    def _transmit_ring(self, data):
+        ''' Write the sample data to the output ring buffer and pass the span to all receivers
+        @param data: EEG_DataBlock object
+        @return: False if the block can't be transported by ring buffer
+        '''
+        if len(self._receivers) == 0 or data.recording_mode == RecordingMode.IMPEDANCE or \
+           data.eeg_channels.ndim != 2 or data.eeg_channels.shape[1] != data.sample_channel.shape[1]:
+            return False
+        # create a new ring buffer for the first block or if the channel layout has changed
+        if self._ring == None or not self._ring.fits(data.eeg_channels) or \
+           len(self._ring_consumers) != len(self._receivers):
+            if self._ring != None:
+                self._retired_rings.append(self._ring)
+            capacity = max(int(RING_BUFFER_SECONDS * data.sample_rate), 2 * data.eeg_channels.shape[1])
+            self._ring = SampleRingBuffer(data.eeg_channels.shape[0], capacity, data.eeg_channels.dtype,
+                                          maxconsumers=len(self._receivers))
+            self._ring_consumers = [self._ring.add_consumer() for r in self._receivers]
+        count = data.eeg_channels.shape[1]
+        start = self._ring.write(data.eeg_channels, data.trigger_channel, data.sample_channel)
+        # pass only the span, sample arrays will be resolved by the receiver.
+        # data may be kept by the producer, clear the arrays of the receiver blocks only
+        for receiver, consumer in reversed(list(zip(self._receivers, self._ring_consumers))):
+            block = data.share()
+            block.eeg_channels = block.trigger_channel = block.sample_channel = None
+            if len(self._receivers) == 1:
+                block.shared = BlockPart.DATA
+            block.ring_span = RingSpan(self._ring, consumer, start, count)
+            receiver._transmit_data(block, exclusive=len(self._receivers) == 1)
+        return True
+
+    def _resolve_ring_span(self, data):
+        ''' Get the sample data of a ring buffer transported data block
+        @param data: EEG_DataBlock object with ring_span
+        @return: EEG_DataBlock object with private sample data or None on ring buffer overrun
+        '''
+        span = data.ring_span
+        # copy the samples, receivers may keep the block longer than a ring lap
+        try:
+            eeg, trigger, counter = span.ring.read(span.consumer, span.start, span.count, copy=True)
+        except RingOverrun as e:
+            self.metrics.add_drop(e.lost)
+            self.send_event(ModuleEvent(self._object_name, EventType.ERROR, str(e),
+                                        severity=ErrorSeverity.NOTIFY))
+            return None
+        data.eeg_channels = eeg
+        data.trigger_channel = trigger
+        data.sample_channel = counter
+        data.shared &= ~BlockPart.DATA
+        data.ring_span = None
+        return data
+
+    def get_ring_overruns(self):
+        ''' Get the ring buffer overrun accounting for all receivers
+        @return: list of tuple(receiver object name, lost samples, lost blocks)
+        '''
+        if self._ring == None:
+            return []
+        return [(receiver._object_name,) + self._ring.overruns(consumer)
+                for receiver, consumer in zip(self._receivers, self._ring_consumers)]
+
+    def _close_rings(self):
+        ''' Release the output ring buffers
+        '''
+        for ring in self._retired_rings + [self._ring]:
+            if ring != None:
+                ring.close()
+        self._ring = None
+        self._ring_consumers = []
+        self._retired_rings = []
+
+    def _check_shared(self, data):
+        ''' Report in place modifications of shared data blocks (COW_DEBUG only)
+        @param data: EEG_DataBlock object after process_input()
+        '''
+        modified = data.check_shared()
+        if modified:
+            parts = [name for part, name in sorted(BlockPart.Name.items()) if modified & part]
+            self.send_event(ModuleEvent(self._object_name, EventType.ERROR,
+                                        "shared %s modified without make_writable()"%(", ".join(parts)),
+                                        severity=ErrorSeverity.NOTIFY))
+            data.shared &= ~modified
 
-            
     def send_exception(self, exception, severity=ErrorSeverity.STOP):
         ''' Send Exception as ModuleEvent object to all connected slots.
         Don't override this method.
@@ -36,6 +36,7 @@ from collections import defaultdict
 import textwrap
 
 from modbase import *
+from bufpool import pool
 from tools.modview import GenericTableWidget
 
 
@@ -47,7 +48,9 @@ class MNT_Recording(ModuleBase):
     def __init__(self, *args, **keys):
         ''' Constructor
         '''
-        # initialize the base class, give a descriptive name
+        # initialize the base class, give a descriptive name,
+        # lightweight module, runs in the worker thread of the parent module
+        keys.setdefault("inline", True)
         ModuleBase.__init__(self, name="Recording Montage", **keys)    
 
         # XML parameter version
@@ -173,6 +176,8 @@ class MNT_Recording(ModuleBase):
         return True
 
     def _apply_montage(self, params):
+        # the properties may be shared with the original input parameters
+        params.make_writable(BlockPart.PROPERTIES)
         # update the properties with montage settings
         for ch in params.channel_properties:
             if not self.montage.update_channel(ch):
@@ -249,17 +254,17 @@ class MNT_Recording(ModuleBase):
             # average and subtract the reference channels
             if self.ref_indices.size > 0:
                 # average reference channels
-                reference = np.mean(self.data.eeg_channels[self.ref_indices], 0)
+                channels = pool.take(self.data.eeg_channels, self.ref_indices)
+                reference = pool.empty(channels.shape[1:], channels.dtype)
+                np.mean(channels, 0, out=reference)
+                del channels
                 # subtract reference
+                self.data.make_writable(BlockPart.DATA)
                 self.data.eeg_channels[self.eeg_indices] -= reference
     
-        # simple copy is three times faster than deepcopy
-        #self.data.channel_properties = copy.deepcopy(self.output_channel_properties)
-        self.data.channel_properties = self.output_channel_properties.copy()
-        for idx in range(self.data.channel_properties.size):
-            self.data.channel_properties[idx] = copy.copy(self.output_channel_properties[idx])
-        
-        self.data.eeg_channels = self.data.eeg_channels[self.output_channel_indices]
+        # the output channel properties are published by process_update(),
+        # output blocks reference them through the configuration epoch
+        self.data.eeg_channels = pool.take(self.data.eeg_channels, self.output_channel_indices)
 
 
     
@@ -0,0 +1,604 @@
+# -*- coding: utf-8 -*-
+'''
+Multi Amplifier Acquisition Module
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Streams several amplifiers as one data set. Every device is read by its own
+reader thread into a sample FIFO, the module worker thread aligns the device
+streams and merges them into one EEG_DataBlock:
+    - EEG channels of all devices, followed by the AUX channels of all devices,
+      channels are numbered continuously (Ch1..ChN, Aux1..AuxM)
+    - trigger and sample counter channel of the first device (master)
+
+Alignment: if a sync pulse is connected to the same trigger input of all
+devices (sync_mask), the streams are aligned at the first rising edge of the
+pulse and the following edges are checked, a device which gets out of sync is
+reported and the streams are aligned again at the next edge. Without sync
+pulse the streams are aligned by the first sample counter of every device.
+Samples missing in a device stream (sample counter gaps) are replaced by
+zeros to keep the streams aligned.
+
+The devices are objects with the ActiChamp interface (open, setup, start,
+read, stop, close, readConfiguration, getDeviceStatus and the optional block
+interval readInterval, default actichamp_w.USB_READ_INTERVAL), the default is
+one ActiChamp object for each connected amplifier. Only the normal recording
+mode is supported.
+'''
+
+from modbase import *
+from bufpool import pool
+from actichamp_w import *
+
+# amplifier sampling rates (without down sampling in Python)
+MULTIAMP_SAMPLE_RATES = [100000.0, 50000.0, 25000.0, 10000.0, 5000.0, 2000.0, 1000.0, 500.0, 200.0]
+
+# poll interval of the reader threads for devices in non blocking mode in seconds
+MULTIAMP_READ_INTERVAL = 0.01
+
+# a device is reported as stalled if it is this number of seconds behind the other devices
+MULTIAMP_MAX_SKEW = 2.0
+
+
+class DeviceReader(object):
+    ''' Reader thread and sample FIFO of one amplifier
+    '''
+    def __init__(self, number, device, wakeup):
+        ''' Create the reader
+        @param number: device number (1...n)
+        @param device: amplifier object with ActiChamp interface
+        @param wakeup: callable, notifies the module worker thread about new data
+        '''
+        self.number = number
+        self.device = device
+        self._wakeup = wakeup
+        self._lock = threading.Lock()
+        self._fifo = collections.deque()    #: contiguous [eeg, trigger, sample counter, read time] chunks
+        self._thread = None
+        self._running = False
+        self.eeg_count = 0                  #: number of EEG channels
+        self.aux_count = 0                  #: number of AUX channels
+        self.indices = np.array([], int)    #: read indices of all channels
+        self.reset()
+
+    def reset(self):
+        ''' Clear the FIFO and the stream state
+        '''
+        with self._lock:
+            self._fifo.clear()
+            self.available = 0              #: number of samples in the FIFO
+        self.next_counter = None            #: expected sample counter of the next read
+        self.missing = 0                    #: number of replaced missing samples
+        self.counter_reset = False          #: the sample counter went backwards
+        self.last_sync = 0                  #: sync bits of the last sample taken from the FIFO
+        self.error = None                   #: exception of the reader thread
+
+    def configure(self):
+        ''' Get the channel configuration of the device
+        '''
+        self.eeg_count = int(self.device.properties.CountEeg)
+        self.aux_count = int(self.device.properties.CountAux)
+        self.indices = np.arange(self.eeg_count + self.aux_count)
+
+    def start(self, dtype):
+        ''' Start the reader thread, the device has to be started before
+        @param dtype: channel data type
+        '''
+        self.reset()
+        self._running = True
+        self._thread = threading.Thread(target=self._read_thread, args=(dtype,),
+                                        name="Amplifier %d reader"%(self.number))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        ''' Stop the reader thread
+        '''
+        self._running = False
+        if self._thread != None:
+            self._thread.join(5.0)
+            self._thread = None
+
+    def _read_thread(self, dtype):
+        ''' Read data from the device and put it into the FIFO
+        '''
+        while self._running:
+            try:
+                d, disconnected = self.device.read(self.indices, self.eeg_count, self.aux_count, dtype)
+            except Exception as e:
+                self.error = e
+                break
+            if d == None:
+                time.sleep(0.001 if self.device.BlockingMode else MULTIAMP_READ_INTERVAL)
+                continue
+            self._append(d, time.perf_counter())
+            self._wakeup()
+        self._wakeup()
+
+    def _append(self, d, read_time):
+        ''' Put a data block into the FIFO, replace missing samples by zeros
+        @param d: list of channel data, trigger channel and sample counter arrays
+        @param read_time: time.perf_counter() of the device read
+        '''
+        eeg, trigger, counter = d
+        samples = counter.shape[1]
+        if samples == 0:
+            return
+        first = int(counter[0, 0])
+        gap = 0
+        if self.next_counter != None:
+            gap = first - self.next_counter
+            if gap < 0:
+                self.counter_reset = True
+                gap = 0
+        self.next_counter = first + samples
+        with self._lock:
+            if gap > 0:
+                missing = [np.zeros((eeg.shape[0], gap), eeg.dtype),
+                           np.zeros((1, gap), trigger.dtype),
+                           np.arange(first - gap, first, dtype=counter.dtype).reshape(1, -1),
+                           read_time]
+                self._fifo.append(missing)
+                self.available += gap
+                self.missing += gap
+            self._fifo.append([eeg, trigger, counter, read_time])
+            self.available += samples
+
+    def skip_to_edge(self, mask):
+        ''' Discard samples up to the next rising edge of the sync bits
+        @param mask: sync trigger bits
+        @return: True if the first sample in the FIFO is a rising edge
+        '''
+        while True:
+            with self._lock:
+                if len(self._fifo) == 0:
+                    return False
+                chunk = self._fifo[0]
+            sync = chunk[1][0] & mask
+            previous = np.concatenate(([self.last_sync], sync[:-1]))
+            edges = np.nonzero((sync != 0) & (previous == 0))[0]
+            if len(edges) > 0:
+                self._discard(int(edges[0]))
+                # the edge sample itself is taken with the next block
+                self.last_sync = 0
+                return True
+            self.last_sync = int(sync[-1])
+            self._discard(len(sync))
+
+    def _discard(self, samples):
+        ''' Remove samples from the FIFO head
+        '''
+        with self._lock:
+            while samples > 0:
+                chunk = self._fifo[0]
+                n = chunk[2].shape[1]
+                if samples >= n:
+                    self._fifo.popleft()
+                else:
+                    self._fifo[0] = [a[:, samples:] for a in chunk[:3]] + chunk[3:]
+                    n = samples
+                self.available -= n
+                samples -= n
+
+    def take(self, samples, eeg, aux, trigger, counter):
+        ''' Move samples from the FIFO into the output arrays
+        @param samples: number of samples, must be available
+        @param eeg: output array for the EEG channels
+        @param aux: output array for the AUX channels
+        @param trigger: output array for the trigger channel
+        @param counter: output array for the sample counter or None
+        @return: read time of the first sample
+        '''
+        position = 0
+        first_read = None
+        while position < samples:
+            with self._lock:
+                chunk = self._fifo[0]
+            data, trg, sct, read_time = chunk
+            if first_read == None:
+                first_read = read_time
+            n = min(samples - position, sct.shape[1])
+            end = position + n
+            eeg[:, position:end] = data[:self.eeg_count, :n]
+            aux[:, position:end] = data[self.eeg_count:, :n]
+            trigger[:, position:end] = trg[:, :n]
+            if counter is not None:
+                counter[:, position:end] = sct[:, :n]
+            with self._lock:
+                if n == sct.shape[1]:
+                    self._fifo.popleft()
+                else:
+                    self._fifo[0] = [data[:, n:], trg[:, n:], sct[:, n:], read_time]
+                self.available -= n
+            position = end
+        return first_read
+
+
+class AMP_MultiChamp(ModuleBase):
+    ''' Multiple actiCHamp amplifiers as one acquisition module
+    '''
+
+    def __init__(self, devices=None, sync_mask=0, *args, **keys):
+        ''' Constructor
+        @param devices: list of amplifier objects with ActiChamp interface,
+        None = one ActiChamp object for each connected amplifier (at least two)
+        @param sync_mask: trigger input bits of the sync pulse connected to all devices,
+        0 = align the streams by the first sample counter
+        '''
+        ModuleBase.__init__(self, name="Multi Amplifier", **keys)
+
+        # XML parameter version
+        # 1: initial version
+        self.xmlVersion = 1
+
+        # create hardware objects
+        if devices == None:
+            devices = [ActiChamp(device=0), ActiChamp(device=1)]
+            while devices[-1].lib != None and devices[-1].lib.champGetCount() > len(devices):
+                devices.append(ActiChamp(device=len(devices)))
+        self.readers = [DeviceReader(n + 1, device, self.wakeup) for n, device in enumerate(devices)]
+        self.sync_mask = sync_mask          #: trigger bits of the sync pulse
+        self.sync_errors = 0                #: number of sync losses since start
+
+        # create list of possible sampling rates, no down sampling in Python
+        master = self.readers[0].device
+        self.sample_rates = []
+        for rate in MULTIAMP_SAMPLE_RATES:
+            base, div = master.getSamplingRateBase(rate)
+            if base >= 0 and div == 1:
+                self.sample_rates.append({'rate':str(int(rate)), 'base':base, 'div':div, 'value':rate})
+        self.sample_rate = self.sample_rates[min(7, len(self.sample_rates) - 1)]
+
+        self.running = False
+        self.aligned = False
+        self.missing = [0] * len(self.readers)
+        self.start_time = datetime.datetime.now()
+        self.online_cfg = None
+        self._create_channel_layout()
+
+    def get_online_configuration(self):
+        ''' Get the online configuration pane, the start buttons of the amplifier module
+        '''
+        if self.online_cfg == None:
+            from amplifier import _OnlineCfgPane
+            self.online_cfg = _OnlineCfgPane(self)
+            for button in (self.online_cfg.pushButtonStartImpedance,
+                           self.online_cfg.pushButtonStartShielding,
+                           self.online_cfg.pushButtonStartTest):
+                button.setEnabled(False)
+            self.connect(self.online_cfg, Qt.SIGNAL("modeChanged(int)"), self._online_mode_changed)
+        return self.online_cfg
+
+    def get_module_info(self):
+        ''' Get information about this module for the about dialog
+        '''
+        info = ""
+        for reader in self.readers:
+            if hasattr(reader.device, "getDeviceInfoString"):
+                info += "Device %d\n%s"%(reader.number, reader.device.getDeviceInfoString())
+        return info
+
+    def _online_mode_changed(self, new_mode):
+        ''' SIGNAL from online configuration pane if recording mode has changed
+        '''
+        if self.running:
+            if not self.stop():
+                self._update_online_cfg(CHAMP_MODE_NORMAL)
+                return
+        if new_mode == CHAMP_MODE_NORMAL:
+            self.start()
+
+    def _update_online_cfg(self, mode):
+        if self.online_cfg != None:
+            self.online_cfg.updateUI(mode)
+
+    def stop(self, force=False):
+        ''' Stop data acquisition
+        @param force: force stop without query
+        @return: True, if stop was accepted by attached modules
+        '''
+        if not force:
+            if not self.query("Stop"):
+                return False
+        ModuleBase.stop(self)
+        return True
+
+    def process_event(self, event):
+        ''' Handle events from attached receivers
+        @param event: ModuleEvent
+        '''
+        if event.type == EventType.COMMAND:
+            if event.info == "Stop":
+                self.stop(force=(event.cmd_value == "force"))
+            if event.info == "StartRecording":
+                self._online_mode_changed(CHAMP_MODE_NORMAL)
+            if event.info == "TriggerOut":
+                # trigger output of the master device
+                self._thLock.acquire()
+                try:
+                    self.readers[0].device.setTrigger(event.cmd_value)
+                    self._thLock.release()
+                except Exception as e:
+                    self._thLock.release()
+                    self.send_exception(e, severity=ErrorSeverity.NOTIFY)
+
+    def _create_channel_layout(self):
+        ''' Combine the channels of all devices and prepare the EEG_DataBlock
+        '''
+        eeg = 0
+        aux = 0
+        for reader in self.readers:
+            reader.configure()
+            reader.eeg_offset = eeg
+            reader.aux_offset = aux
+            eeg += reader.eeg_count
+            aux += reader.aux_count
+        self.eeg_data = EEG_DataBlock(eeg, aux)
+        self.eeg_data.sample_rate = self.sample_rate['value']
+        self.eeg_data.block_interval = getattr(self.readers[0].device, "readInterval", USB_READ_INTERVAL)
+        self.eeg_data.recording_mode = RecordingMode.NORMAL
+        for channel in self.eeg_data.channel_properties:
+            # hardware filters only
+            channel.lowpass = 0.0
+            channel.highpass = 0.0
+            channel.notchfilter = False
+
+    def process_update(self, params):
+        ''' Read the device configurations and propagate the combined channel layout
+        '''
+        for reader in self.readers:
+            try:
+                reader.device.readConfiguration(self.sample_rate['base'])
+            except Exception as e:
+                self.send_exception(e)
+        self._create_channel_layout()
+        self.send_event(ModuleEvent(self._object_name,
+                                    EventType.STATUS,
+                                    info = "%.0f Hz"%(self.eeg_data.sample_rate),
+                                    status_field = "Rate"))
+        self.send_event(ModuleEvent(self._object_name,
+                                    EventType.STATUS,
+                                    info = "%d ch"%(len(self.eeg_data.channel_properties)),
+                                    status_field="Channels"))
+        return copy.copy(self.eeg_data)
+
+    def process_start(self):
+        ''' Open and start all amplifiers
+        '''
+        self.eeg_data.sample_counter = 0
+        self.aligned = False
+        self.sync_errors = 0
+        self.missing = [0] * len(self.readers)
+        try:
+            for reader in self.readers:
+                reader.device.open()
+                reader.device.setup(CHAMP_MODE_NORMAL, self.sample_rate['base'], self.sample_rate['div'])
+            self.update_receivers()
+            # start the slave devices first, the master sync output runs then for all devices
+            for reader in reversed(self.readers):
+                reader.device.start()
+                reader.start(sample_type())
+        except:
+            self._stop_devices()
+            raise
+        self.running = True
+        self.start_time = datetime.datetime.now()
+        info = "Start %s at %.0fHz with %d amplifiers"%(CHAMP_Modes[CHAMP_MODE_NORMAL],
+                                                       self.eeg_data.sample_rate, len(self.readers))
+        self.send_event(ModuleEvent(self._object_name, EventType.LOGMESSAGE, info))
+        self.send_event(ModuleEvent(self._object_name,
+                                    EventType.STATUS,
+                                    info = CHAMP_MODE_NORMAL,
+                                    status_field="Mode"))
+        self._update_online_cfg(CHAMP_MODE_NORMAL)
+
+    def _stop_devices(self):
+        ''' Stop the reader threads and close all amplifiers
+        @return: total number of device errors
+        '''
+        errors = 0
+        for reader in self.readers:
+            try:
+                errors += reader.device.getDeviceStatus()[1]
+            except:
+                pass
+            try:
+                reader.device.stop()
+            except:
+                pass
+            reader.stop()
+            try:
+                reader.device.close()
+            except:
+                pass
+        return errors
+
+    def process_stop(self):
+        ''' Stop data acquisition and close all amplifiers
+        '''
+        errors = self._stop_devices()
+        self.running = False
+        info = "Stop %s"%(CHAMP_Modes[CHAMP_MODE_NORMAL])
+        if errors > 0:
+            info += " (device errors = %d)"%(errors)
+        if self.sync_errors > 0:
+            info += " (sync errors = %d)"%(self.sync_errors)
+        self.send_event(ModuleEvent(self._object_name, EventType.LOGMESSAGE, info))
+        self.send_event(ModuleEvent(self._object_name,
+                                    EventType.STATUS,
+                                    info = -1,
+                                    status_field="Mode"))
+        self._update_online_cfg(-1)
+
+    def _check_readers(self):
+        ''' Check the reader threads for errors, missing samples and stalled devices
+        '''
+        rate = self.eeg_data.sample_rate
+        for reader in self.readers:
+            if reader.error != None:
+                raise ModuleError(self._object_name, "device %d: %s"%(reader.number, str(reader.error)))
+            if reader.counter_reset:
+                reader.counter_reset = False
+                self.send_event(ModuleEvent(self._object_name, EventType.ERROR,
+                                            info="device %d: sample counter reset"%(reader.number),
+                                            severity=ErrorSeverity.NOTIFY))
+                self.aligned = False
+            missing = reader.missing - self.missing[reader.number - 1]
+            if missing > 0:
+                self.missing[reader.number - 1] = reader.missing
+                self.send_event(ModuleEvent(self._object_name, EventType.ERROR,
+                                            info="%d samples missing (device %d)"%(missing, reader.number),
+                                            severity=ErrorSeverity.NOTIFY))
+        available = [reader.available for reader in self.readers]
+        if max(available) - min(available) > MULTIAMP_MAX_SKEW * rate:
+            stalled = self.readers[available.index(min(available))]
+            raise ModuleError(self._object_name, "device %d stalled"%(stalled.number))
+
+    def _align(self):
+        ''' Align the device streams at the sync pulse or at the first sample
+        @return: True if all streams are aligned
+        '''
+        if self.sync_mask == 0:
+            # the first available sample of every device is sample 0
+            self.aligned = all(reader.available > 0 for reader in self.readers)
+        else:
+            found = [reader.skip_to_edge(self.sync_mask) for reader in self.readers]
+            self.aligned = all(found)
+        if self.aligned:
+            for reader in self.readers:
+                reader.last_sync = 0
+        return self.aligned
+
+    def _check_sync(self, triggers):
+        ''' Compare the sync pulse edges of all devices in the merged block
+        @param triggers: list of trigger arrays, one for each device
+        '''
+        edges = []
+        for reader, trigger in zip(self.readers, triggers):
+            sync = trigger[0] & self.sync_mask
+            previous = np.concatenate(([reader.last_sync], sync[:-1]))
+            reader.last_sync = int(sync[-1]) if len(sync) else reader.last_sync
+            edges.append(np.nonzero((sync != 0) & (previous == 0))[0])
+        master = edges[0]
+        for reader, device_edges in zip(self.readers[1:], edges[1:]):
+            if np.array_equal(device_edges, master):
+                continue
+            if len(master) > 0 and len(device_edges) > 0:
+                info = "device %d out of sync (%d samples)"%(reader.number,
+                                                             int(device_edges[0]) - int(master[0]))
+            else:
+                info = "device %d out of sync (sync pulse missing)"%(reader.number)
+            self.sync_errors += 1
+            self.aligned = False
+            self.send_event(ModuleEvent(self._object_name, EventType.ERROR, info=info,
+                                        severity=ErrorSeverity.NOTIFY))
+            return
+
+    def process_output(self):
+        ''' Merge the aligned samples of all devices
+        '''
+        if not self.running:
+            return None
+        self._check_readers()
+        if not self.aligned and not self._align():
+            return None
+        samples = min(reader.available for reader in self.readers)
+        if samples == 0:
+            return None
+
+        eegcount = len(self.eeg_data.channel_properties)
+        eeg_total = sum(reader.eeg_count for reader in self.readers)
+        eeg = pool.empty((eegcount, samples), sample_type())
+        counter = pool.empty((1, samples), np.uint64)
+        triggers = []
+        read_times = []
+        for reader in self.readers:
+            trigger = pool.empty((1, samples), np.uint32)
+            read_time = reader.take(samples,
+                                    eeg[reader.eeg_offset:reader.eeg_offset + reader.eeg_count],
+                                    eeg[eeg_total + reader.aux_offset:eeg_total + reader.aux_offset + reader.aux_count],
+                                    trigger,
+                                    counter if reader.number == 1 else None)
+            triggers.append(trigger)
+            read_times.append(read_time)
+        if self.sync_mask != 0:
+            self._check_sync(triggers)
+
+        self.eeg_data.eeg_channels = eeg
+        self.eeg_data.trigger_channel = triggers[0]
+        self.eeg_data.sample_channel = counter
+        self.eeg_data.sample_counter += samples
+        # the latency of the merged block starts with the earliest device read
+        self.eeg_data.acquisition_time = min(read_times)
+        sampletime = counter[0][0] / self.eeg_data.sample_rate
+        self.eeg_data.block_time = self.start_time + datetime.timedelta(seconds=sampletime)
+        return copy.copy(self.eeg_data)
+
+    def process_idle(self):
+        ''' Wait for data from the reader threads
+        '''
+        self.wait_for_wakeup(0.05)
+
+    def getXML(self):
+        ''' Get module properties for XML configuration file
+        @return: objectify XML element::
+            <AMP_MultiChamp instance="0" version="1" module="multiamp">
+                <samplerate>1000</samplerate>
+                <sync_mask>0</sync_mask>
+            </AMP_MultiChamp>
+        '''
+        E = objectify.E
+        amplifier = E.AMP_MultiChamp(E.samplerate(self.sample_rate['value']),
+                                     E.sync_mask(self.sync_mask),
+                                     version=str(self.xmlVersion),
+                                     instance=str(self._instance),
+                                     module="multiamp")
+        return amplifier
+
+    def setXML(self, xml):
+        ''' Set module properties from XML configuration file
+        @param xml: complete objectify XML configuration tree,
+        module will search for matching values
+        '''
+        amps = xml.xpath("//AMP_MultiChamp[@module='multiamp' and @instance='%i']"%(self._instance) )
+        if len(amps) == 0:
+            return      # configuration data not found, leave everything unchanged
+        cfg = amps[0]
+
+        # check version, has to be lower or equal than current version
+        version = cfg.get("version")
+        if (version == None) or (int(version) > self.xmlVersion):
+            self.send_event(ModuleEvent(self._object_name, EventType.ERROR, "XML Configuration: wrong version"))
+            return
+
+        try:
+            # set closest matching sample rate
+            sr = cfg.samplerate.pyval
+            for rate in sorted(self.sample_rates, key=lambda r: r['value']):
+                if rate["value"] >= sr:
+                    self.sample_rate = rate
+                    break
+            self.sync_mask = cfg.sync_mask.pyval
+        except Exception as e:
+            self.send_exception(e, severity=ErrorSeverity.NOTIFY)
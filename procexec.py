@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+'''
+Process Execution of Module Kernels
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+CPU intensive sample processing of a module can be packed into a picklable
+kernel object. Depending on the module execution mode the kernel runs in the
+module worker thread or in a separate worker process, which is not limited by
+the interpreter lock of the main process. Sample data is exchanged through a
+shared memory block, only small control messages are passed through the pipe.
+
+The worker process starts in the background. Until it has imported the kernel
+module the kernel runs in the module worker thread, see KernelProcess.ready().
+
+Only the filter module (filter.FLT_Eeg) provides a kernel so far. The
+decimation of the amplifier module, the storage sample conversion and the
+display rescaling still run in their module worker threads.
+'''
+
+import numpy as np
+import time
+import importlib
+import multiprocessing
+import traceback
+from multiprocessing import shared_memory
+
+# initial size in bytes of the input and output areas of the exchange buffer,
+# the buffer grows with the first larger block
+KERNEL_BUFFER_SIZE = 1 << 20
+# maximum time in seconds to wait until a new worker process is ready
+KERNEL_START_TIMEOUT = 30.0
+
+
+class ProcessKernel(object):
+    ''' Base class for module processing kernels.
+    Kernels must be picklable and must not use Qt objects, because
+    they are transferred to and executed in the worker process.
+    '''
+    def process(self, eeg):
+        ''' Override this method to process the channel data.
+        The array is owned by the kernel call and can be modified in place.
+        @param eeg: channel data array (channels x samples)
+        @return: processed channel data array
+        '''
+        return eeg
+
+
+class KernelProcess(object):
+    ''' Worker process, executes the kernel of one module
+    '''
+    def __init__(self, name, kernel):
+        ''' Create and start the worker process. Returns without waiting for the
+        process start up, the process imports the kernel module and attaches the
+        exchange buffer in the background, see ready().
+        @param name: process name
+        @param kernel: ProcessKernel object, only its module is imported here
+        '''
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(target=_kernel_main, args=(child_conn,), name=name)
+        self._process.daemon = True
+        self._process.start()
+        child_conn.close()
+        self._shm = None        #: shared memory exchange buffer
+        self._half = 0          #: offset of the output area within the exchange buffer
+        self._kernel = None     #: last kernel object sent to the process
+        self._started = time.perf_counter()
+        self._ready = False     #: the process has imported the kernel module
+        try:
+            self._resize(KERNEL_BUFFER_SIZE)
+            self._conn.send(("import", type(kernel).__module__))
+        except Exception:
+            self.stop()
+            raise
+
+    def ready(self):
+        ''' Check without waiting if the worker process is ready to execute kernels
+        @return: True if the process has imported the kernel module
+        @raise Exception: the process start up failed or took longer than KERNEL_START_TIMEOUT
+        '''
+        if self._ready:
+            return True
+        try:
+            if not self._conn.poll(0):
+                if time.perf_counter() - self._started > KERNEL_START_TIMEOUT:
+                    raise Exception("kernel process not ready after %.0fs"%(KERNEL_START_TIMEOUT))
+                return False
+            reply = self._conn.recv()
+        except EOFError:
+            raise Exception("kernel process terminated")
+        if reply[0] == "error":
+            raise Exception("kernel process: " + reply[1])
+        self._ready = True
+        return True
+
+    def execute(self, kernel, eeg):
+        ''' Process channel data in the worker process
+        @param kernel: ProcessKernel object, transferred only if changed
+        @param eeg: channel data array (channels x samples)
+        @return: processed channel data array
+        '''
+        if kernel is not self._kernel:
+            self._conn.send(("kernel", kernel))
+            self._kernel = kernel
+        # input and output areas must be large enough for this block
+        if self._shm == None or eeg.nbytes > self._half:
+            self._resize(2 * eeg.nbytes)
+        indata = np.ndarray(eeg.shape, eeg.dtype, self._shm.buf)
+        indata[:] = eeg
+        del indata
+        self._conn.send(("process", eeg.shape, eeg.dtype.str))
+        try:
+            reply = self._conn.recv()
+        except EOFError:
+            raise Exception("kernel process terminated")
+        if reply[0] == "error":
+            raise Exception("kernel process: " + reply[1])
+        offset = 0 if reply[0] == "inplace" else self._half
+        return np.ndarray(reply[1], np.dtype(reply[2]), self._shm.buf, offset).copy()
+
+    def _resize(self, size):
+        ''' Create a new exchange buffer with input and output areas of size bytes
+        '''
+        if self._shm != None:
+            self._shm.close()
+            self._shm.unlink()
+        self._shm = shared_memory.SharedMemory(create=True, size=2 * size)
+        self._half = size
+        self._conn.send(("buffer", self._shm.name, size))
+
+    def stop(self):
+        ''' Terminate the worker process and release the exchange buffer
+        '''
+        try:
+            self._conn.send(("stop",))
+        except (OSError, ValueError):
+            pass
+        self._process.join(2.0)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
+        if self._shm != None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def _kernel_main(conn):
+    ''' Worker process main loop
+    @param conn: pipe connection to the module
+    '''
+    kernel = None
+    shm = None
+    half = 0
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg[0] == "process":
+            try:
+                eeg = np.ndarray(msg[1], np.dtype(msg[2]), shm.buf)
+                result = kernel.process(eeg)
+                if result is eeg:
+                    reply = ("inplace", result.shape, result.dtype.str)
+                else:
+                    if result.nbytes > half:
+                        raise Exception("kernel output exceeds exchange buffer")
+                    out = np.ndarray(result.shape, result.dtype, shm.buf, half)
+                    out[:] = result
+                    del out
+                    reply = ("done", result.shape, result.dtype.str)
+            except Exception:
+                reply = ("error", traceback.format_exc())
+            # release the exchange buffer views
+            eeg = result = None
+            conn.send(reply)
+        elif msg[0] == "kernel":
+            kernel = msg[1]
+        elif msg[0] == "import":
+            # the buffer message is already processed, the module is ready to go
+            try:
+                importlib.import_module(msg[1])
+                conn.send(("ready",))
+            except Exception:
+                conn.send(("error", traceback.format_exc()))
+        elif msg[0] == "buffer":
+            if shm != None:
+                shm.close()
+            shm = shared_memory.SharedMemory(name=msg[1])
+            half = msg[2]
+        elif msg[0] == "stop":
+            break
+    if shm != None:
+        shm.close()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+'''
+Sampling Profiler for Module Worker Threads
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Samples the call stacks of the module worker threads during a running
+acquisition. The threads are not instrumented, a separate thread reads the
+current frames of the selected threads every SAMPLE_INTERVAL seconds,
+so the profiler can be switched on and off at any time.
+
+The result is written in the collapsed stack format (one line per unique
+stack, frames separated by ';', followed by the number of samples), which
+can be converted into a flame graph by flamegraph.pl or loaded by speedscope.
+Modules executed inline share the thread of their parent module, their
+samples are labeled with the names of all modules of the thread.
+'''
+
+import os
+import sys
+import time
+import datetime
+import threading
+import collections
+import metrics
+
+
+# stack sampling interval in seconds
+SAMPLE_INTERVAL = 0.005
+
+
+def module_threads(names=None):
+    ''' Get the threads which execute the registered modules
+    @param names: list of module names, optionally followed by the instance
+    number (e.g. "Filter" or "Display 1"), None = all modules
+    @return: dictionary thread ident -> label
+    '''
+    if names != None:
+        names = [n.strip().lower() for n in names]
+    modules = collections.defaultdict(list)
+    for m in metrics.registry.items():
+        if m.thread_id == None:
+            continue
+        label = "%s %d"%(m.name, m.instance)
+        if names == None or m.name.lower() in names or label.lower() in names:
+            modules[m.thread_id].append(label)
+    # label each thread with all modules executed by it
+    threads = {}
+    for thread_id, labels in modules.items():
+        for m in metrics.registry.items():
+            label = "%s %d"%(m.name, m.instance)
+            if m.thread_id == thread_id and label not in labels:
+                labels.append(label)
+        threads[thread_id] = "+".join(labels)
+    return threads
+
+
+class SamplingProfiler(object):
+    ''' Collects stack samples of module worker threads for a limited time
+    '''
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self.recording_file = None      #: current recording file, profiles are written next to it
+        self.filename = None            #: output file of the running or last profile
+
+    def set_recording_file(self, filename):
+        ''' Set the location of the profile files
+        @param filename: recording file name
+        '''
+        self.recording_file = filename
+
+    def get_filename(self):
+        ''' Get a new profile file name, next to the recording or in the working directory
+        '''
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        if self.recording_file:
+            return "%s_profile_%s.txt"%(os.path.splitext(self.recording_file)[0], stamp)
+        return os.path.join(os.getcwd(), "PyCorder_profile_%s.txt"%(stamp))
+
+    def isRunning(self):
+        ''' Get the profiler state
+        @return: True if a profile is recorded
+        '''
+        return self._thread != None and self._thread.is_alive()
+
+    def start(self, names=None, duration=60.0, done=None):
+        ''' Start sampling the module worker threads
+        @param names: list of module names, see module_threads()
+        @param duration: sampling time in seconds
+        @param done: optional callable(filename, samples), called by the
+        sampling thread when the profile file is written
+        @return: profile file name
+        '''
+        if self.isRunning():
+            raise Exception("profiler is already running")
+        threads = module_threads(names)
+        if len(threads) == 0:
+            raise Exception("no running module thread found")
+        self.filename = self.get_filename()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_thread, name="Profiler",
+                                        args=(threads, duration, self.filename, done))
+        self._thread.daemon = True
+        self._thread.start()
+        return self.filename
+
+    def stop(self):
+        ''' Stop sampling and write the profile file
+        '''
+        if self._thread != None:
+            self._stop.set()
+            self._thread.join(5.0)
+            self._thread = None
+
+    def _sample_thread(self, threads, duration, filename, done):
+        ''' Take stack samples until the duration has elapsed
+        '''
+        stacks = collections.Counter()      #: (thread label, code objects root first) -> samples
+        deadline = time.perf_counter() + duration
+        samples = 0
+        while not self._stop.wait(SAMPLE_INTERVAL) and time.perf_counter() < deadline:
+            frames = sys._current_frames()
+            for thread_id, label in threads.items():
+                frame = frames.get(thread_id)
+                codes = []
+                while frame != None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                if len(codes) > 0:
+                    codes.reverse()
+                    stacks[(label, tuple(codes))] += 1
+            samples += 1
+            del frames, frame
+        self._write(stacks, filename)
+        if done != None:
+            done(filename, samples)
+
+    def _write(self, stacks, filename):
+        ''' Write the collected samples in collapsed stack format
+        '''
+        names = {}
+        with open(filename, "w") as f:
+            for (label, codes), count in stacks.most_common():
+                frames = [label]
+                for code in codes:
+                    if code not in names:
+                        names[code] = "%s (%s:%d)"%(code.co_name, os.path.basename(code.co_filename),
+                                                    code.co_firstlineno)
+                    frames.append(names[code])
+                f.write("%s %d\n"%(";".join(frames), count))
+
+
+profiler = SamplingProfiler()   #: global module profiler
@@ -462,9 +462,10 @@ class RDA_Client(ModuleBase):
             block, points, markerCount = unpack('<LLL', serverData.Data[:12])
             channels = self.data.eeg_channels.shape[0]
             
-            # extract markers
+            # extract markers, the first buffered message defines the acquisition time
             if self.data_count == 0:
                 self.data.markers = []
+                self.data.acquisition_time = time.perf_counter()
             index = 12 + 4 * points * channels
             for m in range(markerCount):
                 markersize, = unpack('<L', serverData.Data[index:index+4])
@@ -492,7 +493,9 @@ class RDA_Client(ModuleBase):
                 eeg = np.fromstring(data,
                                     dtype = np.float32,
                                     count = self.data_count * channels)
-                self.data.eeg_channels = np.transpose(np.reshape(eeg, (self.data_count, -1))) * self.resolutions[:,np.newaxis]
+                eeg = np.transpose(np.reshape(eeg, (self.data_count, -1)))
+                self.data.eeg_channels = np.empty(eeg.shape, sample_type())
+                np.multiply(eeg, self.resolutions[:,np.newaxis], out=self.data.eeg_channels)
                 # create sample counter channel
                 self.data.sample_channel = np.arange(self.data.sample_counter,
                                                      self.data.sample_counter + self.data_count,
@@ -62,6 +62,11 @@ class RDAMessageType:
     KEEP_ALIVE = 10000  #: Sent periodically to check whether the connection is still alive
 
 
+# acquisition to network latency deadline in seconds (see ModuleBase.report_latency()),
+# None = no deadline
+RDA_DEADLINE = 0.1
+
+
 class RDA_Server(ModuleBase):
     ''' Transmit EEG data over network via TCP/IP 
     '''
@@ -69,6 +74,7 @@ class RDA_Server(ModuleBase):
     def __init__(self, *args, **keys):
         ''' Initialize module and create the accept thread
         '''
+        keys.setdefault("deadline", RDA_DEADLINE)
         ModuleBase.__init__(self, name="RDA Server", **keys)
         self.data = None
         self.dataavailable = False
@@ -134,7 +140,7 @@ class RDA_Server(ModuleBase):
             if len(rd) > 0:
                 # get the client socket and create a connection object
                 clientsock, addr = self.serversock.accept()
-                client = ClientConnection(clientsock, addr)
+                client = ClientConnection(clientsock, addr, self.report_latency)
                 # init client
                 try:
                     sm = self.build_message(0)
@@ -207,7 +213,7 @@ class RDA_Server(ModuleBase):
         self._thServerLock.acquire()
         for client in self.clients:
             try:
-                client.send(dm)
+                client.send(dm, datablock.acquisition_time)
             except:
                 if self.showClientErrors:
                     self.send_event(ModuleEvent(self._object_name, EventType.ERROR,
@@ -305,7 +311,7 @@ class RDA_Server(ModuleBase):
             chn =[]
             for channel in data.channel_properties:
                 chn.append(unicode(channel.name).encode("cp1252"))
-            chnbyte = "\0".join(chn) + "\0"    
+            chnbyte = b"\0".join(chn) + b"\0"    
             
             # create message header
             hdr_start = Struct(self.hdr+ "Ld")      # start: nChannels, dSamplingInterval + data
@@ -325,20 +331,16 @@ class RDA_Server(ModuleBase):
             return hdrbyte
 
         elif type == RDAMessageType.DATA32:
-            # create data byte array
             nPoints = len(data.sample_channel[0])
-            # convert data to float and write to data file
             d = data.eeg_channels.transpose()
-            f = d.flatten().astype(np.float32)
-            databyte = f.tostring()
             
             # create marker byte array
             nMarkers = len(data.markers)
             hdr_marker = Struct("<LlLl") # marker: nSize, nPosition, nPoints, nChannel + sTypeDesc
             mkrbyte = bytearray()
             for marker in data.markers:
-                mdescription = marker.description.encode("utf-8") + "\0"
-                mtype = marker.type.encode("utf-8") + "\0"
+                mdescription = marker.description.encode("utf-8") + b"\0"
+                mtype = marker.type.encode("utf-8") + b"\0"
                 msize = hdr_marker.size + len(mdescription) + len(mtype)
                 mpos = marker.position - data.sample_channel[0][0] # marker position must be relative to this data block
                 mpos = int(np.int64(mpos))
@@ -349,12 +351,16 @@ class RDA_Server(ModuleBase):
 
             # create message header
             hdr_start = Struct(self.hdr+ "LLL")      # data32: nBlock, nPoints, nMarkers + data + marker
-            blocksize = hdr_start.size + len(databyte) + len(mkrbyte)
-            hdrbyte = bytearray(hdr_start.pack(self.GUID, blocksize, type, self.blockcount, nPoints, nMarkers))
-
-            # add data part
-            hdrbyte.extend(databyte)
-            hdrbyte.extend(mkrbyte)
+            databytes = d.size * np.dtype(np.float32).itemsize
+            blocksize = hdr_start.size + databytes + len(mkrbyte)
+            hdrbyte = bytearray(blocksize)
+            hdr_start.pack_into(hdrbyte, 0, self.GUID, blocksize, type, self.blockcount, nPoints, nMarkers)
+
+            # add data part, convert data to float directly into the message buffer
+            f = np.frombuffer(hdrbyte, np.float32, d.size, hdr_start.size).reshape(d.shape)
+            np.copyto(f, d, casting="same_kind")
+            del f
+            hdrbyte[hdr_start.size + databytes:] = mkrbyte
             return hdrbyte 
 
         elif type == RDAMessageType.IMP_START:
@@ -390,14 +396,14 @@ class RDA_Server(ModuleBase):
                         channelName =  ch.name + "+"
                     else:
                         channelName = ch.name
-                    suElectrodeName = unicode(channelName).encode("utf-16le") + "\0\0"
+                    suElectrodeName = unicode(channelName).encode("utf-16le") + b"\0\0"
                     imp = self._packImpedance(nChannels, valD, suElectrodeName)
                     impbyte.extend(imp)
                     nChannels += 1
                         
                 if valR != None:
                     channelName = ch.name + "-"
-                    suElectrodeName = unicode(channelName).encode("utf-16le") + "\0\0"
+                    suElectrodeName = unicode(channelName).encode("utf-16le") + b"\0\0"
                     imp = self._packImpedance(nChannels, valR, suElectrodeName)
                     impbyte.extend(imp)
                     nChannels += 1
@@ -409,7 +415,7 @@ class RDA_Server(ModuleBase):
 
             if gndImpedance != None:
                 channelName = "GND"
-                suElectrodeName = unicode(channelName).encode("utf-16le") + "\0\0"
+                suElectrodeName = unicode(channelName).encode("utf-16le") + b"\0\0"
                 imp = self._packImpedance(nChannels, gndImpedance, suElectrodeName)
                 impbyte.extend(imp)
                 nChannels += 1
@@ -501,13 +507,16 @@ class RDA_Server(ModuleBase):
 class ClientConnection():
     ''' Object holding a connected client
     '''
-    def __init__(self, clientsock, addr):
+    def __init__(self, clientsock, addr, report_latency=None):
         ''' Create data transmit thread
         @param clientsock: client socket
         @param addr: client IP address 
+        @param report_latency: called with the acquisition time of a data message
+        after the message is sent completely
         '''
         self.sock = clientsock
         self.addr = addr
+        self.report_latency = report_latency
         self.transmit_queue = queue.Queue(20)
         # start transmit thread
         self.connected = True
@@ -522,11 +531,12 @@ class ClientConnection():
             self.clientthread.join(5.0)
         self.sock.close()
         
-    def send(self, message):
+    def send(self, message, acquisition_time=0):
         ''' Put the message into the transmit queue
+        @param acquisition_time: EEG_DataBlock.acquisition_time of data messages
         '''
         if self.connected:
-            self.transmit_queue.put(message, False)
+            self.transmit_queue.put((message, acquisition_time), False)
     
     def _transmit_thread(self):
         ''' Get data from queue and send it over TCP/IP
@@ -534,16 +544,19 @@ class ClientConnection():
         while self.connected:
             try:
                 # get data from queue
-                data = self.transmit_queue.get(False)
-                # send it to client
+                data, acquisition_time = self.transmit_queue.get(False)
+                # send it to client, without copying the remaining part of the message
                 totalsent = 0
+                view = memoryview(data)
                 while totalsent < len(data):
                     rd, wr, err = select([],[self.sock],[], 0.05)
                     if len(wr) > 0:
-                        sent = self.sock.send(data[totalsent:])
+                        sent = self.sock.send(view[totalsent:])
                         if sent == 0:
                             raise RuntimeError("socket connection broken")
                         totalsent = totalsent + sent
+                if acquisition_time and self.report_latency:
+                    self.report_latency(acquisition_time)
                 
             except queue.Empty:
                 time.sleep(0.002)        # suspend thread (default = 2ms)
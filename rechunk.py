@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+'''
+Block Re-Chunking Module
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Decouples the block size of all following modules from the hardware read
+interval. Blocks are merged or split to a target duration or sample count,
+markers, sample counters and block times are kept consistent.
+A single module can get re-chunked input without this module by the
+chunk_samples / chunk_duration arguments of ModuleBase.
+'''
+
+from modbase import *
+
+
+class CHK_Rechunk(ModuleBase):
+    ''' Merge or split data blocks to a target length
+    '''
+    def __init__(self, *args, **keys):
+        ''' Constructor
+        '''
+        ModuleBase.__init__(self, name="Rechunk", **keys)
+
+        # XML parameter version
+        # 1: initial version
+        self.xmlVersion = 1
+
+        self.data = None
+        self.dataavailable = False
+
+        # set default properties
+        self.setDefault()
+
+    def setDefault(self):
+        ''' Set all module parameters to default values
+        '''
+        self.chunk_duration = 0.05      #: target block length in seconds
+        self.chunk_samples = 0          #: target block length in samples, overrides duration if > 0
+        self._update_chunking()
+
+    def _update_chunking(self):
+        ''' Apply the target block length to the input re-chunking
+        '''
+        if self.chunk_samples > 0:
+            self.set_chunking(samples=self.chunk_samples)
+        else:
+            self.set_chunking(duration=self.chunk_duration)
+
+    def get_module_info(self):
+        ''' Get information about this module for the about dialog
+        '''
+        if self.chunk_samples > 0:
+            return "Rechunk: %d samples per block"%(self.chunk_samples)
+        return "Rechunk: %.0fms blocks"%(self.chunk_duration * 1000.0)
+
+    def process_input(self, datablock):
+        ''' Blocks are already re-chunked by the worker thread
+        '''
+        self.dataavailable = True
+        self.data = datablock
+
+    def process_output(self):
+        if not self.dataavailable:
+            return None
+        self.dataavailable = False
+        return self.data
+
+    def getXML(self):
+        ''' Get module properties for XML configuration file
+        @return: objectify XML element::
+            e.g.
+            <CHK_Rechunk instance="0" version="1">
+                <chunk_duration>0.05</chunk_duration>
+                <chunk_samples>0</chunk_samples>
+            </CHK_Rechunk>
+        '''
+        E = objectify.E
+        cfg = E.CHK_Rechunk(E.chunk_duration(self.chunk_duration),
+                            E.chunk_samples(self.chunk_samples),
+                            version=str(self.xmlVersion),
+                            instance=str(self._instance),
+                            module="rechunk")
+        return cfg
+
+    def setXML(self, xml):
+        ''' Set module properties from XML configuration file
+        @param xml: complete objectify XML configuration tree,
+        module will search for matching values
+        '''
+        # search my configuration data
+        cfgs = xml.xpath("//CHK_Rechunk[@module='rechunk' and @instance='%i']"%(self._instance))
+        if len(cfgs) == 0:
+            # configuration data not found, set default values
+            self.setDefault()
+            return
+
+        # we should have only one instance from this type
+        cfg = cfgs[0]
+
+        # check version, has to be lower or equal than current version
+        version = cfg.get("version")
+        if (version == None) or (int(version) > self.xmlVersion):
+            self.send_event(ModuleEvent(self._object_name, EventType.ERROR, "XML Configuration: wrong version"))
+            return
+
+        # get the values
+        try:
+            self.chunk_duration = cfg.chunk_duration.pyval
+            self.chunk_samples = cfg.chunk_samples.pyval
+            self._update_chunking()
+        except Exception as e:
+            self.send_exception(e, severity=ErrorSeverity.NOTIFY)
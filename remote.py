@@ -31,7 +31,6 @@ along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
 
 B{Revision:} $LastChangedRevision: 214 $
 '''
-from PyQt4 import Qt
 from socket import *
 from select import *
 import threading
@@ -52,9 +51,13 @@ except NameError:
 from modbase import ModuleEvent
 from modbase import EventType
 from modbase import ErrorSeverity
+from modbase import RecordingMode
+from modbase import SignalObject, SIGNAL
+from profiler import profiler
+import eventbus
 
 
-class RemoteControlServer(Qt.QObject):
+class RemoteControlServer(SignalObject):
     ''' Receive remote commands over network via TCP/IP
     It opens a TCP/IP server on port 6700 and listens for a string as a command. 
     '''
@@ -62,7 +65,7 @@ class RemoteControlServer(Qt.QObject):
     def __init__(self):
         ''' Initialize the server and create the accept thread
         '''
-        Qt.QObject.__init__(self)
+        SignalObject.__init__(self)
         self._object_name = "RemoteControlServer"
         self.clients = []               #: list of connected clients
         self.blockcount = 0             #: number of received data blocks
@@ -130,7 +133,7 @@ class RemoteControlServer(Qt.QObject):
         ''' Send ModuleEvent objects to all connected slots.
         @param event: ModuleEvent object
         '''
-        self.emit(Qt.SIGNAL('event(PyQt_PyObject)'), event)
+        self.emit(SIGNAL('event(PyQt_PyObject)'), event)
         
     def send_feedback(self, feedback):
         ''' send feedback to attached client
@@ -188,7 +191,7 @@ class RemoteControlServer(Qt.QObject):
             self._thServerLock.release()
                 
 
-class RemoteClientConnection(Qt.QObject):
+class RemoteClientConnection(SignalObject):
     ''' Object holding a connected remote client
     '''
     def __init__(self, clientsock, addr, parent_server):
@@ -196,7 +199,7 @@ class RemoteClientConnection(Qt.QObject):
         @param clientsock: client socket
         @param addr: client IP address 
         '''
-        Qt.QObject.__init__(self)
+        SignalObject.__init__(self)
         self.ParentServer = parent_server
         self.sock = clientsock
         self.addr = addr
@@ -279,6 +282,180 @@ class RemoteClientConnection(Qt.QObject):
                             
             except Exception as e:
                 self.connected = False
-        
 
 
+class RemoteCommandHandler(object):
+    ''' Remote control command processing, used by the main window and the headless runtime.
+    The derived class provides:
+        - self.RC: RemoteControlServer object
+        - self.topmodule: top module of the module chain
+        - self.recording_mode: current RecordingMode
+        - self.sendEvent(event): send an event to the top module event chain
+        - self.processEvent(event): log and display an event
+        - self._loadConfiguration(filename): load a module configuration file
+    '''
+    def processRemoteCommand(self, cmd_string):
+        ''' Process commands received from remote control
+        @param cmd: the received command
+        @return: log entry and error message
+        '''
+        error_message = ""
+        log_entry = u"command received: '%s'"%(cmd_string)
+        if len(cmd_string) > 0:
+            # split command and value
+            cmd = cmd_string[0].upper()
+            if len(cmd_string) > 1:
+                cmd_value = cmd_string[1:]
+            else:
+                cmd_value = ""
+
+            # check for supported commands
+            if cmd not in ["1", "2", "3", "4", "M", "I", "S", "Q", "X", "F", "P"]:
+                error_message = u"command not supported: '%s'"%(cmd_string)
+
+            # check the recording state and if the requested command can be applied
+            elif cmd in ["S", "I", "M", "X", "Q"] and self.topmodule.isRunning() and not self.RC.remoteRecording:
+                error_message = u"recording is in progress and was not started remote: '%s'"%(cmd_string)
+
+            elif cmd not in ["Q", "X", "P"] and not self.topmodule.query("RemoteStop"):
+                error_message = u"recording is still in progress, stop it first with 'X': '%s'"%(cmd_string)
+
+            elif cmd in ["1", "2", "3", "4"] and self.topmodule.isRunning():
+                error_message = u"data acquisition is still in progress, stop it first with 'X': '%s'"%(cmd_string)
+
+            elif cmd in ["4", "S", "I", "M", "X", "Q"] and not self.RC.isInitialized():
+                error_message = u"some variables (1 Configuration file, 2 Experiment ID or 3 Subject ID) are not initialized: '%s'"%(cmd_string)
+
+            # Initialization
+            elif cmd == "1":
+                self.RC.S_ConfigurationFile = cmd_value
+            elif cmd == "2":
+                self.RC.S_ExperimentNr = cmd_value
+            elif cmd == "3":
+                self.RC.S_SubjectID = cmd_value
+            elif cmd == "4":
+                # prepare recording
+                # load configuration file
+                try:
+                    self._loadConfiguration(self.RC.S_ConfigurationFile)
+                except:
+                    error_message = u"failed to load configuration file: '%s'"%(self.RC.S_ConfigurationFile)
+
+            # Exit
+            elif cmd == "X":
+                # exit, stop everything and reset all state variables
+                # stop data acquisition
+                self.sendEvent(ModuleEvent("RemoteControl",
+                                           EventType.COMMAND,
+                                           info="Stop",
+                                           cmd_value="force"))
+                #self.RC.resetControlState()
+                self.RC.remoteRecording = False
+
+            # Monitoring
+            elif cmd == "I":
+                # start impedance mode
+                self.sendEvent(ModuleEvent("RemoteControl",
+                                           EventType.COMMAND,
+                                           info="StartImpedance"))
+                self.RC.remoteRecording = True
+
+            elif cmd == "M":
+                # start monitoring
+                self.sendEvent(ModuleEvent("RemoteControl",
+                                           EventType.COMMAND,
+                                           info="StartRecording"))
+                self.RC.remoteRecording = True
+
+            # Recording
+            elif cmd == "S":
+                # start monitoring if not yet started
+                if not self.topmodule.isRunning() or self.recording_mode != RecordingMode.NORMAL:
+                    self.sendEvent(ModuleEvent("RemoteControl",
+                                               EventType.COMMAND,
+                                               info="StartRecording"))
+                # start recording
+                filename = "%s_%s"%(self.RC.S_ExperimentNr, self.RC.S_SubjectID)
+                self.sendEvent(ModuleEvent("RemoteControl",
+                                           EventType.COMMAND,
+                                           info="StartSaving",
+                                           cmd_value=filename))
+                self.RC.remoteRecording = True
+
+            elif cmd == "Q":
+                # stop recording
+                self.sendEvent(ModuleEvent("RemoteControl",
+                                           EventType.COMMAND,
+                                           info="StopSaving"))
+
+            # enable / disable feedback
+            elif cmd == "F":
+                self.RC.feedbackEnabled = (cmd_value == "1")
+
+            # module profiler: P[seconds][,module,module...], P0 = stop
+            elif cmd == "P":
+                values = cmd_value.split(",")
+                try:
+                    duration = float(values[0]) if len(values[0].strip()) > 0 else 60.0
+                    if duration <= 0:
+                        profiler.stop()
+                    else:
+                        names = values[1:] if len(values) > 1 else None
+                        self.startProfiler(names, duration)
+                except Exception as e:
+                    error_message = u"profiler: %s '%s'"%(str(e), cmd_string)
+
+        else:
+            error_message = u"invalid command (size=0)"
+
+        # send feedback
+        if error_message:
+            self.RC.send_feedback("%sFAILED %s"%(cmd, error_message))
+        else:
+            if cmd in ["S", "I", "M"]:
+                self.RC.postpone_feedback(cmd)
+            elif cmd == "P":
+                self.RC.send_feedback("%sOK %s"%(cmd, profiler.filename))
+            else:
+                self.RC.send_feedback("%sOK"%(cmd))
+
+        return log_entry, error_message
+
+
+    def startProfiler(self, names=None, duration=60.0):
+        ''' Start sampling the module worker threads, the profile file is logged when it is written
+        @param names: list of module names, None = all modules (see profiler.module_threads())
+        @param duration: sampling time in seconds
+        @return: profile file name
+        '''
+        done = lambda filename, samples: eventbus.bus.post(self._profilerDone, (filename, samples))
+        return profiler.start(names, duration, done)
+
+    def _profilerDone(self, filename, samples):
+        self.processEvent(ModuleEvent("Profiler", EventType.LOGMESSAGE,
+                                      "%d stack samples written to %s"%(samples, filename)))
+
+    def processRemoteFeedback(self, event):
+        ''' Handle postponed command feedbacks
+        '''
+        if not self.RC:
+            return
+        if not self.RC.isClientConnected():
+            return
+
+        for idx, cmd in enumerate(self.RC.postponed):
+            if event.type == EventType.ERROR:
+                self.RC.send_feedback("%sFAILED %s"%(cmd, event.info))
+                del self.RC.postponed[idx]
+            elif cmd == "M":
+                if event.type == EventType.STATUS and event.status_field == "Mode" and event.info == RecordingMode.NORMAL:
+                    self.RC.send_feedback("%sOK"%(cmd))
+                    del self.RC.postponed[idx]
+            elif cmd == "I":
+                if event.type == EventType.STATUS and event.status_field == "Mode" and event.info == RecordingMode.IMPEDANCE:
+                    self.RC.send_feedback("%sOK"%(cmd))
+                    del self.RC.postponed[idx]
+            elif cmd == "S":
+                if event.type == EventType.STATUS and event.status_field == "Storage" and event.info:
+                    self.RC.send_feedback("%sOK %s"%(cmd, event.info))
+                    del self.RC.postponed[idx]
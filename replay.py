@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+'''
+BrainVision File Replay Module
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Source module which sends a recorded BrainVision data set (.vhdr, .vmrk,
+.eeg, as written by the storage module) through the module chain, e.g. to
+reprocess a session or to load the chain with real data without hardware.
+
+The data file is memory mapped, blocks are read from the file while they
+are sent. The markers of the marker file are sent with the data blocks,
+the trigger channel is empty (a trigger detector in the chain doesn't
+create the markers a second time). Replay modes:
+    - real time: blocks are sent at the recording sampling rate
+    - as fast as possible: receivers which would drop blocks if their input
+      queue is full wait for the queue instead (Backpressure.BLOCK), so the
+      replay is lossless and runs at the speed of the slowest module
+'''
+
+from modbase import *
+from bufpool import pool
+
+# block interval in seconds (like the amplifier read interval)
+REPLAY_INTERVAL = 0.05
+
+# binary sample formats of the BrainVision data file
+REPLAY_FORMATS = {"IEEE_FLOAT_32": np.float32, "INT_16": np.int16, "INT_32": np.int32}
+
+
+def _unescape(text):
+    ''' Decode commas in BrainVision text fields
+    '''
+    return text.replace("\\1", ",")
+
+
+def _read_sections(filename):
+    ''' Read the sections of a BrainVision header or marker file
+    @param filename: file name
+    @return: dictionary section name -> list of (key, value), "Comment" -> list of lines
+    '''
+    with open(filename, "rb") as f:
+        raw = f.read()
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        text = raw.decode("latin-1")        # Codepage=ANSI
+    sections = {}
+    section = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("["):
+            section = line.strip("[]")
+            sections[section] = []
+        elif section == "Comment":
+            sections[section].append(line)
+        elif section != None and len(line) > 0 and not line.startswith(";") and "=" in line:
+            key, value = line.split("=", 1)
+            sections[section].append((key.strip(), value))
+    return sections
+
+
+def read_vision_header(filename):
+    ''' Read a BrainVision header file
+    @param filename: header file name (.vhdr)
+    @return: dictionary with data file, marker file, sample format, orientation,
+    sample rate, reference channel name and list of channels (name, reference, resolution, unit)
+    '''
+    sections = _read_sections(filename)
+    common = dict(sections.get("Common Infos", []))
+    binary = dict(sections.get("Binary Infos", []))
+    path = os.path.dirname(filename)
+    if common.get("DataFormat", "BINARY").upper() != "BINARY":
+        raise Exception("data format %s not supported"%(common.get("DataFormat")))
+    sampleformat = binary.get("BinaryFormat", "INT_16").upper()
+    if sampleformat not in REPLAY_FORMATS:
+        raise Exception("binary format %s not supported"%(sampleformat))
+    channels = []
+    for key, value in sections.get("Channel Infos", []):
+        fields = value.split(",")
+        fields += [""] * (4 - len(fields))
+        channels.append((_unescape(fields[0]), _unescape(fields[1]),
+                         float(fields[2]) if len(fields[2].strip()) else 1.0,
+                         fields[3]))
+    if len(channels) != int(common.get("NumberOfChannels", len(channels))):
+        raise Exception("%s: number of channels doesn't match the channel infos"%(filename))
+    refname = ""
+    for line in sections.get("Comment", []):
+        if line.startswith("Reference channel:"):
+            refname = line.split(":", 1)[1].strip()
+    header = {'data_file': os.path.join(path, common["DataFile"]),
+              'marker_file': os.path.join(path, common["MarkerFile"]) if "MarkerFile" in common else None,
+              'dtype': np.dtype(REPLAY_FORMATS[sampleformat]).newbyteorder(
+                       ">" if binary.get("UseBigEndianOrder", "NO").upper() == "YES" else "<"),
+              'multiplexed': common.get("DataOrientation", "MULTIPLEXED").upper() == "MULTIPLEXED",
+              'sample_rate': 1e6 / float(common["SamplingInterval"]),
+              'ref_channel_name': refname,
+              'channels': channels}
+    return header
+
+
+def read_vision_markers(filename):
+    ''' Read a BrainVision marker file
+    @param filename: marker file name (.vmrk)
+    @return: list of EEG_Marker objects, positions are file positions (1 = first sample)
+    '''
+    markers = []
+    for key, value in _read_sections(filename).get("Marker Infos", []):
+        fields = value.split(",")
+        fields += [""] * (6 - len(fields))
+        marker = EEG_Marker(type=_unescape(fields[0]), description=_unescape(fields[1]),
+                            position=int(fields[2]),
+                            points=int(fields[3]) if len(fields[3].strip()) else 1,
+                            channel=int(fields[4]) if len(fields[4].strip()) else 0)
+        if len(fields[5].strip()) > 0:
+            marker.date = True
+            try:
+                marker.dt = datetime.datetime.strptime(fields[5].strip(), "%Y%m%d%H%M%S%f")
+            except ValueError:
+                pass
+        markers.append(marker)
+    markers.sort(key=lambda m: m.position)
+    return markers
+
+
+class REP_Vision(ModuleBase):
+    ''' Replay a BrainVision data set
+    '''
+
+    def __init__(self, file_name="", realtime=True, loop=False, *args, **keys):
+        ''' Constructor
+        @param file_name: BrainVision header file name (.vhdr)
+        @param realtime: send at the recording sampling rate, False = as fast as possible
+        @param loop: start again at the beginning of the file
+        '''
+        ModuleBase.__init__(self, name="Replay", **keys)
+
+        # XML parameter version
+        # 1: initial version
+        self.xmlVersion = 1
+
+        self.file_name = ""                 #: BrainVision header file name
+        self.realtime = realtime            #: send in real time
+        self.loop = loop                    #: replay endless
+        self.samples = None                 #: memory mapped data file (samples x channels)
+        self.resolution = np.ones((0, 1))   #: channel resolutions
+        self.markers = []                   #: markers of the marker file
+        self.marker_positions = np.array([], np.int64)  #: sample index of each marker
+        self.recording_time = None          #: recording start time from the marker file
+        self.data = EEG_DataBlock(0, 0)
+        self.running = False
+        self._chain_backpressure = []       #: (receiver, original policy) while running
+
+        # create online configuration pane
+        self.online_cfg = _OnlineCfgPane(self)
+        self.connect(self.online_cfg, Qt.SIGNAL("modeChanged(int)"), self._online_mode_changed)
+
+        if file_name:
+            self.open_file(file_name)
+
+    def get_online_configuration(self):
+        ''' Get the online configuration pane
+        '''
+        return self.online_cfg
+
+    def open_file(self, file_name):
+        ''' Load a BrainVision data set, data and markers are replayed from the next start on
+        @param file_name: header file name (.vhdr)
+        '''
+        header = read_vision_header(file_name)
+        channels = len(header['channels'])
+        samples = np.memmap(header['data_file'], header['dtype'], mode="r")
+        count = samples.size // channels if channels else 0
+        if header['multiplexed']:
+            samples = samples[:count * channels].reshape(count, channels)
+        else:
+            samples = samples[:count * channels].reshape(channels, count).T
+
+        markers = []
+        if header['marker_file'] != None and os.path.exists(header['marker_file']):
+            markers = read_vision_markers(header['marker_file'])
+        self.recording_time = None
+        if len(markers) > 0 and markers[0].type == "New Segment" and markers[0].position == 1:
+            # the storage module starts the new recording with its own segment marker
+            self.recording_time = markers[0].dt
+            markers = markers[1:]
+
+        # channel configuration, all channels are already filtered by the recorder
+        properties = []
+        inputs = {ChannelGroup.EEG: 0, ChannelGroup.AUX: 0}
+        for name, refname, resolution, unit in header['channels']:
+            ch = EEG_ChannelProperties(name)
+            group = ChannelGroup.AUX if name.lower().startswith("aux") else ChannelGroup.EEG
+            inputs[group] += 1
+            ch.input = inputs[group]
+            ch.inputgroup = group
+            ch.group = group
+            ch.refname = refname
+            ch.unit = "" if unit in ("", u"µV", "uV") else unit
+            ch.lowpass = 0.0
+            ch.highpass = 0.0
+            ch.notchfilter = False
+            properties.append(ch)
+
+        self._thLock.acquire()
+        try:
+            self.file_name = file_name
+            self.samples = samples
+            self.resolution = np.array([c[2] for c in header['channels']]).reshape(-1, 1)
+            self.markers = markers
+            self.marker_positions = np.array([m.position - 1 for m in markers], np.int64)
+            self.data = EEG_DataBlock(0, 0)
+            self.data.channel_properties = np.array(properties)
+            self.data.sample_rate = header['sample_rate']
+            self.data.ref_channel_name = header['ref_channel_name']
+            self.data.recording_mode = RecordingMode.NORMAL
+        finally:
+            self._thLock.release()
+        self.online_cfg.set_filename(file_name, samples.shape[0] / header['sample_rate'])
+
+    def _online_mode_changed(self, mode):
+        ''' SIGNAL from online configuration pane, start (1) or stop (0) the replay
+        '''
+        if self.running:
+            if not self.stop():
+                self.online_cfg.updateUI(1)
+                return
+        if mode == 1:
+            if self.samples is None:
+                self.online_cfg.updateUI(0)
+                self.send_event(ModuleEvent(self._object_name, EventType.ERROR,
+                                            info="no data set selected",
+                                            severity=ErrorSeverity.NOTIFY))
+                return
+            self.realtime = self.online_cfg.checkBoxRealtime.isChecked()
+            self.loop = self.online_cfg.checkBoxLoop.isChecked()
+            self.start()
+
+    def stop(self, force=False):
+        ''' Stop the replay
+        @param force: force stop without query
+        @return: True, if stop was accepted by attached modules
+        '''
+        if not force:
+            if not self.query("Stop"):
+                return False
+        ModuleBase.stop(self)
+        return True
+
+    def process_event(self, event):
+        ''' Handle remote commands
+        @param event: ModuleEvent
+        '''
+        if event.type == EventType.COMMAND:
+            if event.info == "Stop":
+                self.stop(force=(event.cmd_value == "force"))
+            if event.info == "StartRecording":
+                self._online_mode_changed(1)
+
+    def process_update(self, params):
+        ''' Propagate the channel configuration of the data set to all receivers
+        '''
+        self.send_event(ModuleEvent(self._object_name,
+                                    EventType.STATUS,
+                                    info = "%.0f Hz"%(self.data.sample_rate),
+                                    status_field = "Rate"))
+        self.send_event(ModuleEvent(self._object_name,
+                                    EventType.STATUS,
+                                    info = "%d ch"%(len(self.data.channel_properties)),
+                                    status_field="Channels"))
+        return copy.copy(self.data)
+
+    def _set_chain_backpressure(self, modules):
+        ''' Let all receivers wait for a full input queue instead of dropping the new block
+        @param modules: receivers
+        '''
+        for module in modules:
+            previous = module.set_backpressure(Backpressure.BLOCK)
+            if previous == Backpressure.DROP_NEWEST:
+                self._chain_backpressure.append((module, previous))
+            else:
+                # intentionally lossy modules (e.g. displays) keep their policy
+                module.set_backpressure(previous)
+            self._set_chain_backpressure(module.get_receivers())
+
+    def process_start(self):
+        ''' Start the replay at the beginning of the file
+        '''
+        self.position = 0                   #: next sample index in the file
+        self.loops = 0                      #: number of completed loops
+        self.finished = False
+        self.block_samples = max(int(self.data.sample_rate * REPLAY_INTERVAL), 1)
+        self._counter = np.arange(self.block_samples, dtype=np.uint64)
+        self.data.sample_counter = 0
+        self.data.markers = []
+        self.update_receivers()
+        if not self.realtime:
+            self._set_chain_backpressure(self.get_receivers())
+        self.running = True
+        self.first_time = time.perf_counter()
+        self.start_time = self.recording_time or datetime.datetime.now()
+        info = "Start replay of %s (%s)"%(os.path.split(self.file_name)[1],
+                                          "real time" if self.realtime else "as fast as possible")
+        self.send_event(ModuleEvent(self._object_name, EventType.LOGMESSAGE, info))
+        self.send_event(ModuleEvent(self._object_name,
+                                    EventType.STATUS,
+                                    info = RecordingMode.NORMAL,
+                                    status_field="Mode"))
+        self.online_cfg.updateUI(1)
+
+    def process_stop(self):
+        ''' Stop the replay, restore the receiver backpressure
+        '''
+        for module, previous in self._chain_backpressure:
+            module.set_backpressure(previous)
+        self._chain_backpressure = []
+        self.running = False
+        info = "Stop replay after %.1fs"%(self.data.sample_counter / self.data.sample_rate)
+        self.send_event(ModuleEvent(self._object_name, EventType.LOGMESSAGE, info))
+        self.send_event(ModuleEvent(self._object_name,
+                                    EventType.STATUS,
+                                    info = -1,
+                                    status_field="Mode"))
+        self.online_cfg.updateUI(0)
+
+    def _get_markers(self, start, end, offset):
+        ''' Get the markers of a file section
+        @param start: first sample index
+        @param end: sample index after the section
+        @param offset: sample counter of file sample index 0
+        @return: list of EEG_Marker objects, positions are sample counter values
+        '''
+        first, last = np.searchsorted(self.marker_positions, [start, end])
+        markers = []
+        for marker in self.markers[first:last]:
+            m = copy.copy(marker)
+            m.position = int(offset + marker.position - 1)
+            markers.append(m)
+        return markers
+
+    def process_output(self):
+        ''' Read the next block from the file
+        '''
+        if not self.running or self.finished:
+            return None
+        counter = self.data.sample_counter
+        if self.realtime and time.perf_counter() < self.first_time + counter / self.data.sample_rate:
+            return None
+
+        total = self.samples.shape[0]
+        if self.position >= total:
+            if not self.loop or total == 0:
+                self.finished = True
+                self.send_event(ModuleEvent(self._object_name, EventType.LOGMESSAGE,
+                                            "Replay of %s finished"%(os.path.split(self.file_name)[1])))
+                return None
+            self.position = 0
+            self.loops += 1
+
+        start = self.position
+        end = min(start + self.block_samples, total)
+        n = end - start
+        self.position = end
+
+        # scale the memory mapped samples into a pooled block
+        eeg = pool.empty((self.samples.shape[1], n), sample_type())
+        np.multiply(self.samples[start:end].T, self.resolution, out=eeg, casting="unsafe")
+        trigger = pool.empty((1, n), np.uint32)
+        trigger.fill(0)
+        # the sample counter starts at 1, like the amplifier counter it is never 0
+        sct = pool.empty((1, n), np.uint64)
+        np.add(self._counter[:n], np.uint64(counter + 1), out=sct[0])
+
+        self.data.eeg_channels = eeg
+        self.data.trigger_channel = trigger
+        self.data.sample_channel = sct
+        self.data.markers = self._get_markers(start, end, counter + 1 - start)
+        self.data.acquisition_time = time.perf_counter()
+        self.data.sample_counter += n
+        self.data.block_time = self.start_time + datetime.timedelta(seconds=counter / self.data.sample_rate)
+        return copy.copy(self.data)
+
+    def process_idle(self):
+        ''' Wait until the next block is due
+        '''
+        if self.finished:
+            self.wait_for_wakeup(0.1)
+            return
+        if not self.realtime:
+            return
+        delay = self.first_time + self.data.sample_counter / self.data.sample_rate - time.perf_counter()
+        if delay > 0:
+            self.wait_for_wakeup(delay)
+
+    def getXML(self):
+        ''' Get module properties for XML configuration file
+        @return: objectify XML element::
+            <REP_Vision instance="0" version="1" module="replay">
+                <filename>...</filename>
+                <realtime>True</realtime>
+                <loop>False</loop>
+            </REP_Vision>
+        '''
+        E = objectify.E
+        cfg = E.REP_Vision(E.filename(self.file_name),
+                           E.realtime(self.realtime),
+                           E.loop(self.loop),
+                           version=str(self.xmlVersion),
+                           instance=str(self._instance),
+                           module="replay")
+        return cfg
+
+    def setXML(self, xml):
+        ''' Set module properties from XML configuration file
+        @param xml: complete objectify XML configuration tree,
+        module will search for matching values
+        '''
+        configs = xml.xpath("//REP_Vision[@module='replay' and @instance='%i']"%(self._instance) )
+        if len(configs) == 0:
+            return      # configuration data not found, leave everything unchanged
+        cfg = configs[0]
+
+        # check version, has to be lower or equal than current version
+        version = cfg.get("version")
+        if (version == None) or (int(version) > self.xmlVersion):
+            self.send_event(ModuleEvent(self._object_name, EventType.ERROR, "XML Configuration: wrong version"))
+            return
+
+        try:
+            self.realtime = cfg.realtime.pyval
+            self.loop = cfg.loop.pyval
+            self.online_cfg.checkBoxRealtime.setChecked(self.realtime)
+            self.online_cfg.checkBoxLoop.setChecked(self.loop)
+            file_name = str(cfg.filename.text or "")
+            if file_name:
+                self.open_file(file_name)
+        except Exception as e:
+            self.send_exception(e, severity=ErrorSeverity.NOTIFY)
+
+
+'''
+------------------------------------------------------------
+REPLAY MODULE ONLINE GUI
+------------------------------------------------------------
+'''
+
+class _OnlineCfgPane(Qt.QFrame):
+    ''' Replay online configuration pane
+    '''
+    def __init__(self, module, *args):
+        Qt.QFrame.__init__(self, *args)
+        self.module = module
+
+        self.labelFile = Qt.QLabel("no data set")
+        self.pushButtonOpen = Qt.QPushButton("Open...")
+        self.checkBoxRealtime = Qt.QCheckBox("Real time")
+        self.checkBoxRealtime.setChecked(module.realtime)
+        self.checkBoxLoop = Qt.QCheckBox("Loop")
+        self.checkBoxLoop.setChecked(module.loop)
+        self.pushButtonStart = Qt.QPushButton("Start")
+        self.pushButtonStart.setCheckable(True)
+
+        self.gridLayout = Qt.QGridLayout(self)
+        self.gridLayout.addWidget(self.labelFile, 0, 0, 1, 2)
+        self.gridLayout.addWidget(self.pushButtonOpen, 1, 0)
+        self.gridLayout.addWidget(self.pushButtonStart, 1, 1)
+        self.gridLayout.addWidget(self.checkBoxRealtime, 2, 0)
+        self.gridLayout.addWidget(self.checkBoxLoop, 2, 1)
+
+        # actions
+        self.connect(self.pushButtonOpen, Qt.SIGNAL("clicked()"), self._open)
+        self.connect(self.pushButtonStart, Qt.SIGNAL("clicked(bool)"), self._button_toggle)
+
+    def _open(self):
+        ''' Select a BrainVision header file
+        '''
+        dlg = Qt.QFileDialog()
+        dlg.setFileMode(Qt.QFileDialog.ExistingFile)
+        dlg.setAcceptMode(Qt.QFileDialog.AcceptOpen)
+        dlg.setNameFilter("BrainVision header (*.vhdr)")
+        if dlg.exec_() == True:
+            file_name = str(dlg.selectedFiles()[0])
+            try:
+                self.module.open_file(file_name)
+                self.module.update_receivers()
+            except Exception as e:
+                Qt.QMessageBox.critical(None, "Replay", "failed to open %s\n%s"%(file_name, str(e)))
+
+    def _button_toggle(self, checked):
+        self.emit(Qt.SIGNAL('modeChanged(int)'), 1 if checked else 0)
+
+    def set_filename(self, file_name, duration):
+        ''' Show the current data set
+        @param file_name: header file name
+        @param duration: recording duration in seconds
+        '''
+        self.labelFile.setText("%s (%.1fs)"%(os.path.split(file_name)[1], duration))
+
+    def updateUI(self, mode):
+        ''' Update user interface
+        @param mode: 1 = running, 0 = stopped
+        '''
+        self.pushButtonStart.setChecked(mode == 1)
+        self.pushButtonStart.setText("Stop" if mode == 1 else "Start")
+        self.pushButtonOpen.setEnabled(mode != 1)
+        self.checkBoxRealtime.setEnabled(mode != 1)
+        self.checkBoxLoop.setEnabled(mode != 1)
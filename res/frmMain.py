@@ -78,6 +78,8 @@ class Ui_MainWindow(object):
         self.actionQuit.setObjectName("actionQuit")
         self.actionShow_Log = QtGui.QAction(MainWindow)
         self.actionShow_Log.setObjectName("actionShow_Log")
+        self.actionShow_Metrics = QtGui.QAction(MainWindow)
+        self.actionShow_Metrics.setObjectName("actionShow_Metrics")
         self.actionLoad_Configuration = QtGui.QAction(MainWindow)
         self.actionLoad_Configuration.setObjectName("actionLoad_Configuration")
         self.actionSave_Configuration = QtGui.QAction(MainWindow)
@@ -89,6 +91,7 @@ class Ui_MainWindow(object):
         self.menuApplication.addAction(self.actionDefault_Configuration)
         self.menuApplication.addSeparator()
         self.menuApplication.addAction(self.actionShow_Log)
+        self.menuApplication.addAction(self.actionShow_Metrics)
         self.menuApplication.addSeparator()
         self.menuApplication.addAction(self.actionQuit)
         self.menubar.addAction(self.menuApplication.menuAction())
@@ -102,6 +105,7 @@ class Ui_MainWindow(object):
         self.menuApplication.setTitle(QtGui.QApplication.translate("MainWindow", "File", None, QtGui.QApplication.UnicodeUTF8))
         self.actionQuit.setText(QtGui.QApplication.translate("MainWindow", "Quit", None, QtGui.QApplication.UnicodeUTF8))
         self.actionShow_Log.setText(QtGui.QApplication.translate("MainWindow", "Show Log", None, QtGui.QApplication.UnicodeUTF8))
+        self.actionShow_Metrics.setText(QtGui.QApplication.translate("MainWindow", "Show Metrics", None, QtGui.QApplication.UnicodeUTF8))
         self.actionLoad_Configuration.setText(QtGui.QApplication.translate("MainWindow", "Load Configuration ...", None, QtGui.QApplication.UnicodeUTF8))
         self.actionSave_Configuration.setText(QtGui.QApplication.translate("MainWindow", "Save Configuration ...", None, QtGui.QApplication.UnicodeUTF8))
         self.actionDefault_Configuration.setText(QtGui.QApplication.translate("MainWindow", "Reset Configuration", None, QtGui.QApplication.UnicodeUTF8))
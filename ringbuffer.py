@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+'''
+Shared Memory Sample Ring Buffer
+
+PyCorder ActiChamp Recorder
+
+------------------------------------------------------------
+
+Copyright (C) 2010, Brain Products GmbH, Gilching
+
+This file is part of PyCorder
+
+PyCorder is free software: you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 3
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCorder. If not, see <http://www.gnu.org/licenses/>.
+
+------------------------------------------------------------
+
+Preallocated single producer / multiple consumer ring buffer for channel data,
+trigger and sample counter lanes. The buffer lives in a named shared memory block,
+so it can be attached from other processes by name.
+
+Cursors are absolute sample numbers, the ring position is cursor % capacity.
+Each consumer owns its read cursor and overrun counters, the producer owns the
+write cursor. The producer never waits for consumers, lagging consumers are
+detected on read and the lost samples are accounted per consumer.
+'''
+
+import numpy as np
+from multiprocessing import shared_memory
+
+
+class RingOverrun(Exception):
+    ''' Samples requested from the ring buffer are already overwritten
+    '''
+    def __init__(self, lost):
+        ''' Create the exception object
+        @param lost: number of lost samples
+        '''
+        self.lost = lost
+    def __str__(self):
+        return "ring buffer overrun, %d samples lost"%(self.lost)
+
+
+class RingSpan(object):
+    ''' Location of a data block within a SampleRingBuffer
+    '''
+    def __init__(self, ring, consumer, start, count):
+        ''' Create a span object
+        @param ring: SampleRingBuffer object
+        @param consumer: consumer id for this span
+        @param start: absolute sample number of the first sample
+        @param count: number of samples
+        '''
+        self.ring = ring            #: ring buffer object
+        self.consumer = consumer    #: consumer id
+        self.start = start          #: absolute sample number of the first sample
+        self.count = count          #: number of samples
+
+
+class SampleRingBuffer(object):
+    ''' Shared memory ring buffer for channels x samples, trigger and sample counter lanes
+    '''
+    # header layout (int64 values)
+    (H_WRITE, H_CAPACITY, H_CHANNELS, H_MAXCONSUMERS, H_CONSUMERS, H_DTYPE, H_PENDING) = range(7)
+    HEADER_SIZE = 8                 #: number of fixed header values
+    DTYPES = [np.float64, np.float32]   #: supported channel data types (header code = index)
+
+    _pending_close = []             #: shared memory objects with exported views, close later
+
+    def __init__(self, channels=0, capacity=0, dtype=np.float64, maxconsumers=8, name=None):
+        ''' Create a new ring buffer or attach to an existing one
+        @param channels: number of channels
+        @param capacity: ring size in samples
+        @param dtype: channel data type (float64 or float32)
+        @param maxconsumers: maximum number of consumers
+        @param name: shared memory name of an existing ring buffer to attach to,
+        None to create a new one
+        '''
+        SampleRingBuffer._close_pending()
+        self.owner = name == None   #: this object created (and will unlink) the shared memory
+        if self.owner:
+            dtype_code = [np.dtype(d) for d in self.DTYPES].index(np.dtype(dtype))
+            header_bytes = (self.HEADER_SIZE + 3 * maxconsumers) * 8
+            size = header_bytes + self._lane_sizes(channels, capacity, np.dtype(dtype))
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._header = np.ndarray((self.HEADER_SIZE + 3 * maxconsumers,), np.int64, self._shm.buf)
+            self._header[:] = 0
+            self._header[self.H_CAPACITY] = capacity
+            self._header[self.H_CHANNELS] = channels
+            self._header[self.H_MAXCONSUMERS] = maxconsumers
+            self._header[self.H_DTYPE] = dtype_code
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            fixed = np.ndarray((self.HEADER_SIZE,), np.int64, self._shm.buf)
+            maxconsumers = int(fixed[self.H_MAXCONSUMERS])
+            self._header = np.ndarray((self.HEADER_SIZE + 3 * maxconsumers,), np.int64, self._shm.buf)
+            del fixed
+
+        self.name = self._shm.name                              #: shared memory name
+        self.capacity = int(self._header[self.H_CAPACITY])      #: ring size in samples
+        self.channels = int(self._header[self.H_CHANNELS])      #: number of channels
+        self.maxconsumers = int(self._header[self.H_MAXCONSUMERS])
+        self.dtype = np.dtype(self.DTYPES[self._header[self.H_DTYPE]])
+
+        # per consumer header fields
+        m = self.HEADER_SIZE
+        self._cursors = self._header[m : m + self.maxconsumers]
+        self._lost_samples = self._header[m + self.maxconsumers : m + 2*self.maxconsumers]
+        self._lost_blocks = self._header[m + 2*self.maxconsumers : m + 3*self.maxconsumers]
+
+        # sample lanes
+        offset = self._header.nbytes
+        self._data = np.ndarray((self.channels, self.capacity), self.dtype, self._shm.buf, offset)
+        offset += self._align(self._data.nbytes)
+        self._trigger = np.ndarray((1, self.capacity), np.uint32, self._shm.buf, offset)
+        offset += self._align(self._trigger.nbytes)
+        self._counter = np.ndarray((1, self.capacity), np.uint64, self._shm.buf, offset)
+
+    def _align(nbytes):
+        return (nbytes + 7) & ~7
+    _align = staticmethod(_align)
+
+    def _lane_sizes(cls, channels, capacity, dtype):
+        return cls._align(channels * capacity * dtype.itemsize) + \
+               cls._align(capacity * 4) + capacity * 8
+    _lane_sizes = classmethod(_lane_sizes)
+
+    def add_consumer(self):
+        ''' Register a new consumer, reading starts at the current write position
+        @return: consumer id
+        '''
+        consumer = int(self._header[self.H_CONSUMERS])
+        if consumer >= self.maxconsumers:
+            raise Exception("ring buffer %s: too many consumers (max %d)"%(self.name, self.maxconsumers))
+        self._cursors[consumer] = self._header[self.H_WRITE]
+        self._lost_samples[consumer] = 0
+        self._lost_blocks[consumer] = 0
+        self._header[self.H_CONSUMERS] = consumer + 1
+        return consumer
+
+    def consumers(self):
+        ''' Get the number of registered consumers
+        '''
+        return int(self._header[self.H_CONSUMERS])
+
+    def fits(self, eeg):
+        ''' Check if a channel data array can be transported by this ring buffer
+        @param eeg: channel data array (channels x samples)
+        '''
+        return eeg.ndim == 2 and eeg.shape[0] == self.channels and \
+               eeg.dtype == self.dtype and eeg.shape[1] <= self.capacity // 2
+
+    def write(self, eeg, trigger, counter):
+        ''' Append samples to the ring buffer (producer only)
+        @param eeg: channel data array (channels x samples)
+        @param trigger: trigger array (1 x samples)
+        @param counter: sample counter array (1 x samples)
+        @return: absolute sample number of the first written sample
+        '''
+        start = int(self._header[self.H_WRITE])
+        count = eeg.shape[1]
+        # announce the overwritten span before writing, see read()
+        self._header[self.H_PENDING] = start + count
+        pos = start % self.capacity
+        first = min(count, self.capacity - pos)
+        self._data[:, pos:pos+first] = eeg[:, :first]
+        self._trigger[:, pos:pos+first] = trigger[:, :first]
+        self._counter[:, pos:pos+first] = counter[:, :first]
+        if first < count:
+            rest = count - first
+            self._data[:, :rest] = eeg[:, first:]
+            self._trigger[:, :rest] = trigger[:, first:]
+            self._counter[:, :rest] = counter[:, first:]
+        # publish the samples after they are written
+        self._header[self.H_WRITE] = start + count
+        return start
+
+    def read(self, consumer, start, count, copy=False):
+        ''' Get samples from the ring buffer. Returns views into the shared memory if the
+        span is contiguous, copies if it wraps around the end of the ring.
+        Views are only valid until the producer laps the ring, see valid().
+        @param consumer: consumer id
+        @param start: absolute sample number of the first sample
+        @param count: number of samples
+        @param copy: always return private copies, the span is checked again after
+        copying because the producer may overwrite it in the meantime
+        @return: tuple(channel data, trigger, sample counter)
+        @raise RingOverrun: if the requested samples are already overwritten
+        '''
+        self.check(consumer, start)
+        pos = start % self.capacity
+        if pos + count <= self.capacity:
+            lanes = (self._data[:, pos:pos+count],
+                     self._trigger[:, pos:pos+count],
+                     self._counter[:, pos:pos+count])
+            if not copy:
+                return lanes
+            lanes = tuple(lane.copy() for lane in lanes)
+        else:
+            first = self.capacity - pos
+            rest = count - first
+            lanes = (np.concatenate((self._data[:, pos:], self._data[:, :rest]), 1),
+                     np.concatenate((self._trigger[:, pos:], self._trigger[:, :rest]), 1),
+                     np.concatenate((self._counter[:, pos:], self._counter[:, :rest]), 1))
+        # the copied span must not be overwritten by the block the producer is writing
+        if int(self._header[self.H_PENDING]) - start > self.capacity:
+            self._lost_samples[consumer] += count
+            self._lost_blocks[consumer] += 1
+            raise RingOverrun(count)
+        return lanes
+
+    def valid(self, start):
+        ''' Check if the samples from start on are not yet overwritten by the producer
+        @param start: absolute sample number
+        '''
+        return int(self._header[self.H_WRITE]) - start <= self.capacity
+
+    def check(self, consumer, start):
+        ''' Account overwritten samples for a consumer
+        @param consumer: consumer id
+        @param start: absolute sample number the consumer wants to read from
+        @raise RingOverrun: if the requested samples are already overwritten
+        '''
+        lost = int(self._header[self.H_WRITE]) - self.capacity - start
+        if lost > 0:
+            self._lost_samples[consumer] += lost
+            self._lost_blocks[consumer] += 1
+            raise RingOverrun(lost)
+
+    def release(self, consumer, cursor):
+        ''' Mark all samples up to cursor as consumed
+        @param consumer: consumer id
+        @param cursor: absolute sample number following the last consumed sample
+        '''
+        self._cursors[consumer] = max(self._cursors[consumer], cursor)
+
+    def fill(self, consumer):
+        ''' Get the number of written but not yet consumed samples
+        @param consumer: consumer id
+        '''
+        return int(self._header[self.H_WRITE] - self._cursors[consumer])
+
+    def overruns(self, consumer):
+        ''' Get the overrun accounting of a consumer
+        @param consumer: consumer id
+        @return: tuple(lost samples, lost blocks)
+        '''
+        return (int(self._lost_samples[consumer]), int(self._lost_blocks[consumer]))
+
+    def close(self):
+        ''' Detach from the shared memory, the owner also removes it.
+        Views returned by read() stay valid until they are released.
+        '''
+        if self._shm == None:
+            return
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+        # views of the shared memory may still be in use by other modules
+        del self._header, self._cursors, self._lost_samples, self._lost_blocks
+        del self._data, self._trigger, self._counter
+        SampleRingBuffer._pending_close.append(self._shm)
+        self._shm = None
+        SampleRingBuffer._close_pending()
+
+    def _close_pending(cls):
+        ''' Close shared memory objects whose views are released
+        '''
+        pending = []
+        for shm in cls._pending_close:
+            try:
+                shm.close()
+            except BufferError:
+                pending.append(shm)
+        cls._pending_close[:] = pending
+    _close_pending = classmethod(_close_pending)
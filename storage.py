@@ -35,9 +35,15 @@ import ctypes as ct
 import os
 import platform
 from modbase import *
+from bufpool import pool
+from profiler import profiler
 from res import frmStorageVisionOnline
 from res import frmStorageVisionConfig
 
+# acquisition to file latency deadline in seconds (see ModuleBase.report_latency()),
+# None = no deadline
+STORAGE_DEADLINE = 1.0
+
 '''
 ------------------------------------------------------------
 STORAGE MODULE
@@ -52,6 +58,9 @@ class StorageVision(ModuleBase):
     def __init__(self, *args, **keys):
         ''' Constructor
         '''
+        # recording must be lossless, let the producer wait for a full input queue
+        keys.setdefault("backpressure", Backpressure.BLOCK)
+        keys.setdefault("deadline", STORAGE_DEADLINE)
         ModuleBase.__init__(self, queuesize=50, name="StorageVision", **keys)
         
         # XML parameter version
@@ -261,7 +270,7 @@ class StorageVision(ModuleBase):
         eegdir.setNameFilters(Qt.QStringList(u"%s_*.eeg"%(fn)))
         numberedfiles = eegdir.entryList()
     
-        if allfiles.count() == 0:
+        if len(allfiles) == 0:
             return os.path.join(pn, filename + ".eeg")
         
         # extract numbers
@@ -369,7 +378,7 @@ class StorageVision(ModuleBase):
 
             # create EEG header file
             try:
-                self.header_file = open(headername, "w")
+                self.header_file = open(headername, "wb")
                 h =  u"Brain Vision Data Exchange Header File Version 1.0" + crlf
                 h += u"; Data created by the actiCHamp PyCorder" + crlf + crlf
 
@@ -465,7 +474,7 @@ class StorageVision(ModuleBase):
 
             # create EEG marker file
             try:
-                self.marker_file = open(markername, "w")
+                self.marker_file = open(markername, "wb")
                 h =  u"Brain Vision Data Exchange Marker File, Version 1.0" + crlf
                 h += crlf
                 # common infos.
@@ -504,6 +513,9 @@ class StorageVision(ModuleBase):
             
             # show recording state
             self.online_cfg.set_recording_state(True) 
+
+            # module profiles are written next to the recording
+            profiler.set_recording_file(self.file_name)
             
             # send status to application
             self.send_event(ModuleEvent(self._object_name,
@@ -748,20 +760,22 @@ class StorageVision(ModuleBase):
         if (self.data_file is not None) and not self.write_error:
             try:
                 t = time.perf_counter()
-                # convert data to float and write to data file
+                # convert data to float, multiplexed sample order, and write to data file
                 d = datablock.eeg_channels.transpose()
-                f = d.flatten().astype(np.float32)
-                sizeof_item = f.dtype.itemsize # item size in bytes
-                # Python I/O: write bytes directly
-                nbytes_written = self.data_file.write(f.tobytes())
-                if nbytes_written != sizeof_item * len(f):
+                f = pool.empty(d.shape, np.float32)
+                np.copyto(f, d, casting="same_kind")
+                # Python I/O: write the array buffer directly
+                nbytes_written = self.data_file.write(f)
+                if nbytes_written != f.nbytes:
                     raise ModuleError(self._object_name, "Write to file %s failed"%(self.file_name))
-                # write marker
+                # write marker, marker positions will be modified
+                self.data.make_writable(BlockPart.MARKERS)
                 #self._write_marker(self.data.markers, self.data.block_time, self.data.sample_channel[0,0])
                 self.data.markers = self._write_marker(self.data.markers, self.data.block_time, self.data.sample_channel[0,0], sctBreakDiff)
                 
                 # update file sample counter
                 self.samples_written += samples
+                self.report_latency(datablock.acquisition_time)
                 
                 writetime = time.perf_counter() - t
                 #print "Write file: %.0f ms / %d Bytes / QSize %d"%(writetime*1000.0, nitems, self._input_queue.qsize()) 
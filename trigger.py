@@ -42,6 +42,8 @@ class TRG_Eeg(ModuleBase):
     def __init__(self, *args, **keys):
         ''' Constructor
         '''
+        # lightweight module, runs in the worker thread of the parent module
+        keys.setdefault("inline", True)
         ModuleBase.__init__(self, name="EEG Trigger", **keys)
         self.data = None
         self.dataavailable = False
@@ -71,6 +73,9 @@ class TRG_Eeg(ModuleBase):
         if self.data.recording_mode == RecordingMode.IMPEDANCE:
             return
 
+        # new markers will be appended to the marker list
+        self.data.make_writable(BlockPart.MARKERS)
+
         # search for trigger input events (Bit 0-3) 
         self.searchTrigger(0)
         # search for trigger input events (Bit 4-7) 
@@ -99,7 +104,7 @@ class TRG_Eeg(ModuleBase):
             trigger = np.bitwise_and(self.data.trigger_channel[0], 0xFF00) # mask trigger output channels
         lastevent = self.lastevent[in_out]
 
-        diff = np.diff(np.r_[-1, trigger])              # get changes
+        diff = np.diff(trigger, prepend=-1)             # get changes
         idx = np.nonzero(diff)[0]                       # indices of changes  
         count = np.diff(np.r_[idx, len(trigger)])       # number of trigger values for each change
         values = trigger[idx]                           # trigger values
@@ -149,7 +154,7 @@ class TRG_Eeg(ModuleBase):
         # mask button input bit
         button = np.bitwise_and(self.data.trigger_channel[0], 0x80000000) 
         # search changes
-        diff = np.diff(np.r_[-1, button])               # get changes
+        diff = np.diff(button, prepend=-1)              # get changes
         idx = np.nonzero(diff)[0]                       # indices of changes  
         count = np.diff(np.r_[idx, len(button)])        # number of values for each change
         if self.lastbutton[0] == button[0]:             # add count from last data block
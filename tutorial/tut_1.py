@@ -137,6 +137,8 @@ class TUT_1(ModuleBase):
         # Data modification: subtract ch2 from ch1 and put the result into ch1
         # for subtraction we need at least two channels
         if len(self.data.channel_properties) >= 2:
+            # the block may be shared with other receivers, copy it before modification
+            self.data.make_writable(BlockPart.DATA | BlockPart.PROPERTIES)
             # subtract ch2 from ch1
             self.data.eeg_channels[0] -= self.data.eeg_channels[1]
             # replace channel configuration within the data block with our modified configuration
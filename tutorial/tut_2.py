@@ -90,6 +90,9 @@ class TUT_2(ModuleBase):
         self.dataavailable = True       # signal data availability
         self.data = datablock           # get a local reference
         
+        # the block may be shared with other receivers, copy it before modification
+        self.data.make_writable(BlockPart.DATA | BlockPart.MARKERS)
+        
         # multiply selected channels by 2
         self.data.eeg_channels[self.mask_index] *= 2.0
         